@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+批量转换检查点日志
+只追加、每条记录都fsync的JSONL日志，记录每个文件的状态变化（started/done/failed），
+配合“先写临时文件再改名”的输出方式，使中断的批量任务可以精确续传
+"""
+
+import os
+import json
+import time
+from pathlib import Path
+
+
+def partial_path(out_file):
+    """输出文件对应的临时文件名（同目录，保证改名是原子的）"""
+    out_file = Path(out_file)
+    return out_file.with_name(f".{out_file.stem}.partial{out_file.suffix}")
+
+
+def fsync_dir(directory):
+    """刷新目录项，保证改名在断电后仍然生效（Windows不支持，跳过）"""
+    if os.name == 'nt':
+        return
+    fd = os.open(str(directory), os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def atomic_replace(tmp_file, out_file):
+    """把写完的临时文件落盘后原子替换为最终输出"""
+    tmp_file, out_file = Path(tmp_file), Path(out_file)
+    with open(tmp_file, 'rb+') as f:
+        os.fsync(f.fileno())
+    os.replace(tmp_file, out_file)
+    fsync_dir(out_file.parent)
+
+
+def open_journal(journal_file, resume=False, **batch_info):
+    """打开日志；非续传时清空旧日志并写入批次头"""
+    journal_file = Path(journal_file)
+    fh = open(journal_file, 'a' if resume else 'w', encoding='utf-8')
+    event = 'resume' if resume else 'batch'
+    journal_append(fh, {'event': event, **batch_info})
+    return fh
+
+
+def journal_append(fh, record):
+    """追加一条记录并立即fsync"""
+    record = dict(record)
+    record.setdefault('ts', round(time.time(), 3))
+    fh.write(json.dumps(record, ensure_ascii=False) + '\n')
+    fh.flush()
+    os.fsync(fh.fileno())
+
+
+def load_journal(journal_file):
+    """读取日志，返回 {文件名: 最后一条状态记录}；忽略断电造成的残缺行"""
+    states = {}
+    try:
+        with open(journal_file, encoding='utf-8') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                if 'file' in record:
+                    states[record['file']] = record
+    except FileNotFoundError:
+        pass
+    return states
+
+
+def completed_files(journal_file, directory):
+    """日志中已完成、且输出文件仍与记录一致的文件名集合"""
+    done = set()
+    for name, record in load_journal(journal_file).items():
+        if record.get('state') != 'done':
+            continue
+        out_file = Path(directory) / record['output']
+        try:
+            if out_file.stat().st_size == record['size']:
+                done.add(name)
+        except FileNotFoundError:
+            pass
+    return done
@@ -0,0 +1,310 @@
+#!/usr/bin/env python3
+"""
+EPS 压缩包直接转换
+逐个流式读取 zip/tar 中的EPS成员，通过stdin（输入文件 "-"）交给Ghostscript，
+输出直接写入目标压缩包或目录，不解压到磁盘；内存占用与压缩包大小无关
+
+用法:
+    python eps_archive.py figures.tar.gz out.zip
+    python eps_archive.py figures.zip out_dir/ --format svg
+    cat figures.tar | python eps_archive.py - out.tar
+"""
+
+import os
+import sys
+import time
+import struct
+import shutil
+import tarfile
+import zipfile
+import argparse
+import itertools
+import tempfile
+import subprocess
+from pathlib import Path, PurePosixPath
+
+from eps_core import find_ghostscript
+from eps_to_high_quality_png import build_png_command
+from eps_to_svg_ghostscript import build_svg_command
+from batch_journal import partial_path, atomic_replace
+from tool_sandbox import run_streaming, estimate_limits, parse_bbox_inches, reap_orphans
+
+CHUNK_SIZE = 1024 * 1024           # 读写块大小
+SPOOL_LIMIT = 32 * 1024 * 1024     # 写入压缩包前在内存中缓冲的上限，超过后落到临时文件
+DOS_EPS_MAGIC = b'\xC5\xD0\xD3\xC6'
+TAR_SUFFIXES = ('.tar', '.tar.gz', '.tgz', '.tar.bz2', '.tbz2', '.tar.xz', '.txz')
+OUTPUT_SUFFIXES = {'png': '.png', 'svg': '.svg'}
+TIMEOUTS = {'png': 180, 'svg': 120}
+
+
+def is_eps_name(name):
+    return name.lower().endswith('.eps')
+
+
+# ---------------------------------------------------------------- 输入
+
+def iter_eps_members(source):
+    """逐个产出 (成员名, 可读文件对象, 大小)
+
+    source 可以是 zip、tar（含 gz/bz2/xz）、目录，或 "-" 表示从stdin读取tar流。
+    tar 以流模式读取，只能按顺序访问，每个成员须在取下一个之前读完
+    """
+    if str(source) == '-':
+        with tarfile.open(fileobj=sys.stdin.buffer, mode='r|*') as tf:
+            yield from _iter_tar(tf)
+        return
+
+    source = Path(source)
+    if source.is_dir():
+        for eps_file in sorted(p for p in source.rglob('*') if is_eps_name(p.name)):
+            with open(eps_file, 'rb') as f:
+                yield eps_file.relative_to(source).as_posix(), f, eps_file.stat().st_size
+    elif zipfile.is_zipfile(source):
+        with zipfile.ZipFile(source) as zf:
+            for info in zf.infolist():
+                if info.is_dir() or not is_eps_name(info.filename):
+                    continue
+                with zf.open(info) as f:
+                    yield info.filename, f, info.file_size
+    else:
+        with tarfile.open(source, mode='r|*') as tf:
+            yield from _iter_tar(tf)
+
+
+def _iter_tar(tf):
+    for member in tf:
+        if member.isfile() and is_eps_name(member.name):
+            yield member.name, tf.extractfile(member), member.size
+
+
+def postscript_chunks(f, chunk_size=CHUNK_SIZE):
+    """逐块读取EPS内容；DOS-EPS（带预览图的二进制头）只输出其中的PostScript段
+
+    Ghostscript 从stdin读取时无法回退查找，所以二进制头在这里顺序跳过
+    """
+    data = f.read(chunk_size)
+    if data[:4] != DOS_EPS_MAGIC or len(data) < 12:
+        while data:
+            yield data
+            data = f.read(chunk_size)
+        return
+
+    offset, remaining = struct.unpack_from('<II', data, 4)
+    pos = 0
+    while data and remaining > 0:
+        start = max(offset - pos, 0)
+        piece = data[start:start + remaining]
+        pos += len(data)
+        if piece:
+            remaining -= len(piece)
+            yield piece
+        if remaining > 0:
+            data = f.read(chunk_size)
+
+
+# ---------------------------------------------------------------- 输出
+
+def safe_output_name(member_name, suffix):
+    """成员名换成输出扩展名；去掉绝对路径和 ".."，防止写出目标目录"""
+    parts = [p for p in PurePosixPath(member_name.replace('\\', '/')).parts
+             if p not in ('', '/', '.', '..')]
+    return str(PurePosixPath(*parts).with_suffix(suffix))
+
+
+def open_output(dest):
+    """按目标扩展名打开输出：.zip / .tar* 写入压缩包（先写临时名，完成后原子替换），其他视为目录"""
+    dest = Path(dest)
+    name = dest.name.lower()
+    if name.endswith('.zip'):
+        tmp = partial_path(dest)
+        return {'kind': 'zip', 'dest': dest, 'tmp': tmp,
+                'archive': zipfile.ZipFile(tmp, 'w', allowZip64=True)}
+    if name.endswith(TAR_SUFFIXES):
+        tmp = partial_path(dest)
+        compression = {'gz': 'gz', 'tgz': 'gz', 'bz2': 'bz2', 'tbz2': 'bz2',
+                       'xz': 'xz', 'txz': 'xz'}.get(name.rsplit('.', 1)[-1], '')
+        # 流模式下 tarfile 不接受 Path 作为文件名，自己打开文件传 fileobj
+        fileobj = open(tmp, 'wb')
+        try:
+            archive = tarfile.open(fileobj=fileobj, mode=f'w|{compression}')
+        except BaseException:
+            fileobj.close()
+            tmp.unlink()
+            raise
+        return {'kind': 'tar', 'dest': dest, 'tmp': tmp, 'file': fileobj, 'archive': archive}
+    dest.mkdir(parents=True, exist_ok=True)
+    return {'kind': 'dir', 'dest': dest}
+
+
+def open_entry(out, name):
+    """返回写入单个输出的文件对象：目录直接写临时文件，压缩包先缓冲（超限落盘）"""
+    if out['kind'] == 'dir':
+        target = out['dest'] / name
+        target.parent.mkdir(parents=True, exist_ok=True)
+        return open(partial_path(target), 'wb')
+    return tempfile.SpooledTemporaryFile(max_size=SPOOL_LIMIT, dir=out['dest'].parent)
+
+
+def commit_entry(out, name, fh):
+    """把写完的输出加入目标"""
+    if out['kind'] == 'dir':
+        fh.close()
+        target = out['dest'] / name
+        atomic_replace(partial_path(target), target)
+        return
+
+    size = fh.tell()
+    fh.seek(0)
+    if out['kind'] == 'zip':
+        info = zipfile.ZipInfo(name, date_time=time.localtime()[:6])
+        # PNG 本身已压缩，再deflate只浪费CPU
+        info.compress_type = zipfile.ZIP_STORED if name.endswith('.png') else zipfile.ZIP_DEFLATED
+        with out['archive'].open(info, 'w', force_zip64=size > 0x7FFFFFFF) as w:
+            shutil.copyfileobj(fh, w, CHUNK_SIZE)
+    else:
+        info = tarfile.TarInfo(name)
+        info.size = size
+        info.mtime = int(time.time())
+        out['archive'].addfile(info, fh)
+    fh.close()
+
+
+def discard_entry(out, name, fh):
+    fh.close()
+    if out['kind'] == 'dir':
+        try:
+            partial_path(out['dest'] / name).unlink()
+        except FileNotFoundError:
+            pass
+
+
+def close_output(out, keep=True):
+    """完成输出；压缩包在全部写完后才替换为最终文件名"""
+    if out['kind'] == 'dir':
+        return
+    try:
+        out['archive'].close()
+    finally:
+        if 'file' in out:
+            out['file'].close()  # tarfile 不关闭传入的 fileobj
+    if keep:
+        atomic_replace(out['tmp'], out['dest'])
+    else:
+        out['tmp'].unlink()
+
+
+# ---------------------------------------------------------------- 转换
+
+def build_stream_command(gs_path, fmt, dpi, scale_factor):
+    """从stdin读EPS、向stdout写结果的Ghostscript命令"""
+    if fmt == 'png':
+        cmd = build_png_command('-', '-', gs_path, dpi)
+    else:
+        cmd = build_svg_command('-', '-', gs_path, scale_factor)
+    cmd.insert(1, '-q')  # stdout 是输出数据，不能混入提示信息
+    return cmd
+
+
+def convert_member(name, fileobj, size, out, gs_path, fmt='png', dpi=450, scale_factor=3):
+    """转换一个压缩包成员并写入输出，返回 (是否成功, 说明)"""
+    out_name = safe_output_name(name, OUTPUT_SUFFIXES[fmt])
+    chunks = postscript_chunks(fileobj)
+    head = next(chunks, b'')
+    if not head:
+        return False, "空文件"
+
+    render_dpi = dpi if fmt == 'png' else None
+    limits = estimate_limits(size, render_dpi, parse_bbox_inches(head), timeout=TIMEOUTS[fmt])
+    cmd = build_stream_command(gs_path, fmt, dpi, scale_factor)
+
+    fh = open_entry(out, out_name)
+    try:
+        result = run_streaming(cmd, itertools.chain([head], chunks), fh,
+                               timeout=TIMEOUTS[fmt], limits=limits)
+    except subprocess.TimeoutExpired:
+        discard_entry(out, out_name, fh)
+        return False, "转换超时"
+    except BaseException:
+        discard_entry(out, out_name, fh)
+        raise
+
+    if result.returncode != 0 or result.stdout == 0:
+        discard_entry(out, out_name, fh)
+        lines = [l.strip() for l in result.stderr.splitlines()
+                 if l.strip() and not l.startswith('GPL')]
+        error = next((l for l in lines if 'Error' in l), lines[-1] if lines else '')
+        return False, f"返回码 {result.returncode}: {error}" if result.returncode else "输出为空"
+
+    commit_entry(out, out_name, fh)
+    return True, f"{out_name} ({result.stdout / 1024:.1f} KB)"
+
+
+def convert_archive(source, dest, gs_path, fmt='png', dpi=450, scale_factor=3):
+    """转换压缩包/目录中的所有EPS，返回 (成功数, 失败数)"""
+    out = open_output(dest)
+    success_count = 0
+    fail_count = 0
+    completed = False
+    try:
+        for name, fileobj, size in iter_eps_members(source):
+            ok, message = convert_member(name, fileobj, size, out, gs_path, fmt, dpi, scale_factor)
+            if ok:
+                success_count += 1
+                print(f"✓ {name}: {message}")
+            else:
+                fail_count += 1
+                print(f"❌ {name}: {message}")
+        completed = True
+    finally:
+        # 中断时不留下半个压缩包
+        close_output(out, keep=completed)
+    return success_count, fail_count
+
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description="EPS 压缩包直接转换（不解压）")
+    parser.add_argument('source', help="输入 zip/tar(.gz/.bz2/.xz)/目录，'-' 表示从stdin读取tar")
+    parser.add_argument('dest', help="输出 .zip / .tar(.gz/.bz2/.xz) 或目录")
+    parser.add_argument('--format', choices=['png', 'svg'], default='png')
+    parser.add_argument('--dpi', type=int, default=450, help="PNG分辨率")
+    parser.add_argument('--scale', type=float, default=3, help="SVG缩放倍数")
+    args = parser.parse_args()
+
+    print("EPS 压缩包直接转换")
+    print("=" * 60)
+
+    if args.source != '-' and not Path(args.source).exists():
+        print(f"❌ 输入不存在: {args.source}")
+        return 1
+
+    reap_orphans()
+    gs_path, gs_version = find_ghostscript()
+    if not gs_path:
+        print("❌ 未找到 Ghostscript")
+        return 1
+    print(f"✓ Ghostscript: {gs_version}")
+    print(f"{args.source} -> {args.dest} ({args.format})")
+    print("-" * 60)
+
+    t0 = time.time()
+    try:
+        success_count, fail_count = convert_archive(
+            args.source, args.dest, gs_path, args.format, args.dpi, args.scale)
+    except (tarfile.TarError, zipfile.BadZipFile) as e:
+        print(f"❌ 无法读取压缩包: {e}")
+        return 1
+
+    print("\n" + "=" * 60)
+    print(f"转换完成! 用时 {time.time() - t0:.1f}s")
+    print(f"成功: {success_count} 个文件")
+    print(f"失败: {fail_count} 个文件")
+    return 0 if fail_count == 0 else 1
+
+
+if __name__ == "__main__":
+    try:
+        sys.exit(main())
+    except KeyboardInterrupt:
+        print("\n\n操作被用户中断，未写出不完整的输出")
+        sys.exit(130)
@@ -0,0 +1,235 @@
+#!/usr/bin/env python3
+"""
+EPS 异步批量转换引擎
+基于 asyncio.create_subprocess_exec，限制并发数，逐行解析Ghostscript/Inkscape的stderr，
+遇到致命错误提前终止；取消（Ctrl-C）时结束整个子进程组，不留残留进程
+"""
+
+import os
+import re
+import sys
+import signal
+import asyncio
+import argparse
+import subprocess
+from collections import deque
+from pathlib import Path
+
+from eps_core import find_ghostscript, get_eps_files
+from eps_to_high_quality_png import build_png_command
+from eps_to_svg_ghostscript import build_svg_command
+from output_layout import output_path, prepare_output, commit_output, discard_output
+from tool_sandbox import spawn_kwargs, after_spawn, unregister_group, predict_limits, reap_orphans
+
+# Ghostscript 的致命错误：出现后继续渲染已无意义
+FATAL_GS_PATTERNS = re.compile(
+    r'Error: /(undefined|undefinedfilename|undefinedresult|invalidfont|invalidfileaccess|'
+    r'limitcheck|VMerror|ioerror|syntaxerror|stackoverflow|execstackoverflow|'
+    r'dictstackoverflow|unmatchedmark|typecheck|rangecheck)\b'
+)
+
+STDERR_TAIL_LINES = 50  # 只保留最后若干行，避免失控任务占满内存
+
+
+def kill_process_group(proc):
+    """结束子进程及其派生的所有进程"""
+    if proc.returncode is not None:
+        return
+    try:
+        if os.name == 'nt':
+            subprocess.run(['taskkill', '/T', '/F', '/PID', str(proc.pid)],
+                           capture_output=True, timeout=10)
+        else:
+            os.killpg(proc.pid, signal.SIGKILL)
+    except (ProcessLookupError, PermissionError, OSError):
+        try:
+            proc.kill()
+        except ProcessLookupError:
+            pass
+
+
+async def _read_stream(stream, tail, on_line, fatal_patterns, fatal):
+    """逐行读取输出，命中致命错误时记录并返回"""
+    while True:
+        line = await stream.readline()
+        if not line:
+            return
+        text = line.decode('utf-8', errors='ignore').rstrip()
+        if not text:
+            continue
+        tail.append(text)
+        if on_line is not None:
+            on_line(text)
+        if fatal_patterns is not None and fatal_patterns.search(text):
+            fatal.append(text)
+            return
+
+
+async def run_tool(cmd, timeout=180, on_line=None, fatal_patterns=FATAL_GS_PATTERNS, limits=None):
+    """异步运行外部工具（独立进程组，limits 为 tool_sandbox 的资源上限）
+
+    返回字典: returncode, stderr_tail（最后若干行）, aborted（None/'fatal'/'timeout'）, fatal_line
+    被取消时结束整个进程组后重新抛出 CancelledError
+    """
+    proc = await asyncio.create_subprocess_exec(
+        *cmd,
+        stdin=asyncio.subprocess.DEVNULL,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+        **spawn_kwargs(limits))
+    after_spawn(proc.pid, cmd, limits)
+
+    tail = deque(maxlen=STDERR_TAIL_LINES)
+    fatal = []
+    result = {'returncode': None, 'stderr_tail': tail, 'aborted': None, 'fatal_line': None}
+
+    # Ghostscript 的错误信息可能写到stdout，两路都解析
+    readers = [
+        asyncio.ensure_future(_read_stream(proc.stdout, tail, on_line, fatal_patterns, fatal)),
+        asyncio.ensure_future(_read_stream(proc.stderr, tail, on_line, fatal_patterns, fatal)),
+    ]
+    try:
+        pending = set(readers)
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while pending and not fatal:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                result['aborted'] = 'timeout'
+                break
+            _, pending = await asyncio.wait(pending, timeout=remaining,
+                                            return_when=asyncio.FIRST_COMPLETED)
+        if fatal:
+            result['aborted'] = 'fatal'
+            result['fatal_line'] = fatal[0]
+        if result['aborted']:
+            kill_process_group(proc)
+        result['returncode'] = await proc.wait()
+    except asyncio.CancelledError:
+        kill_process_group(proc)
+        await asyncio.shield(proc.wait())
+        raise
+    finally:
+        for reader in readers:
+            reader.cancel()
+        await asyncio.gather(*readers, return_exceptions=True)
+        unregister_group(proc.pid)
+
+    result['stderr_tail'] = list(tail)
+    return result
+
+
+async def convert_one(eps_file, gs_path, fmt, dpi, scale_factor, semaphore, verbose=False):
+    """在并发限制内转换单个文件，返回 (eps_file, ok, message)"""
+    async with semaphore:
+        if fmt == 'png':
+            out_file = output_path(eps_file, '.png')
+            tmp_file = prepare_output(out_file)
+            cmd = build_png_command(eps_file, tmp_file, gs_path, dpi)
+            timeout = 180
+            limits = predict_limits(eps_file, dpi, timeout=timeout)
+        else:
+            out_file = output_path(eps_file, '.svg')
+            tmp_file = prepare_output(out_file)
+            cmd = build_svg_command(eps_file, tmp_file, gs_path, scale_factor)
+            timeout = 120
+            limits = predict_limits(eps_file, timeout=timeout)
+
+        on_line = (lambda text: print(f"  [{eps_file.name}] {text}")) if verbose else None
+        try:
+            result = await run_tool(cmd, timeout=timeout, on_line=on_line, limits=limits)
+        except asyncio.CancelledError:
+            # 被取消的任务可能留下写了一半的临时文件
+            discard_output(out_file)
+            raise
+
+        if result['aborted'] or result['returncode'] != 0:
+            discard_output(out_file)
+            if result['aborted'] == 'fatal':
+                return eps_file, False, f"致命错误，已提前终止: {result['fatal_line']}"
+            if result['aborted'] == 'timeout':
+                return eps_file, False, "转换超时"
+            last = next((l for l in reversed(result['stderr_tail'])
+                         if not l.startswith('GPL')), '')
+            return eps_file, False, f"返回码 {result['returncode']}: {last}"
+
+        size = commit_output(eps_file, out_file)
+        if size > 0:
+            return eps_file, True, f"{out_file.name} ({size / 1024:.1f} KB)"
+        return eps_file, False, "输出文件为空或未生成"
+
+
+async def convert_batch(eps_files, gs_path, fmt='png', dpi=450, scale_factor=3,
+                        jobs=None, verbose=False):
+    """并发转换一批文件，按完成顺序输出结果，返回 (成功数, 失败数)"""
+    jobs = jobs or os.cpu_count() or 1
+    semaphore = asyncio.Semaphore(jobs)
+    tasks = [asyncio.ensure_future(
+                 convert_one(f, gs_path, fmt, dpi, scale_factor, semaphore, verbose))
+             for f in eps_files]
+
+    success_count = 0
+    fail_count = 0
+    try:
+        for done, future in enumerate(asyncio.as_completed(tasks), 1):
+            eps_file, ok, message = await future
+            if ok:
+                success_count += 1
+                print(f"[{done}/{len(tasks)}] ✓ {eps_file.name}: {message}")
+            else:
+                fail_count += 1
+                print(f"[{done}/{len(tasks)}] ❌ {eps_file.name}: {message}")
+    finally:
+        # 中断时取消所有未完成任务，各任务会结束自己的进程组
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    return success_count, fail_count
+
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description="EPS 异步批量转换")
+    parser.add_argument('--format', choices=['png', 'svg'], default='png')
+    parser.add_argument('--dpi', type=int, default=450, help="PNG分辨率")
+    parser.add_argument('--scale', type=float, default=3, help="SVG缩放倍数")
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count(), help="并发数")
+    parser.add_argument('-v', '--verbose', action='store_true', help="实时显示工具输出")
+    args = parser.parse_args()
+
+    print("EPS 异步批量转换引擎")
+    print("=" * 60)
+    print(f"当前目录: {Path.cwd()}")
+
+    reap_orphans()
+    gs_path, gs_version = find_ghostscript()
+    if not gs_path:
+        print("❌ 未找到 Ghostscript")
+        return 1
+    print(f"✓ Ghostscript: {gs_version}")
+
+    eps_files = get_eps_files()
+    if not eps_files:
+        print("\n❌ 当前目录下没有找到EPS文件")
+        return 1
+
+    print(f"找到 {len(eps_files)} 个EPS文件，并发数 {args.jobs}")
+    print("-" * 60)
+
+    try:
+        success_count, fail_count = asyncio.run(convert_batch(
+            eps_files, gs_path, args.format, args.dpi, args.scale, args.jobs, args.verbose))
+    except KeyboardInterrupt:
+        print("\n\n操作被用户中断，已结束所有子进程")
+        return 130
+
+    print("\n" + "=" * 60)
+    print("转换完成!")
+    print(f"成功: {success_count} 个文件")
+    print(f"失败: {fail_count} 个文件")
+    return 0 if fail_count == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
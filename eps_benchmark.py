@@ -0,0 +1,489 @@
+#!/usr/bin/env python3
+"""
+EPS 转换性能基准测试
+生成可复现的合成EPS语料库，对所有转换方法在各DPI预设下计时，
+并把结果保存为带版本号的JSON，用于与基线对比发现性能回退
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import struct
+import hashlib
+import argparse
+import platform
+import statistics
+import contextlib
+import multiprocessing
+from pathlib import Path
+from datetime import datetime
+
+from output_layout import output_path, prepare_output, remove_output
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+SCHEMA_VERSION = 1
+DEFAULT_SEED = 20250709
+DPI_PRESETS = [300, 450, 600, 900]
+
+# 方法名 -> (输出后缀, 是否需要Inkscape, 是否需要PIL)
+METHODS = {
+    'png':             ('.png', False, False),
+    'svg_gs':          ('.svg', False, False),
+    'robust_inkscape': ('.svg', True, False),
+    'robust_gs_pdf':   ('.svg', True, False),
+    'robust_gs_svg':   ('.svg', False, False),
+    'robust_pil':      ('.svg', False, True),
+    'robust_fallback': ('.svg', False, False),
+    'diag_svg':        ('.svg', False, False),
+    'diag_png':        ('.png', False, False),
+    'diag_pdf':        ('.pdf', False, False),
+}
+
+
+# ---------------------------------------------------------------- 语料库生成
+
+def _eps_header(bbox, title):
+    """生成EPS文件头"""
+    return (
+        "%!PS-Adobe-3.0 EPSF-3.0\n"
+        f"%%BoundingBox: 0 0 {bbox[0]} {bbox[1]}\n"
+        f"%%Title: {title}\n"
+        "%%Creator: eps_benchmark.py\n"
+        "%%EndComments\n"
+    )
+
+
+def make_line_art(rng, index):
+    """线条图: 大量随机直线与贝塞尔曲线"""
+    w, h = 600, 450
+    lines = [_eps_header((w, h), f"line_art_{index}"), "0.3 setlinewidth\n"]
+    for _ in range(4000):
+        r, g, b = rng.random(), rng.random(), rng.random()
+        x0, y0 = rng.uniform(0, w), rng.uniform(0, h)
+        lines.append(f"{r:.3f} {g:.3f} {b:.3f} setrgbcolor newpath {x0:.2f} {y0:.2f} moveto ")
+        if rng.random() < 0.5:
+            lines.append(f"{rng.uniform(0, w):.2f} {rng.uniform(0, h):.2f} lineto stroke\n")
+        else:
+            pts = " ".join(f"{rng.uniform(0, w):.2f} {rng.uniform(0, h):.2f}" for _ in range(3))
+            lines.append(f"{pts} curveto stroke\n")
+    lines.append("showpage\n%%EOF\n")
+    return "".join(lines).encode('ascii')
+
+
+def make_dense_text(rng, index):
+    """密集文字: 数千行小字号文本"""
+    w, h = 595, 842
+    words = ["lorem", "ipsum", "dolor", "sit", "amet", "EPS", "Ghostscript",
+             "vector", "raster", "glyph", "kerning", "baseline"]
+    lines = [_eps_header((w, h), f"dense_text_{index}")]
+    fonts = ["Times-Roman", "Helvetica", "Courier"]
+    y = h - 8
+    while y > 4:
+        font = rng.choice(fonts)
+        text = " ".join(rng.choice(words) for _ in range(16))
+        lines.append(f"/{font} findfont 5 scalefont setfont 6 {y:.1f} moveto ({text}) show\n")
+        y -= 5.5
+    lines.append("showpage\n%%EOF\n")
+    return "".join(lines).encode('ascii')
+
+
+def make_embedded_image(rng, index, size=768):
+    """大尺寸嵌入位图: ASCIIHex编码的RGB图像"""
+    w, h = 500, 500
+    header = _eps_header((w, h), f"embedded_image_{index}")
+    body = (
+        "gsave\n"
+        f"{w} {h} scale\n"
+        f"{size} {size} 8 [{size} 0 0 -{size} 0 {size}]\n"
+        "currentfile /ASCIIHexDecode filter false 3 colorimage\n"
+    )
+    raw = rng.randbytes(size * size * 3).hex()
+    chunks = [raw[i:i + 128] for i in range(0, len(raw), 128)]
+    data = "\n".join(chunks) + ">\n"
+    return (header + body + data + "grestore\nshowpage\n%%EOF\n").encode('ascii')
+
+
+def _tiff_preview(width, height, rng):
+    """生成最小的未压缩8位灰度TIFF预览"""
+    pixels = rng.randbytes(width * height)
+    entries = [
+        (256, 3, 1, width),          # ImageWidth
+        (257, 3, 1, height),         # ImageLength
+        (258, 3, 1, 8),              # BitsPerSample
+        (259, 3, 1, 1),              # Compression: none
+        (262, 3, 1, 1),              # Photometric: BlackIsZero
+        (273, 4, 1, 0),              # StripOffsets（稍后填写）
+        (278, 3, 1, height),         # RowsPerStrip
+        (279, 4, 1, len(pixels)),    # StripByteCounts
+    ]
+    ifd_size = 2 + len(entries) * 12 + 4
+    data_offset = 8 + ifd_size
+    out = bytearray(b'II*\x00' + struct.pack('<I', 8))
+    out += struct.pack('<H', len(entries))
+    for tag, typ, count, value in entries:
+        if tag == 273:
+            value = data_offset
+        if typ == 3:
+            out += struct.pack('<HHIHH', tag, typ, count, value, 0)
+        else:
+            out += struct.pack('<HHII', tag, typ, count, value)
+    out += struct.pack('<I', 0)
+    out += pixels
+    return bytes(out)
+
+
+def make_dos_eps(rng, index):
+    """DOS-EPS: 带二进制文件头和TIFF预览的EPS"""
+    ps = make_line_art(rng, index)
+    tiff = _tiff_preview(200, 150, rng)
+    header_len = 30
+    ps_offset = header_len
+    tiff_offset = ps_offset + len(ps)
+    header = b'\xC5\xD0\xD3\xC6' + struct.pack(
+        '<IIIIIIH', ps_offset, len(ps), 0, 0, tiff_offset, len(tiff), 0xFFFF)
+    return header + ps + tiff
+
+
+def make_deep_nesting(rng, index, depth=200):
+    """病态深层嵌套: 嵌套的gsave/过程调用/字典栈"""
+    w, h = 400, 400
+    lines = [_eps_header((w, h), f"deep_nesting_{index}"), "200 200 translate\n"]
+    for i in range(depth):
+        angle = rng.uniform(-5, 5)
+        lines.append(f"gsave {angle:.3f} rotate 0.985 0.985 scale 1 dict begin /d{i} {i} def {{\n")
+    lines.append("newpath -150 -150 moveto 150 -150 lineto 150 150 lineto closepath 0.5 setgray fill\n")
+    for _ in range(depth):
+        lines.append("} exec end 0 0 moveto 150 0 rlineto stroke grestore\n")
+    lines.append("showpage\n%%EOF\n")
+    return "".join(lines).encode('ascii')
+
+
+CORPUS_KINDS = [
+    ('line_art', make_line_art),
+    ('dense_text', make_dense_text),
+    ('embedded_image', make_embedded_image),
+    ('dos_eps', make_dos_eps),
+    ('deep_nesting', make_deep_nesting),
+]
+
+
+def generate_corpus(corpus_dir, seed=DEFAULT_SEED, copies=2):
+    """生成确定性的合成EPS语料库，返回 {文件名: sha256}"""
+    corpus_dir = Path(corpus_dir)
+    corpus_dir.mkdir(parents=True, exist_ok=True)
+    manifest = {}
+    for kind, factory in CORPUS_KINDS:
+        for index in range(copies):
+            # 每个文件使用独立的随机源，新增类型不会改变已有文件
+            rng = random.Random(f"{seed}:{kind}:{index}")
+            data = factory(rng, index)
+            eps_file = corpus_dir / f"{kind}_{index:02d}.eps"
+            eps_file.write_bytes(data)
+            manifest[eps_file.name] = hashlib.sha256(data).hexdigest()
+    (corpus_dir / 'manifest.json').write_text(
+        json.dumps({'seed': seed, 'copies': copies, 'files': manifest}, indent=2),
+        encoding='utf-8')
+    return manifest
+
+
+# ---------------------------------------------------------------- 计时执行
+
+def _children_usage():
+    """读取子进程资源占用 (CPU秒, 峰值RSS KB)"""
+    if resource is None:
+        return 0.0, None
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    rss = usage.ru_maxrss
+    if sys.platform == 'darwin':
+        rss //= 1024  # macOS返回字节
+    return usage.ru_utime + usage.ru_stime, rss
+
+
+def _self_cpu():
+    """读取本进程CPU秒"""
+    if resource is None:
+        return time.process_time()
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+
+def run_method(method, eps_file, dpi, tools):
+    """执行单个转换方法，返回输出文件路径（失败返回None）"""
+    scale_factor = dpi / 150  # 与PNG转换器相同的150 DPI基准
+    suffix = METHODS[method][0]
+    out_file = output_path(eps_file, suffix)
+    gs_path = tools.get('ghostscript')
+
+    if method == 'png':
+        from eps_to_high_quality_png import convert_eps_to_png
+        ok = convert_eps_to_png(eps_file, gs_path, dpi)
+    elif method == 'svg_gs':
+        from eps_to_svg_ghostscript import convert_eps_to_svg_gs
+        ok = convert_eps_to_svg_gs(eps_file, gs_path, scale_factor)
+    elif method == 'robust_fallback':
+        from eps_to_svg_robust import convert_eps_to_svg
+        ok = convert_eps_to_svg(eps_file, tools, scale_factor)
+    elif method.startswith('robust_'):
+        import eps_to_svg_robust as robust
+        func = {
+            'robust_inkscape': robust.method1_inkscape_direct,
+            'robust_gs_pdf': robust.method2_ghostscript_pdf,
+            'robust_gs_svg': robust.method3_ghostscript_svg,
+            'robust_pil': robust.method4_pil_conversion,
+        }[method]
+        prepare_output(out_file)  # 分片目录
+        if out_file.exists():
+            out_file.unlink()
+        ok = func(eps_file, out_file, tools, scale_factor)
+    else:
+        import eps_to_svg_diagnostic as diag
+        func = {
+            'diag_svg': diag.convert_method_1_svg,
+            'diag_png': diag.convert_method_2_png,
+            'diag_pdf': diag.convert_method_3_pdf,
+        }[method]
+        ok = func(eps_file, gs_path, scale_factor)
+
+    if ok and out_file.exists():
+        return out_file
+    return None
+
+
+def _job_worker(conn, method, eps_file, dpi, tools):
+    """在独立子进程中执行一次测量，保证峰值RSS只属于本次任务"""
+    result = {'ok': False, 'wall_s': None, 'cpu_s': None,
+              'peak_rss_kb': None, 'output_bytes': None, 'error': None}
+    try:
+        eps_file = Path(eps_file)
+        cpu0, _ = _children_usage()
+        self0 = _self_cpu()
+        t0 = time.perf_counter()
+        with open(os.devnull, 'w', encoding='utf-8') as devnull, \
+                contextlib.redirect_stdout(devnull):
+            out_file = run_method(method, eps_file, dpi, tools)
+        result['wall_s'] = time.perf_counter() - t0
+        cpu1, rss = _children_usage()
+        result['cpu_s'] = (cpu1 - cpu0) + (_self_cpu() - self0)
+        result['peak_rss_kb'] = rss
+        if out_file is not None:
+            result['ok'] = True
+            result['output_bytes'] = out_file.stat().st_size
+            remove_output(eps_file, out_file.suffix)
+    except Exception as e:
+        result['error'] = str(e)
+    conn.send(result)
+    conn.close()
+
+
+def measure(method, eps_file, dpi, tools, timeout=600):
+    """启动新进程测量一次转换"""
+    ctx = multiprocessing.get_context('spawn')
+    parent_conn, child_conn = ctx.Pipe(duplex=False)
+    proc = ctx.Process(target=_job_worker,
+                       args=(child_conn, method, str(eps_file), dpi, tools))
+    proc.start()
+    child_conn.close()
+    if parent_conn.poll(timeout):
+        result = parent_conn.recv()
+    else:
+        proc.kill()
+        result = {'ok': False, 'wall_s': None, 'cpu_s': None, 'peak_rss_kb': None,
+                  'output_bytes': None, 'error': 'benchmark timeout'}
+    proc.join()
+    return result
+
+
+def _median(values):
+    values = [v for v in values if v is not None]
+    return statistics.median(values) if values else None
+
+
+def available_methods(tools):
+    """根据已安装工具筛选可测方法"""
+    methods = []
+    for name, (_, needs_inkscape, needs_pil) in METHODS.items():
+        if 'ghostscript' not in tools and name != 'robust_inkscape':
+            continue
+        if needs_inkscape and 'inkscape' not in tools:
+            continue
+        if needs_pil and 'pil' not in tools:
+            continue
+        methods.append(name)
+    return methods
+
+
+def run_benchmark(corpus_dir, methods=None, dpis=None, repeat=3, output=None):
+    """对语料库运行基准测试，返回结果字典并写入JSON"""
+    from eps_to_svg_robust import check_tools
+
+    corpus_dir = Path(corpus_dir)
+    manifest_file = corpus_dir / 'manifest.json'
+    if not manifest_file.exists():
+        raise FileNotFoundError(f"语料库清单不存在: {manifest_file}")
+    manifest = json.loads(manifest_file.read_text(encoding='utf-8'))
+
+    tools = check_tools()
+    all_methods = available_methods(tools)
+    methods = [m for m in (methods or all_methods) if m in all_methods]
+    skipped = sorted(set(METHODS) - set(all_methods))
+    dpis = dpis or DPI_PRESETS
+
+    gs_version = None
+    if 'ghostscript' in tools:
+        from eps_core import find_ghostscript
+        _, gs_version = find_ghostscript()
+
+    report = {
+        'schema_version': SCHEMA_VERSION,
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'host': {
+            'node': platform.node(),
+            'platform': platform.platform(),
+            'machine': platform.machine(),
+            'cpu_count': os.cpu_count(),
+            'python': platform.python_version(),
+        },
+        'tools': {'ghostscript': gs_version,
+                  'inkscape': tools.get('inkscape'),
+                  'pil': bool(tools.get('pil'))},
+        'corpus': manifest,
+        'repeat': repeat,
+        'skipped_methods': skipped,
+        'results': [],
+    }
+
+    eps_files = sorted(corpus_dir / name for name in manifest['files'])
+    total = len(eps_files) * len(methods) * len(dpis)
+    done = 0
+    for eps_file in eps_files:
+        for method in methods:
+            for dpi in dpis:
+                done += 1
+                print(f"[{done}/{total}] {eps_file.name} {method} {dpi} DPI", end="", flush=True)
+                samples = [measure(method, eps_file, dpi, tools) for _ in range(repeat)]
+                ok = all(s['ok'] for s in samples)
+                entry = {
+                    'file': eps_file.name,
+                    'category': eps_file.stem.rsplit('_', 1)[0],
+                    'method': method,
+                    'dpi': dpi,
+                    'ok': ok,
+                    'wall_s': _median(s['wall_s'] for s in samples),
+                    'cpu_s': _median(s['cpu_s'] for s in samples),
+                    'peak_rss_kb': max((s['peak_rss_kb'] for s in samples
+                                        if s['peak_rss_kb'] is not None), default=None),
+                    'output_bytes': _median(s['output_bytes'] for s in samples),
+                    'errors': sorted({s['error'] for s in samples if s['error']}),
+                    'samples': [s['wall_s'] for s in samples],
+                }
+                report['results'].append(entry)
+                if ok:
+                    print(f"  ✓ {entry['wall_s']:.3f}s")
+                else:
+                    print("  ❌ 失败")
+
+    if output is None:
+        stamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        output = Path('bench_results') / f"bench_v{SCHEMA_VERSION}_{stamp}.json"
+    output = Path(output)
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2, ensure_ascii=False), encoding='utf-8')
+    print(f"\n✓ 结果已保存: {output}")
+    return report
+
+
+# ---------------------------------------------------------------- 基线对比
+
+def compare_reports(baseline, current, threshold=0.10, min_delta_s=0.05):
+    """对比两份结果，返回回退列表"""
+    if baseline.get('schema_version') != current.get('schema_version'):
+        raise ValueError(
+            f"结果版本不一致: {baseline.get('schema_version')} != {current.get('schema_version')}")
+
+    def key(entry):
+        return entry['file'], entry['method'], entry['dpi']
+
+    base_index = {key(e): e for e in baseline['results']}
+    regressions = []
+    for entry in current['results']:
+        base = base_index.get(key(entry))
+        if base is None:
+            continue
+        if base['ok'] and not entry['ok']:
+            regressions.append((key(entry), 'ok', True, False))
+            continue
+        if not (base['ok'] and entry['ok']):
+            continue
+        for metric in ('wall_s', 'cpu_s', 'peak_rss_kb', 'output_bytes'):
+            old, new = base.get(metric), entry.get(metric)
+            if not old or new is None:
+                continue
+            if metric in ('wall_s', 'cpu_s') and new - old < min_delta_s:
+                continue
+            if new > old * (1 + threshold):
+                regressions.append((key(entry), metric, old, new))
+    return regressions
+
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description="EPS 转换性能基准测试")
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    p_corpus = sub.add_parser('corpus', help="生成合成EPS语料库")
+    p_corpus.add_argument('corpus_dir', nargs='?', default='bench_corpus')
+    p_corpus.add_argument('--seed', type=int, default=DEFAULT_SEED)
+    p_corpus.add_argument('--copies', type=int, default=2, help="每种类型的文件数")
+
+    p_run = sub.add_parser('run', help="运行基准测试")
+    p_run.add_argument('corpus_dir', nargs='?', default='bench_corpus')
+    p_run.add_argument('--methods', nargs='+', choices=sorted(METHODS))
+    p_run.add_argument('--dpi', type=int, nargs='+', dest='dpis')
+    p_run.add_argument('--repeat', type=int, default=3)
+    p_run.add_argument('-o', '--output')
+
+    p_cmp = sub.add_parser('compare', help="与基线结果对比")
+    p_cmp.add_argument('baseline')
+    p_cmp.add_argument('current')
+    p_cmp.add_argument('--threshold', type=float, default=0.10, help="回退阈值（比例）")
+
+    args = parser.parse_args()
+
+    if args.command == 'corpus':
+        manifest = generate_corpus(args.corpus_dir, args.seed, args.copies)
+        print(f"✓ 已生成 {len(manifest)} 个EPS文件: {Path(args.corpus_dir).resolve()}")
+        return 0
+
+    if args.command == 'run':
+        report = run_benchmark(args.corpus_dir, args.methods, args.dpis,
+                               args.repeat, args.output)
+        failed = sum(1 for e in report['results'] if not e['ok'])
+        print(f"测量项: {len(report['results'])}, 失败: {failed}")
+        if report['skipped_methods']:
+            print(f"跳过的方法（缺少工具）: {', '.join(report['skipped_methods'])}")
+        return 0
+
+    baseline = json.loads(Path(args.baseline).read_text(encoding='utf-8'))
+    current = json.loads(Path(args.current).read_text(encoding='utf-8'))
+    regressions = compare_reports(baseline, current, args.threshold)
+    if not regressions:
+        print(f"✓ 未发现超过 {args.threshold:.0%} 的性能回退")
+        return 0
+    print(f"❌ 发现 {len(regressions)} 项性能回退:")
+    for (file, method, dpi), metric, old, new in regressions:
+        print(f"  {file} {method} {dpi} DPI  {metric}: {old} -> {new}")
+    return 1
+
+
+if __name__ == "__main__":
+    try:
+        sys.exit(main())
+    except KeyboardInterrupt:
+        print("\n\n操作被用户中断")
+        sys.exit(130)
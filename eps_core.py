@@ -0,0 +1,348 @@
+#!/usr/bin/env python3
+"""
+公共转换引擎：查找EPS文件、按格式分派转换、按需探测和加载后端
+
+后端（Ghostscript / Inkscape / Pillow / 位图矢量化）在第一次用到时才探测（启动 --version 或查找包），
+结果在进程内缓存；转换器模块也在第一次转换时才导入。只用 Ghostscript 的短命令
+（cron、服务工作进程、其他工具逐个文件调用）不再为 Pillow/NumPy 导入和 Inkscape 探测付出启动时间
+
+用法:
+    python eps_core.py                  # 探测并列出全部后端
+    python eps_core.py --importtime     # 用 -X importtime 测量各脚本的导入耗时，超出预算时返回1
+"""
+
+import os
+import re
+import sys
+import glob
+import argparse
+import importlib
+import threading
+import subprocess
+from pathlib import Path
+
+GS_CANDIDATES = [
+    r"C:\Program Files\gs\gs*\bin\gswin64c.exe",
+    r"C:\Program Files (x86)\gs\gs*\bin\gswin64c.exe",
+    r"C:\Program Files\gs\gs*\bin\gswin32c.exe",
+    r"C:\Program Files (x86)\gs\gs*\bin\gswin32c.exe",
+    "gs", "gswin64c", "gswin32c",
+]
+INKSCAPE_CANDIDATES = [
+    r"C:\Program Files\Inkscape\bin\inkscape.exe",
+    r"C:\Program Files (x86)\Inkscape\bin\inkscape.exe",
+    "inkscape",
+]
+
+# 格式 -> (模块, 函数)；第一次转换该格式时才导入
+CONVERTERS = {
+    'png': ('eps_to_high_quality_png', 'convert_eps_to_png'),
+    'svg': ('eps_to_svg_ghostscript', 'convert_eps_to_svg_gs'),
+}
+
+# 导入预算（毫秒，-X importtime 的累计时间，取多次最小值）：在实测值上留有余量，用于发现回退；
+# 导入这些模块时都不应加载 HEAVY_MODULES（只在真正用到位图处理时才导入）
+IMPORT_BUDGET_MS = {
+    'eps_core': 30,
+    'eps_to_high_quality_png': 80,
+    'eps_to_svg_ghostscript': 80,
+    'eps_to_svg_robust': 100,
+    'eps_watch': 80,
+    'eps_work_queue': 80,
+    'eps_roi': 80,
+    'eps_service': 150,
+}
+HEAVY_MODULES = ('numpy', 'PIL')
+
+_probed = {}
+_probe_lock = threading.Lock()
+
+
+def _probe_executable(candidates):
+    """依次尝试候选路径（支持通配符，取最新版本），返回 (路径, 版本)；都不可用时返回None"""
+    for pattern in candidates:
+        if '*' in pattern:
+            matches = glob.glob(pattern)
+            if not matches:
+                continue
+            path = sorted(matches)[-1]
+        else:
+            path = pattern
+        try:
+            result = subprocess.run([path, '--version'],
+                                    capture_output=True, check=True, timeout=10,
+                                    encoding='utf-8', errors='ignore')
+            return path, result.stdout.strip()
+        except Exception:
+            continue
+    return None
+
+
+def _locate_executable(candidates):
+    """不启动程序，只找出第一个存在的候选路径；找不到时返回None"""
+    from shutil import which
+    for pattern in candidates:
+        if '*' in pattern:
+            matches = glob.glob(pattern)
+            if matches:
+                return sorted(matches)[-1]
+            continue
+        path = which(pattern)
+        if path:
+            return path
+    return None
+
+
+def _package_version(name, dist=None):
+    """只查找包和版本号，不导入（导入 NumPy/Pillow 要几十毫秒）"""
+    from importlib.util import find_spec
+    if find_spec(name) is None:
+        return None
+    try:
+        from importlib.metadata import version
+        return version(dist or name)
+    except Exception:
+        return 'unknown'
+
+
+def _package_label(label, version):
+    return f"{label}-{version}" if version else None
+
+
+def _probe_pil():
+    version = _package_version('PIL', 'Pillow')
+    return (True, version) if version else None
+
+
+def _probe_tracer():
+    # 记录 NumPy 版本，使失败缓存在装上/升级 NumPy 后失效
+    version = _package_version('numpy')
+    return (f"raster_tracer/numpy-{version}", version) if version else None
+
+
+# 后端名 -> 探测函数，返回 (工具表中的值, 版本说明) 或 None；顺序即 robust 转换器的尝试顺序
+BACKENDS = {
+    'inkscape': lambda: _probe_executable(INKSCAPE_CANDIDATES),
+    'ghostscript': lambda: _probe_executable(GS_CANDIDATES),
+    'pil': _probe_pil,
+    'tracer': _probe_tracer,
+}
+# 后端名 -> 不探测（不启动 --version）的身份标识：可执行文件路径或包版本，不可用时为None；
+# 用于失败缓存的工具链指纹（tool_fingerprint 会记录可执行文件的大小和修改时间）
+BACKEND_IDENTITIES = {
+    'inkscape': lambda: _locate_executable(INKSCAPE_CANDIDATES),
+    'ghostscript': lambda: _locate_executable(GS_CANDIDATES),
+    'pil': lambda: _package_label('Pillow', _package_version('PIL', 'Pillow')),
+    'tracer': lambda: _package_label('raster_tracer/numpy', _package_version('numpy')),
+}
+BACKEND_LABELS = {
+    'inkscape': "Inkscape",
+    'ghostscript': "Ghostscript",
+    'pil': "PIL/Pillow",
+    'tracer': "NumPy（位图矢量化）",
+}
+
+
+def backend(name):
+    """第一次调用时探测后端，之后直接返回缓存的 (值, 版本)；不可用时返回None"""
+    with _probe_lock:
+        if name not in _probed:
+            _probed[name] = BACKENDS[name]()
+        return _probed[name]
+
+
+def find_ghostscript():
+    """查找Ghostscript，返回 (路径, 版本)，找不到时返回 (None, None)"""
+    return backend('ghostscript') or (None, None)
+
+
+def find_inkscape():
+    """查找Inkscape，返回 (路径, 版本)，找不到时返回 (None, None)"""
+    return backend('inkscape') or (None, None)
+
+
+class LazyTools(dict):
+    """按需探测的工具表：'inkscape' in tools 时才探测 Inkscape
+
+    用法与原来 check_tools() 返回的 dict 相同（值为路径/True/版本标识）；
+    遍历、len()、keys()/values() 会探测全部后端
+    """
+
+    def __init__(self, names=None, verbose=True):
+        super().__init__()
+        self._names = [n for n in (names or BACKENDS) if n in BACKENDS]
+        self._pending = list(self._names)
+        self._verbose = verbose
+        self._identity = None
+
+    def identity(self):
+        """各后端的身份标识（可执行文件路径、包版本），只查找文件和包元数据，不触发探测；
+        用于工具链指纹，结果缓存在实例上"""
+        if self._identity is None:
+            self._identity = [value for value in (BACKEND_IDENTITIES[name]() for name in self._names)
+                              if value is not None]
+        return self._identity
+
+    def _probe(self, name):
+        if name not in self._pending:
+            return
+        self._pending.remove(name)
+        found = backend(name)
+        if found:
+            super().__setitem__(name, found[0])
+        if self._verbose:
+            label = BACKEND_LABELS[name]
+            if found:
+                detail = found[0] if isinstance(found[0], str) and name != 'tracer' else found[1]
+                print(f"✓ 找到 {label}: {detail}")
+            else:
+                print(f"- {label} 不可用")
+
+    def _probe_all(self):
+        for name in list(self._pending):
+            self._probe(name)
+
+    def __contains__(self, name):
+        self._probe(name)
+        return super().__contains__(name)
+
+    def __getitem__(self, name):
+        self._probe(name)
+        return super().__getitem__(name)
+
+    def get(self, name, default=None):
+        self._probe(name)
+        return super().get(name, default)
+
+    def __iter__(self):
+        self._probe_all()
+        return super().__iter__()
+
+    def __len__(self):
+        self._probe_all()
+        return super().__len__()
+
+    def keys(self):
+        self._probe_all()
+        return super().keys()
+
+    def values(self):
+        self._probe_all()
+        return super().values()
+
+    def items(self):
+        self._probe_all()
+        return super().items()
+
+    def __repr__(self):
+        return f"LazyTools({super().__repr__()}, pending={self._pending})"
+
+
+def get_eps_files(directory=None):
+    """获取目录（默认当前目录）下所有EPS文件"""
+    directory = Path(directory) if directory else Path.cwd()
+    eps_files = list(directory.glob("*.eps"))
+    eps_files.extend(directory.glob("*.EPS"))
+    return sorted(set(eps_files))
+
+
+def converter(fmt):
+    """格式对应的转换函数，第一次使用时导入其模块"""
+    module_name, func_name = CONVERTERS[fmt]
+    return getattr(importlib.import_module(module_name), func_name)
+
+
+def convert(eps_file, gs_path, formats, dpi=450, scale_factor=3):
+    """把一个EPS转换为所有需要的格式，全部成功时返回True"""
+    ok = True
+    if 'png' in formats:
+        ok = converter('png')(eps_file, gs_path, dpi) and ok
+    if 'svg' in formats:
+        ok = converter('svg')(eps_file, gs_path, scale_factor) and ok
+    return ok
+
+
+# ---------------------------------------------------------------- 导入耗时
+
+_IMPORTTIME_RE = re.compile(r'import time:\s+(\d+)\s+\|\s+(\d+)\s+\|( *)(\S+)')
+
+
+def measure_import(module, python=None):
+    """在新进程中用 -X importtime 导入模块，返回 {'ms': 累计毫秒, 'heavy': [...], 'top': [...]}
+
+    top 为耗时最多的直接依赖 (模块, 毫秒)；heavy 为导入时被加载的 HEAVY_MODULES
+    """
+    result = subprocess.run([python or sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                            capture_output=True, text=True, timeout=60,
+                            cwd=os.path.dirname(os.path.abspath(__file__)))
+    if result.returncode:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1] if result.stderr.strip()
+                           else f"导入 {module} 失败")
+    total = None
+    children = []
+    heavy = set()
+    for line in result.stderr.splitlines():
+        match = _IMPORTTIME_RE.match(line)
+        if not match:
+            continue
+        cumulative, depth, name = int(match.group(2)), len(match.group(3)), match.group(4)
+        if name.split('.')[0] in HEAVY_MODULES:
+            heavy.add(name.split('.')[0])
+        if name == module and depth == 1:
+            total = cumulative
+        elif depth == 3:
+            children.append((name, cumulative / 1000))
+    children.sort(key=lambda item: -item[1])
+    return {'ms': (total or 0) / 1000, 'heavy': sorted(heavy), 'top': children[:3]}
+
+
+def check_import_budget(budget=None, repeat=3):
+    """测量各模块的导入耗时（取多次中的最小值，减少抖动），返回超出预算或加载了重量级依赖的模块列表"""
+    failures = []
+    for module, limit in (budget or IMPORT_BUDGET_MS).items():
+        try:
+            runs = [measure_import(module) for _ in range(repeat)]
+        except (RuntimeError, subprocess.TimeoutExpired) as e:
+            print(f"❌ {module:28s} 导入失败: {e}")
+            failures.append(module)
+            continue
+        best = min(runs, key=lambda r: r['ms'])
+        heavy = sorted(set().union(*(r['heavy'] for r in runs)))
+        ok = best['ms'] <= limit and not heavy
+        top = ", ".join(f"{name} {ms:.1f}" for name, ms in best['top'])
+        print(f"{'✓' if ok else '❌'} {module:28s} {best['ms']:6.1f} ms / 预算 {limit} ms"
+              + (f"  加载了 {', '.join(heavy)}" if heavy else "")
+              + (f"  ({top})" if top else ""))
+        if not ok:
+            failures.append(module)
+    return failures
+
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description="EPS 转换公共引擎：后端探测与启动耗时检查")
+    parser.add_argument('--importtime', action='store_true',
+                        help="用 -X importtime 测量各脚本导入耗时并与预算比较，超出时返回1")
+    parser.add_argument('modules', nargs='*', help="只检查这些模块（使用默认预算或 --budget）")
+    parser.add_argument('--budget', type=float, help="统一的导入预算（毫秒）")
+    args = parser.parse_args()
+
+    if args.importtime or args.modules:
+        budget = {m: args.budget or IMPORT_BUDGET_MS.get(m, 100)
+                  for m in args.modules or IMPORT_BUDGET_MS}
+        print("导入耗时 (-X importtime, 累计)")
+        print("=" * 60)
+        failures = check_import_budget(budget)
+        if failures:
+            print(f"\n❌ {len(failures)} 个模块超出启动预算")
+            return 1
+        print("\n✓ 全部在预算内")
+        return 0
+
+    print("探测后端...")
+    tools = LazyTools()
+    return 0 if len(tools) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+"""
+Ghostscript 渲染参数自动调优
+在用户自己的EPS样本上扫描 NumRenderingThreads / BandHeight / BufferSpace / MaxBitmap，
+在输出像素不变的前提下找出吞吐量最高的组合，并保存为本机配置文件
+"""
+
+import os
+import sys
+import time
+import hashlib
+import argparse
+import platform
+import tempfile
+import contextlib
+from pathlib import Path
+from datetime import datetime
+
+from eps_core import find_ghostscript, get_eps_files
+from eps_to_high_quality_png import convert_eps_to_png
+from gs_profile import TUNABLE_PARAMS, save_gs_profile
+
+MB = 1024 * 1024
+
+
+def candidate_values(cpu_count=None):
+    """各参数的候选值，None 表示使用Ghostscript默认值"""
+    cpu_count = cpu_count or os.cpu_count() or 1
+    threads = sorted({t for t in (2, 4, 8, cpu_count) if t <= cpu_count})
+    return {
+        # 先决定是否分带渲染，线程数只在分带时生效
+        'MaxBitmap': [None, 10 * MB, 100 * MB, 1024 * MB],
+        'BufferSpace': [None, 4 * MB, 16 * MB, 64 * MB],
+        'BandHeight': [None, 32, 128, 512],
+        'NumRenderingThreads': [None] + threads,
+    }
+
+
+def pick_sample(eps_files, count):
+    """按文件大小均匀抽样，保证大小文件都有代表"""
+    eps_files = sorted(eps_files, key=lambda f: f.stat().st_size)
+    if len(eps_files) <= count:
+        return eps_files
+    step = (len(eps_files) - 1) / (count - 1) if count > 1 else 0
+    return [eps_files[round(i * step)] for i in range(count)]
+
+
+def _file_digest(path):
+    """输出文件摘要，用于确认输出质量不变"""
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def run_config(sample, gs_path, dpi, params, work_dir, repeat=1):
+    """用一组参数渲染样本，返回 (最短耗时秒, 输出摘要列表)，失败返回 (None, None)"""
+    # 显式把未指定的可调参数设为None，避免混入已有的本机配置
+    render_params = {key: params.get(key) for key in TUNABLE_PARAMS}
+    best = None
+    digests = None
+    for _ in range(repeat):
+        current = []
+        t0 = time.perf_counter()
+        for i, eps_file in enumerate(sample):
+            png_file = Path(work_dir) / f"tune_{i}.png"
+            with open(os.devnull, 'w', encoding='utf-8') as devnull, \
+                    contextlib.redirect_stdout(devnull):
+                ok = convert_eps_to_png(eps_file, gs_path, dpi,
+                                        png_file=png_file, render_params=render_params)
+            if not ok:
+                return None, None
+            current.append(_file_digest(png_file))
+            png_file.unlink()
+        elapsed = time.perf_counter() - t0
+        best = elapsed if best is None else min(best, elapsed)
+        digests = current
+    return best, digests
+
+
+def _describe(params):
+    items = [f"{k}={v}" for k, v in params.items() if v is not None]
+    return ", ".join(items) if items else "Ghostscript默认"
+
+
+def tune(sample, gs_path, dpi=450, repeat=2, passes=2, min_gain=0.03):
+    """坐标下降调优：每次只改变一个参数，保留更快且输出一致的取值"""
+    with tempfile.TemporaryDirectory(prefix='eps_tune_') as work_dir:
+        best_params = {}
+        base_time, reference = run_config(sample, gs_path, dpi, best_params, work_dir, repeat)
+        if base_time is None:
+            raise RuntimeError("基准渲染失败，无法调优")
+        print(f"  基准: {base_time:.2f}s ({_describe(best_params)})")
+
+        best_time = base_time
+        for round_no in range(1, passes + 1):
+            improved = False
+            for key, values in candidate_values().items():
+                for value in values:
+                    if value == best_params.get(key):
+                        continue
+                    trial = dict(best_params)
+                    trial[key] = value
+                    elapsed, digests = run_config(sample, gs_path, dpi, trial, work_dir, repeat)
+                    if elapsed is None:
+                        print(f"  [{round_no}] {_describe(trial)}: ❌ 渲染失败")
+                        continue
+                    if digests != reference:
+                        print(f"  [{round_no}] {_describe(trial)}: ❌ 输出与基准不一致，跳过")
+                        continue
+                    mark = ""
+                    if elapsed < best_time * (1 - min_gain):
+                        best_time, best_params = elapsed, trial
+                        improved = True
+                        mark = "  ← 当前最佳"
+                    print(f"  [{round_no}] {_describe(trial)}: {elapsed:.2f}s{mark}")
+            if not improved:
+                break
+
+    best_params = {k: v for k, v in best_params.items() if v is not None}
+    return best_params, base_time, best_time
+
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description="Ghostscript 渲染参数自动调优")
+    parser.add_argument('directory', nargs='?', default='.', help="EPS样本所在目录")
+    parser.add_argument('--sample', type=int, default=5, help="样本文件数")
+    parser.add_argument('--dpi', type=int, default=450, help="调优时固定的输出DPI")
+    parser.add_argument('--repeat', type=int, default=2, help="每组参数重复次数（取最快）")
+    parser.add_argument('--passes', type=int, default=2, help="坐标下降轮数")
+    parser.add_argument('--dry-run', action='store_true', help="只显示结果，不保存配置")
+    args = parser.parse_args()
+
+    print("Ghostscript 渲染参数自动调优")
+    print("=" * 60)
+
+    gs_path, gs_version = find_ghostscript()
+    if not gs_path:
+        print("❌ 未找到 Ghostscript")
+        return 1
+    print(f"✓ Ghostscript: {gs_version}")
+    print(f"✓ CPU核心数: {os.cpu_count()}")
+
+    os.chdir(args.directory)
+    eps_files = get_eps_files()
+    if not eps_files:
+        print(f"\n❌ 目录下没有找到EPS文件: {Path.cwd()}")
+        return 1
+
+    sample = pick_sample(eps_files, args.sample)
+    print(f"\n样本 ({len(sample)}/{len(eps_files)} 个文件, {args.dpi} DPI):")
+    for eps_file in sample:
+        print(f"  - {eps_file.name} ({eps_file.stat().st_size / 1024:.1f} KB)")
+    print()
+
+    try:
+        params, base_time, best_time = tune(sample, gs_path, args.dpi,
+                                            args.repeat, args.passes)
+    except RuntimeError as e:
+        print(f"❌ {e}")
+        return 1
+
+    speedup = base_time / best_time if best_time else 1.0
+    print("\n" + "=" * 60)
+    print(f"最佳参数: {_describe(params)}")
+    print(f"吞吐量: {len(sample) / base_time:.2f} -> {len(sample) / best_time:.2f} 文件/秒 "
+          f"({speedup:.2f}x)")
+
+    if args.dry_run:
+        print("(--dry-run: 未保存配置)")
+        return 0
+
+    meta = {
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'ghostscript': gs_version,
+        'cpu_count': os.cpu_count(),
+        'machine': platform.machine(),
+        'dpi': args.dpi,
+        'sample_files': len(sample),
+        'baseline_seconds': round(base_time, 4),
+        'tuned_seconds': round(best_time, 4),
+    }
+    path = save_gs_profile(params, meta)
+    print(f"✓ 本机配置已保存: {path}")
+    print("  转换脚本会自动加载此配置；删除该文件即可恢复默认参数")
+    return 0
+
+
+if __name__ == "__main__":
+    try:
+        sys.exit(main())
+    except KeyboardInterrupt:
+        print("\n\n操作被用户中断")
+        sys.exit(130)
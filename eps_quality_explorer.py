@@ -0,0 +1,274 @@
+#!/usr/bin/env python3
+"""
+EPS 渲染质量/速度探索工具
+在一组设置（DPI、降采样倍数、抗锯齿位数）下渲染样本文件，
+用SSIM/PSNR与高DPI参考图比较，并输出 渲染时间/文件大小 - 质量 的帕累托前沿
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import itertools
+import tempfile
+import contextlib
+from pathlib import Path
+
+from eps_core import find_ghostscript, get_eps_files
+from eps_to_high_quality_png import convert_eps_to_png
+
+try:
+    import numpy as np
+    from PIL import Image
+except ImportError:
+    np = None
+    Image = None
+
+SSIM_WINDOW = 7
+SSIM_C1 = (0.01 * 255) ** 2
+SSIM_C2 = (0.03 * 255) ** 2
+STRIP_ROWS = 512  # 分条计算，限制大图的内存占用
+
+
+# ---------------------------------------------------------------- 质量评分
+
+def _box_mean(a, w):
+    """用积分图计算 w×w 窗口均值（valid模式）"""
+    ii = np.zeros((a.shape[0] + 1, a.shape[1] + 1), dtype=np.float64)
+    np.cumsum(np.cumsum(a, axis=0, dtype=np.float64), axis=1, out=ii[1:, 1:])
+    s = ii[w:, w:] - ii[:-w, w:] - ii[w:, :-w] + ii[:-w, :-w]
+    return s / (w * w)
+
+
+def _ssim_map(x, y, w=SSIM_WINDOW):
+    """计算一个条带的SSIM图"""
+    mu_x = _box_mean(x, w)
+    mu_y = _box_mean(y, w)
+    xx = _box_mean(x * x, w) - mu_x * mu_x
+    yy = _box_mean(y * y, w) - mu_y * mu_y
+    xy = _box_mean(x * y, w) - mu_x * mu_y
+    num = (2 * mu_x * mu_y + SSIM_C1) * (2 * xy + SSIM_C2)
+    den = (mu_x * mu_x + mu_y * mu_y + SSIM_C1) * (xx + yy + SSIM_C2)
+    return num / den
+
+
+def score_images(candidate, reference):
+    """返回 (SSIM, PSNR)，两个输入均为同尺寸的灰度float32数组"""
+    h = reference.shape[0]
+    w = SSIM_WINDOW
+    ssim_sum = 0.0
+    ssim_count = 0
+    sq_err = 0.0
+
+    for y0 in range(0, h, STRIP_ROWS):
+        # PSNR: 不重叠的条带
+        y1 = min(h, y0 + STRIP_ROWS)
+        diff = candidate[y0:y1] - reference[y0:y1]
+        sq_err += float(np.square(diff, dtype=np.float64).sum())
+
+        # SSIM: 条带向下多取 w-1 行，保证窗口覆盖完整
+        if y0 > h - w:
+            continue
+        y1 = min(h, y0 + STRIP_ROWS + w - 1)
+        m = _ssim_map(candidate[y0:y1], reference[y0:y1], w)
+        ssim_sum += float(m.sum())
+        ssim_count += m.size
+
+    mse = sq_err / reference.size
+    psnr = float('inf') if mse == 0 else 10 * np.log10(255.0 ** 2 / mse)
+    ssim = ssim_sum / ssim_count if ssim_count else 1.0
+    return ssim, psnr
+
+
+def load_gray(png_file, size=None):
+    """读取PNG为灰度数组，size 指定时用双三次插值缩放到参考尺寸"""
+    with Image.open(png_file) as img:
+        img = img.convert('L')
+        if size is not None and img.size != size:
+            img = img.resize(size, Image.Resampling.BICUBIC)
+        return np.asarray(img, dtype=np.float32)
+
+
+# ---------------------------------------------------------------- 渲染网格
+
+def build_grid(dpis, downscales, alpha_bits):
+    """生成设置组合"""
+    grid = []
+    for dpi, factor, alpha in itertools.product(dpis, downscales, alpha_bits):
+        grid.append({'dpi': dpi, 'downscale': factor, 'alpha': alpha})
+    return grid
+
+
+def setting_label(setting):
+    return f"{setting['dpi']}dpi ds{setting['downscale']} a{setting['alpha']}"
+
+
+def render(eps_file, gs_path, setting, png_file):
+    """按设置渲染，返回耗时秒（失败返回None）
+
+    DownScaleFactor 为 f 时以 dpi×f 渲染再降采样，输出仍为 dpi
+    """
+    params = {
+        'TextAlphaBits': setting['alpha'],
+        'GraphicsAlphaBits': setting['alpha'],
+        'DownScaleFactor': setting['downscale'],
+    }
+    render_dpi = setting['dpi'] * setting['downscale']
+    t0 = time.perf_counter()
+    with open(os.devnull, 'w', encoding='utf-8') as devnull, \
+            contextlib.redirect_stdout(devnull):
+        ok = convert_eps_to_png(eps_file, gs_path, render_dpi,
+                                png_file=png_file, render_params=params)
+    elapsed = time.perf_counter() - t0
+    return elapsed if ok else None
+
+
+def explore(sample, gs_path, grid, reference_setting, work_dir):
+    """渲染参考图和所有设置，返回每个设置的汇总结果"""
+    totals = {setting_label(s): {'setting': s, 'time_s': 0.0, 'bytes': 0,
+                                 'ssim': [], 'psnr': [], 'failed': 0}
+              for s in grid}
+
+    for n, eps_file in enumerate(sample, 1):
+        print(f"\n[{n}/{len(sample)}] {eps_file.name}")
+        ref_png = Path(work_dir) / 'reference.png'
+        if render(eps_file, gs_path, reference_setting, ref_png) is None:
+            print("  ❌ 参考图渲染失败，跳过此文件")
+            continue
+        reference = load_gray(ref_png)
+        ref_size = (reference.shape[1], reference.shape[0])
+
+        for setting in grid:
+            label = setting_label(setting)
+            entry = totals[label]
+            png_file = Path(work_dir) / 'candidate.png'
+            elapsed = render(eps_file, gs_path, setting, png_file)
+            if elapsed is None:
+                entry['failed'] += 1
+                print(f"  {label:<22} ❌ 渲染失败")
+                continue
+            size = png_file.stat().st_size
+            ssim, psnr = score_images(load_gray(png_file, ref_size), reference)
+            png_file.unlink()
+            entry['time_s'] += elapsed
+            entry['bytes'] += size
+            entry['ssim'].append(ssim)
+            entry['psnr'].append(psnr)
+            print(f"  {label:<22} {elapsed:7.2f}s {size / 1024:9.1f} KB  "
+                  f"SSIM {ssim:.4f}  PSNR {psnr:6.2f} dB")
+        ref_png.unlink()
+
+    results = []
+    for label, entry in totals.items():
+        if not entry['ssim'] or entry['failed']:
+            continue
+        results.append({
+            'label': label,
+            **entry['setting'],
+            'time_s': entry['time_s'],
+            'bytes': entry['bytes'],
+            'ssim_mean': sum(entry['ssim']) / len(entry['ssim']),
+            'ssim_min': min(entry['ssim']),
+            'psnr_mean': sum(entry['psnr']) / len(entry['psnr']),
+        })
+    return results
+
+
+def pareto_front(results, cost_keys=('time_s', 'bytes'), quality_key='ssim_mean'):
+    """标记帕累托最优：没有其他设置在成本和质量上同时不差且至少一项更好"""
+    for r in results:
+        r['pareto'] = True
+        for other in results:
+            if other is r:
+                continue
+            not_worse = (all(other[k] <= r[k] for k in cost_keys)
+                         and other[quality_key] >= r[quality_key])
+            better = (any(other[k] < r[k] for k in cost_keys)
+                      or other[quality_key] > r[quality_key])
+            if not_worse and better:
+                r['pareto'] = False
+                break
+    return [r for r in results if r['pareto']]
+
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description="EPS 渲染质量/速度探索")
+    parser.add_argument('directory', nargs='?', default='.', help="EPS样本所在目录")
+    parser.add_argument('--sample', type=int, default=3, help="样本文件数")
+    parser.add_argument('--dpi', type=int, nargs='+', default=[300, 450, 600, 900])
+    parser.add_argument('--downscale', type=int, nargs='+', default=[1, 2])
+    parser.add_argument('--alpha', type=int, nargs='+', default=[2, 4], choices=[1, 2, 4])
+    parser.add_argument('--ref-dpi', type=int, default=900, help="参考图DPI")
+    parser.add_argument('--ref-downscale', type=int, default=2, help="参考图降采样倍数")
+    parser.add_argument('--target-ssim', type=float, default=0.99, help="推荐设置的最低SSIM")
+    parser.add_argument('-o', '--output', help="结果JSON文件")
+    args = parser.parse_args()
+
+    print("EPS 渲染质量/速度探索")
+    print("=" * 60)
+
+    if np is None:
+        print("❌ 需要 NumPy 和 PIL/Pillow: pip install numpy Pillow")
+        return 1
+
+    gs_path, gs_version = find_ghostscript()
+    if not gs_path:
+        print("❌ 未找到 Ghostscript")
+        return 1
+    print(f"✓ Ghostscript: {gs_version}")
+
+    output = Path(args.output).resolve() if args.output else None
+    os.chdir(args.directory)
+    eps_files = get_eps_files()
+    if not eps_files:
+        print(f"\n❌ 目录下没有找到EPS文件: {Path.cwd()}")
+        return 1
+    sample = eps_files[:args.sample]
+
+    grid = build_grid(args.dpi, args.downscale, args.alpha)
+    reference = {'dpi': args.ref_dpi, 'downscale': args.ref_downscale, 'alpha': 4}
+    print(f"样本: {len(sample)} 个文件, 设置组合: {len(grid)} 个")
+    print(f"参考图: {setting_label(reference)}（候选图放大到参考尺寸后评分）")
+
+    with tempfile.TemporaryDirectory(prefix='eps_quality_') as work_dir:
+        results = explore(sample, gs_path, grid, reference, work_dir)
+
+    if not results:
+        print("\n❌ 没有可用的结果")
+        return 1
+
+    front = pareto_front(results)
+    results.sort(key=lambda r: r['time_s'])
+
+    print("\n" + "=" * 60)
+    print(f"{'设置':<22} {'时间':>8} {'大小':>10} {'SSIM均值':>9} {'SSIM最低':>9} {'PSNR':>8}")
+    for r in results:
+        mark = "★" if r['pareto'] else " "
+        print(f"{mark}{r['label']:<21} {r['time_s']:7.2f}s {r['bytes'] / 1024:8.0f}KB "
+              f"{r['ssim_mean']:9.4f} {r['ssim_min']:9.4f} {r['psnr_mean']:7.2f}")
+    print(f"\n★ = 帕累托前沿 ({len(front)} 个设置)")
+
+    good = [r for r in front if r['ssim_min'] >= args.target_ssim]
+    if good:
+        best = min(good, key=lambda r: r['time_s'])
+        print(f"✓ 推荐: {best['label']} (最低SSIM ≥ {args.target_ssim} 中最快)")
+    else:
+        print(f"⚠ 没有设置的最低SSIM达到 {args.target_ssim}")
+
+    if output:
+        data = {'ghostscript': gs_version, 'reference': reference,
+                'sample': [f.name for f in sample], 'results': results}
+        output.write_text(json.dumps(data, indent=2, ensure_ascii=False),
+                                     encoding='utf-8')
+        print(f"✓ 结果已保存: {output}")
+    return 0
+
+
+if __name__ == "__main__":
+    try:
+        sys.exit(main())
+    except KeyboardInterrupt:
+        print("\n\n操作被用户中断")
+        sys.exit(130)
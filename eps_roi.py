@@ -0,0 +1,256 @@
+#!/usr/bin/env python3
+"""
+EPS 局部区域高DPI渲染
+只渲染指定的矩形区域：每个区域设置对应的页面尺寸并平移坐标，使区域落在页面原点，
+渲染代价只与区域面积有关，而不是整页面积。一个文件的多个区域在同一个 Ghostscript 进程中
+逐页输出，进程启动和字体加载只有一次
+
+区域坐标（左下 x0 y0，右上 x1 y1，单位点，y 向上，与 %%BoundingBox 一致）:
+    bbox      相对于 BoundingBox 左下角（即 -dEPSCrop 整图上的位置）
+    page      PostScript 页面绝对坐标（与 %%BoundingBox 中的数值相同）
+    fraction  BoundingBox 的比例，0-1
+
+用法:
+    python eps_roi.py figure.eps --region 100,200,180,260 --dpi 900
+    python eps_roi.py figure.eps --region 0.5,0.5,1,1 --region 0,0,0.25,0.25 --coords fraction
+    python eps_roi.py *.eps --region 10,10,90,90 --coords page -o detail.png
+"""
+
+import os
+import re
+import sys
+import math
+import argparse
+import subprocess
+from pathlib import Path
+
+from eps_core import find_ghostscript
+from gs_profile import resolve_render_params, render_args
+from font_index import font_args
+from batch_journal import partial_path
+from tool_sandbox import run_limited, estimate_limits, reap_orphans, MIN_CPU_SECONDS
+from output_layout import output_path, prepare_output, commit_output, discard_output
+
+COORDS = ('bbox', 'page', 'fraction')
+TIMEOUT = 180
+TIMEOUT_PER_REGION = 30        # 每多一个区域，EPS要多执行一遍
+MAX_REGION_PIXELS = 400_000_000
+
+_BBOX_RE = re.compile(rb'%%(HiRes)?BoundingBox:\s*(\(atend\)|(-?[\d.]+)\s+(-?[\d.]+)\s+'
+                      rb'(-?[\d.]+)\s+(-?[\d.]+))')
+
+
+def read_bbox(eps_file):
+    """读取 BoundingBox（优先 HiResBoundingBox，支持 (atend)），返回 (x0, y0, x1, y1) 点；没有时返回None"""
+    with open(eps_file, 'rb') as f:
+        head = f.read(64 * 1024)
+        f.seek(0, os.SEEK_END)
+        size = f.tell()
+        f.seek(max(0, size - 64 * 1024))
+        tail = f.read()
+
+    found = {}
+    for data in (head, tail):
+        for match in _BBOX_RE.finditer(data):
+            if match.group(3) is None:
+                continue  # (atend)，实际数值在文件末尾
+            key = 'hires' if match.group(1) else 'plain'
+            found.setdefault(key, tuple(float(v) for v in match.groups()[2:]))
+    return found.get('hires') or found.get('plain')
+
+
+def parse_region(text):
+    """'x0,y0,x1,y1' -> 元组"""
+    try:
+        values = tuple(float(v) for v in re.split(r'[,\s]+', text.strip()))
+    except ValueError:
+        values = ()
+    if len(values) != 4:
+        raise ValueError(f"区域格式应为 x0,y0,x1,y1: {text}")
+    return values
+
+
+def to_page_coords(region, coords, bbox):
+    """把区域换算为页面绝对坐标（点）"""
+    x0, y0, x1, y1 = region
+    if coords == 'page':
+        result = (x0, y0, x1, y1)
+    else:
+        if bbox is None:
+            raise ValueError("EPS 没有 %%BoundingBox，只能使用 page 坐标")
+        bx0, by0, bx1, by1 = bbox
+        if coords == 'fraction':
+            w, h = bx1 - bx0, by1 - by0
+            result = (bx0 + x0 * w, by0 + y0 * h, bx0 + x1 * w, by0 + y1 * h)
+        else:
+            result = (bx0 + x0, by0 + y0, bx0 + x1, by0 + y1)
+    if result[2] <= result[0] or result[3] <= result[1]:
+        raise ValueError(f"区域为空: {region}")
+    return result
+
+
+def region_pixels(region, dpi):
+    """区域的设备像素尺寸（向上取整，保证覆盖整个区域）"""
+    x0, y0, x1, y1 = region
+    return max(1, math.ceil((x1 - x0) * dpi / 72 - 1e-6)), max(1, math.ceil((y1 - y0) * dpi / 72 - 1e-6))
+
+
+def build_roi_command(eps_file, out_pattern, gs_path, regions, dpi, render_params=None):
+    """所有区域在一次 Ghostscript 调用中逐页渲染
+
+    每页先 setpagedevice 设置区域大小（会重置坐标变换），再平移使区域左下角落在原点，然后执行EPS。
+    按 EPSF 规范把 showpage 重定义为空操作，由我们在每个区域之后输出一页；
+    每次执行EPS都包在 save/restore 中，并清理它留在操作数栈和字典栈上的内容，
+    EPS重定义的操作符、修改的全局状态不会影响后面的区域；
+    -dNOEPS 关闭 Ghostscript 对EPS的自动裁剪/自动换页，避免和这里的页面设置冲突
+    """
+    params = resolve_render_params(render_params)
+    cmd = [
+        gs_path,
+        '-dNOPAUSE',
+        '-dBATCH',
+        '-dSAFER',
+        '-dNOEPS',
+        '-sDEVICE=png16m',
+        f'-r{dpi}',
+        *render_args(params),
+        *font_args(),
+        f'-sOutputFile={out_pattern}',
+        '-c', '/EPSshowpage /showpage load def /showpage {} def',
+    ]
+    for x0, y0, x1, y1 in regions:
+        width, height = region_pixels((x0, y0, x1, y1), dpi)
+        page_w = width * 72 / dpi
+        page_h = height * 72 / dpi
+        cmd += ['-c', f'<< /PageSize [{page_w:.4f} {page_h:.4f}] >> setpagedevice '
+                      f'{-x0:.4f} {-y0:.4f} translate',
+                '-c', 'save /roi_state exch def /roi_dicts countdictstack def count /roi_ops exch def '
+                      'userdict begin',
+                '-f', str(eps_file),
+                '-c', 'EPSshowpage count roi_ops sub {pop} repeat '
+                      'countdictstack roi_dicts sub {end} repeat roi_state restore']
+    return cmd
+
+
+def roi_limits(eps_file, regions, dpi, timeout):
+    """按区域面积预估资源上限：内存按最大的区域，CPU按所有区域之和"""
+    try:
+        file_size = os.path.getsize(eps_file)
+    except OSError:
+        file_size = 0
+    per_region = [estimate_limits(file_size, dpi, ((x1 - x0) / 72, (y1 - y0) / 72), timeout=timeout)
+                  for x0, y0, x1, y1 in regions]
+    return {
+        'memory_bytes': max(l['memory_bytes'] for l in per_region),
+        'cpu_seconds': min(timeout, MIN_CPU_SECONDS + sum(l['cpu_seconds'] for l in per_region)),
+    }
+
+
+def roi_output_path(eps_file, index, output=None):
+    """第 index 个区域的输出路径：默认按输出布局放在 <名称>.roi<N>.png"""
+    if output:
+        output = Path(output)
+        return output if index == 1 else output.with_name(f"{output.stem}.{index}{output.suffix}")
+    return output_path(eps_file, f'.roi{index}.png')
+
+
+def render_regions(eps_file, regions, gs_path, dpi=900, coords='bbox', output=None,
+                   render_params=None):
+    """渲染一个EPS文件的多个区域，返回输出文件列表；失败时抛出异常，不留下部分输出
+
+    regions 为 (x0, y0, x1, y1) 列表，坐标含义见 coords；output 指定输出文件名（多个区域时自动编号）
+    """
+    eps_file = Path(eps_file)
+    bbox = read_bbox(eps_file) if coords != 'page' else None
+    page_regions = [to_page_coords(r, coords, bbox) for r in regions]
+    for r in page_regions:
+        width, height = region_pixels(r, dpi)
+        if width * height > MAX_REGION_PIXELS:
+            raise ValueError(f"区域过大: {width}x{height} 像素，请缩小区域或降低DPI")
+
+    outputs = [roi_output_path(eps_file, i, output) for i in range(1, len(regions) + 1)]
+    tmp_first = prepare_output(outputs[0])
+    for out_file in outputs[1:]:
+        prepare_output(out_file)
+    # Ghostscript 按页号写入同目录的临时文件，完成后逐个原子替换为最终输出
+    pattern = tmp_first.with_name(f".{eps_file.stem}.roi{os.getpid()}-%d.png")
+    pages = [Path(str(pattern).replace('%d', str(i))) for i in range(1, len(regions) + 1)]
+    timeout = TIMEOUT + TIMEOUT_PER_REGION * (len(regions) - 1)
+    cmd = build_roi_command(eps_file, pattern, gs_path, page_regions, dpi, render_params)
+    try:
+        run_limited(cmd, timeout=timeout,
+                    limits=roi_limits(eps_file, page_regions, dpi, timeout), check=True)
+        missing = [p.name for p in pages if not p.exists()]
+        if missing:
+            raise RuntimeError(f"Ghostscript 未输出全部区域（缺少 {len(missing)} 页）")
+        # 先把所有页放到各自的临时输出并检查，全部就绪后才替换最终输出：要么全部更新，要么都不动
+        for page, out_file in zip(pages, outputs):
+            if page.stat().st_size == 0:
+                raise RuntimeError(f"Ghostscript 输出了空白页: {out_file.name}")
+            os.replace(page, partial_path(out_file))
+        for out_file in outputs:
+            commit_output(eps_file, out_file, record=output is None)
+    finally:
+        for page in pages:
+            try:
+                page.unlink()
+            except FileNotFoundError:
+                pass
+        for out_file in outputs:
+            discard_output(out_file)
+    return outputs
+
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description="EPS 局部区域高DPI渲染")
+    parser.add_argument('eps_files', nargs='+', help="EPS文件")
+    parser.add_argument('--region', action='append', required=True, type=parse_region,
+                        metavar='X0,Y0,X1,Y1', help="渲染区域，可重复指定多个")
+    parser.add_argument('--coords', choices=COORDS, default='bbox',
+                        help="区域坐标: bbox=相对BoundingBox左下角(点), page=页面绝对坐标(点), "
+                             "fraction=BoundingBox比例")
+    parser.add_argument('--dpi', type=int, default=900)
+    parser.add_argument('-o', '--output', help="输出文件名（只有一个EPS时可用；多个区域自动编号）")
+    args = parser.parse_args()
+
+    if args.output and len(args.eps_files) > 1:
+        print("❌ -o 只能用于单个EPS文件")
+        return 1
+
+    print("EPS 局部区域渲染")
+    print("=" * 60)
+    reap_orphans()
+    gs_path, gs_version = find_ghostscript()
+    if not gs_path:
+        print("❌ 未找到 Ghostscript")
+        return 1
+    print(f"✓ Ghostscript: {gs_version}")
+
+    failed = 0
+    for eps_file in map(Path, args.eps_files):
+        try:
+            outputs = render_regions(eps_file, args.region, gs_path, args.dpi, args.coords,
+                                     args.output)
+        except subprocess.TimeoutExpired:
+            print(f"❌ {eps_file.name}: 转换超时")
+            failed += 1
+            continue
+        except subprocess.CalledProcessError as e:
+            lines = [l.strip() for l in (e.stderr or '').splitlines()
+                     if l.strip() and not l.startswith('GPL')]
+            error = next((l for l in lines if 'Error' in l), f"返回码 {e.returncode}")
+            print(f"❌ {eps_file.name}: {error}")
+            failed += 1
+            continue
+        except (ValueError, RuntimeError, OSError) as e:
+            print(f"❌ {eps_file.name}: {e}")
+            failed += 1
+            continue
+        for out_file in outputs:
+            print(f"✓ {eps_file.name} -> {out_file.name} ({out_file.stat().st_size / 1024:.1f} KB)")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,463 @@
+#!/usr/bin/env python3
+"""
+EPS 本地转换服务
+常驻的 HTTP 服务，启动时完成一次工具探测，之后由固定数量的渲染线程处理请求：
+按 内容哈希 + 参数 + 工具版本 缓存结果，相同的并发请求合并为一次渲染，结果分块流式返回。
+渲染按优先级通道调度（lane_scheduler）：priority=bulk 的批量请求按权重分享渲染线程，
+interactive（默认）保留线程，必要时暂停正在运行的 bulk 渲染
+
+接口:
+    POST /convert?format=png&dpi=450      请求体为EPS内容
+    GET  /convert?path=/abs/fig.eps&format=svg&scale=3&priority=bulk
+    GET  /stats                           请求数、缓存命中、p50/p99 延迟（总体和各通道）
+    GET  /health
+
+示例:
+    python eps_service.py --port 8765 -j 4 --reserved 1
+    curl --data-binary @fig.eps 'http://127.0.0.1:8765/convert?format=png&dpi=300' -o fig.png
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import hashlib
+import argparse
+import tempfile
+import itertools
+import threading
+import subprocess
+from pathlib import Path
+from collections import deque, OrderedDict
+from urllib.parse import urlparse, parse_qs
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from eps_core import find_ghostscript
+from eps_archive import build_stream_command, postscript_chunks, TIMEOUTS
+from gs_profile import load_gs_profile
+from failure_cache import classify_failure, tool_fingerprint, is_permanent, FAILURE_LABELS
+from font_index import fontmap_file
+from lane_scheduler import (LANES, DEFAULT_LANE, create_scheduler, submit, promote,
+                            lane_snapshot, shutdown_scheduler)
+from output_layout import prepare_output, commit_output, discard_output
+from tool_sandbox import run_streaming, estimate_limits, parse_bbox_inches, reap_orphans
+
+CHUNK_SIZE = 1024 * 1024
+UPLOAD_SPOOL = 16 * 1024 * 1024       # 上传内容超过此大小时落到临时文件
+MAX_UPLOAD = 512 * 1024 * 1024
+LATENCY_WINDOW = 10000                # 统计延迟使用最近若干个请求
+FAILURE_MEMORY = 10000                # 记住最近若干个确定失败的缓存键，避免反复渲染
+CONTENT_TYPES = {'png': 'image/png', 'svg': 'image/svg+xml'}
+
+
+def default_cache_dir():
+    return Path.home() / '.eps_converter' / 'service_cache'
+
+
+def percentile(sorted_values, pct):
+    """最近秩法百分位数"""
+    if not sorted_values:
+        return None
+    rank = max(int(round(pct / 100 * len(sorted_values) + 0.5)) - 1, 0)
+    return round(sorted_values[min(rank, len(sorted_values) - 1)], 1)
+
+
+# ---------------------------------------------------------------- 服务状态
+
+def create_state(gs_path, cache_dir, workers=4, cache_limit_mb=2048, allowed_root=None,
+                 reserved=None):
+    """服务的共享状态：渲染调度器、进行中的渲染、缓存占用和统计
+
+    reserved 为 interactive 通道保留的渲染线程数（默认见 lane_scheduler.LANES）
+    """
+    cache_dir = Path(cache_dir)
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    state = {
+        'gs_path': gs_path,
+        'fingerprint': tool_fingerprint([gs_path, fontmap_file()], scope='service'),
+        'profile': json.dumps(load_gs_profile(), sort_keys=True),
+        'cache_dir': cache_dir,
+        'cache_limit': cache_limit_mb * 1024 * 1024,
+        'cache_bytes': 0,
+        'allowed_root': Path(allowed_root).resolve() if allowed_root else None,
+        'scheduler': create_scheduler(workers, None if reserved is None
+                                      else {DEFAULT_LANE: reserved}),
+        'workers': workers,
+        'lock': threading.Lock(),
+        'inflight': {},                 # 缓存键 -> Future（请求合并）
+        'failures': OrderedDict(),      # 缓存键 -> (分类, 详情)，只记确定的失败
+        'latency': {},                  # 结果类型 -> deque(毫秒)
+        'lane_latency': {},             # 通道 -> deque(毫秒)
+        'counts': {},
+        'started': time.time(),
+    }
+    state['cache_bytes'] = sum(p.stat().st_size for p in cache_dir.rglob('*.*')
+                               if not p.name.startswith('.'))
+    return state
+
+
+def record_latency(state, outcome, ms, lane=DEFAULT_LANE):
+    with state['lock']:
+        state['counts'][outcome] = state['counts'].get(outcome, 0) + 1
+        window = state['latency'].setdefault(outcome, deque(maxlen=LATENCY_WINDOW))
+        window.append(ms)
+        state['lane_latency'].setdefault(lane, deque(maxlen=LATENCY_WINDOW)).append(ms)
+
+
+def stats_snapshot(state):
+    """各类请求的数量和 p50/p99 延迟（毫秒）；lanes 为各通道的请求延迟、排队等待和渲染时间"""
+    with state['lock']:
+        windows = {k: sorted(v) for k, v in state['latency'].items()}
+        lane_windows = {k: sorted(v) for k, v in state['lane_latency'].items()}
+        counts = dict(state['counts'])
+        inflight = len(state['inflight'])
+        cache_bytes = state['cache_bytes']
+    all_values = sorted(itertools.chain.from_iterable(windows.values()))
+    by_outcome = {k: {'count': counts.get(k, 0), 'p50_ms': percentile(v, 50),
+                      'p99_ms': percentile(v, 99)} for k, v in windows.items()}
+    lanes = {}
+    for name, info in lane_snapshot(state['scheduler']).items():
+        requests = lane_windows.get(name, [])
+        wait, run = info.pop('wait_ms'), info.pop('run_ms')
+        lanes[name] = dict(info,
+                           requests=len(requests),
+                           p50_ms=percentile(requests, 50), p99_ms=percentile(requests, 99),
+                           wait_p50_ms=percentile(wait, 50), wait_p99_ms=percentile(wait, 99),
+                           render_p50_ms=percentile(run, 50), render_p99_ms=percentile(run, 99))
+    return {
+        'uptime_s': round(time.time() - state['started'], 1),
+        'requests': sum(counts.values()),
+        'p50_ms': percentile(all_values, 50),
+        'p99_ms': percentile(all_values, 99),
+        'by_outcome': by_outcome,
+        'lanes': lanes,
+        'inflight_renders': inflight,
+        'workers': state['workers'],
+        'cache_mb': round(cache_bytes / 1024 / 1024, 1),
+    }
+
+
+# ---------------------------------------------------------------- 缓存与渲染
+
+def cache_key(state, digest, fmt, dpi, scale_factor):
+    param = dpi if fmt == 'png' else scale_factor
+    raw = f"{digest}:{fmt}:{param}:{state['fingerprint']}:{state['profile']}"
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+def cache_file_for(state, key, fmt):
+    return state['cache_dir'] / key[:2] / f"{key}.{fmt}"
+
+
+def evict_cache(state):
+    """缓存超过上限时按修改时间删除最旧的文件（命中时会更新修改时间）"""
+    with state['lock']:
+        if state['cache_bytes'] <= state['cache_limit']:
+            return
+    files = [(p.stat().st_mtime, p.stat().st_size, p) for p in state['cache_dir'].rglob('*.*')
+             if not p.name.startswith('.')]
+    files.sort()
+    with state['lock']:
+        total = sum(size for _, size, _ in files)
+        target = state['cache_limit'] * 0.9
+        for _, size, path in files:
+            if total <= target:
+                break
+            try:
+                path.unlink()
+                total -= size
+            except FileNotFoundError:
+                pass
+        state['cache_bytes'] = total
+
+
+def render_to_cache(state, source, size, out_file, fmt, dpi, scale_factor):
+    """渲染到缓存文件，返回 (是否成功, 失败分类, 详情)；source 为可读的二进制文件对象"""
+    chunks = postscript_chunks(source, CHUNK_SIZE)
+    head = next(chunks, b'')
+    if not head:
+        return False, 'corrupt_header', "empty input"
+
+    cmd = build_stream_command(state['gs_path'], fmt, dpi, scale_factor)
+    limits = estimate_limits(size, dpi if fmt == 'png' else None, parse_bbox_inches(head),
+                             timeout=TIMEOUTS[fmt])
+    tmp_file = prepare_output(out_file)
+    try:
+        with open(tmp_file, 'wb') as sink:
+            result = run_streaming(cmd, itertools.chain([head], chunks), sink,
+                                   timeout=TIMEOUTS[fmt], limits=limits)
+    except Exception as e:
+        discard_output(out_file)
+        timed_out = isinstance(e, subprocess.TimeoutExpired)
+        failure_class, detail = classify_failure(getattr(e, 'stderr', None) or str(e), timed_out)
+        return False, failure_class, detail
+
+    if result.returncode != 0:
+        discard_output(out_file)
+        failure_class, detail = classify_failure(result.stderr)
+        return False, failure_class, detail
+    written = commit_output(None, out_file, record=False)
+    if written == 0:
+        return False, 'unknown', "empty output"
+    with state['lock']:
+        state['cache_bytes'] += written
+    evict_cache(state)
+    return True, None, None
+
+
+def get_or_render(state, digest, open_source, size, fmt, dpi, scale_factor, lane=DEFAULT_LANE):
+    """返回 (结果类型, 缓存文件或失败信息)
+
+    结果类型: hit（缓存命中）/ render（本请求渲染）/ coalesced（与进行中的相同请求合并）/ failed
+    open_source() 返回源内容的文件对象，只有真正需要渲染时才会调用；
+    lane 为调度通道，合并到还在排队的低优先级渲染时会把它提到 lane
+    """
+    key = cache_key(state, digest, fmt, dpi, scale_factor)
+    out_file = cache_file_for(state, key, fmt)
+
+    with state['lock']:
+        known = state['failures'].get(key)
+        future = state['inflight'].get(key)
+        leader = cached = False
+        if known is None and future is None:
+            if out_file.exists():
+                cached = True
+            else:
+                leader = True
+
+                def job():
+                    try:
+                        with open_source() as source:
+                            return render_to_cache(state, source, size, out_file,
+                                                   fmt, dpi, scale_factor)
+                    except OSError as e:
+                        return False, 'ioerror', str(e)
+
+                future = submit(state['scheduler'], lane, job)
+                state['inflight'][key] = future
+
+    if known is not None:
+        return 'failed', known
+    if cached:
+        try:
+            os.utime(out_file)  # 供淘汰时判断最近使用
+        except FileNotFoundError:
+            # 刚好被淘汰，重新渲染
+            return get_or_render(state, digest, open_source, size, fmt, dpi, scale_factor, lane)
+        return 'hit', out_file
+    if not leader:
+        promote(state['scheduler'], future, lane)
+
+    try:
+        ok, failure_class, detail = future.result()
+        # 超时、读写错误、资源不足可能只是当时负载过高，不记住，下次请求重新渲染
+        if leader and not ok and is_permanent(failure_class):
+            with state['lock']:
+                state['failures'][key] = (failure_class, detail)
+                while len(state['failures']) > FAILURE_MEMORY:
+                    state['failures'].popitem(last=False)
+    finally:
+        if leader:
+            with state['lock']:
+                state['inflight'].pop(key, None)
+
+    if not ok:
+        return 'failed', (failure_class, detail)
+    return ('render' if leader else 'coalesced'), out_file
+
+
+# ---------------------------------------------------------------- HTTP
+
+class ConversionHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    server_version = 'EPSService/1.0'
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def send_json(self, status, data):
+        body = json.dumps(data, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def parse_options(self, query):
+        fmt = query.get('format', ['png'])[0]
+        if fmt not in CONTENT_TYPES:
+            raise ValueError(f"format 只支持 {', '.join(CONTENT_TYPES)}")
+        dpi = int(query.get('dpi', ['450'])[0])
+        scale_factor = float(query.get('scale', ['3'])[0])
+        if not 10 <= dpi <= 2400 or not 0.1 <= scale_factor <= 20:
+            raise ValueError("dpi 或 scale 超出范围")
+        lane = query.get('priority', [DEFAULT_LANE])[0]
+        if lane not in LANES:
+            raise ValueError(f"priority 只支持 {', '.join(LANES)}")
+        return fmt, dpi, scale_factor, lane
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        state = self.server.state
+        if url.path == '/health':
+            self.send_json(200, {'ok': True})
+        elif url.path == '/stats':
+            self.send_json(200, stats_snapshot(state))
+        elif url.path == '/convert':
+            query = parse_qs(url.query)
+            if 'path' not in query:
+                self.send_json(400, {'error': "GET /convert 需要 path 参数（或使用POST上传内容）"})
+                return
+            eps_file = Path(query['path'][0]).resolve()
+            root = state['allowed_root']
+            if root is not None and root not in eps_file.parents:
+                self.send_json(403, {'error': f"只允许访问 {root} 下的文件"})
+                return
+            if not eps_file.is_file():
+                self.send_json(404, {'error': f"文件不存在: {eps_file}"})
+                return
+            self.convert(query, self.hash_file(eps_file), eps_file.stat().st_size,
+                         lambda: open(eps_file, 'rb'))
+        else:
+            self.send_json(404, {'error': "未知路径"})
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        if url.path != '/convert':
+            self.send_json(404, {'error': "未知路径"})
+            return
+        length = int(self.headers.get('Content-Length') or 0)
+        if length <= 0:
+            self.send_json(411, {'error': "需要 Content-Length 和EPS内容"})
+            return
+        if length > MAX_UPLOAD:
+            self.send_json(413, {'error': f"上传内容超过 {MAX_UPLOAD // 1024 // 1024} MB"})
+            self.close_connection = True
+            return
+
+        # 边接收边计算哈希；小文件留在内存，大文件落盘
+        spool = tempfile.SpooledTemporaryFile(max_size=UPLOAD_SPOOL)
+        h = hashlib.sha256()
+        remaining = length
+        while remaining > 0:
+            chunk = self.rfile.read(min(CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            h.update(chunk)
+            spool.write(chunk)
+            remaining -= len(chunk)
+        if remaining:
+            spool.close()
+            self.close_connection = True
+            return
+
+        def open_spool():
+            spool.seek(0)
+            return spool
+
+        try:
+            self.convert(parse_qs(url.query), h.hexdigest(), length, open_spool)
+        finally:
+            spool.close()
+
+    @staticmethod
+    def hash_file(path):
+        h = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+                h.update(chunk)
+        return h.hexdigest()
+
+    def convert(self, query, digest, size, open_source):
+        t0 = time.perf_counter()
+        state = self.server.state
+        try:
+            fmt, dpi, scale_factor, lane = self.parse_options(query)
+        except ValueError as e:
+            self.send_json(400, {'error': str(e)})
+            return
+
+        outcome, result = get_or_render(state, digest, open_source, size, fmt, dpi, scale_factor,
+                                        lane)
+        if outcome == 'failed':
+            failure_class, detail = result
+            # 确定的失败 422；可能是暂时性的（超时等）503，客户端可以稍后重试
+            self.send_json(422 if is_permanent(failure_class) else 503,
+                           {'error': FAILURE_LABELS.get(failure_class, failure_class),
+                            'class': failure_class, 'detail': detail})
+        else:
+            self.stream_file(result, CONTENT_TYPES[fmt], outcome)
+        record_latency(state, outcome, (time.perf_counter() - t0) * 1000, lane)
+
+    def stream_file(self, path, content_type, outcome):
+        """分块发送缓存文件，不把整个结果读进内存"""
+        try:
+            f = open(path, 'rb')
+        except FileNotFoundError:
+            self.send_json(503, {'error': "缓存文件已被淘汰，请重试"})
+            return
+        with f:
+            self.send_response(200)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(os.fstat(f.fileno()).st_size))
+            self.send_header('X-Cache', outcome)
+            self.end_headers()
+            shutil.copyfileobj(f, self.wfile, CHUNK_SIZE)
+
+
+def make_server(host, port, state, verbose=False):
+    server = ThreadingHTTPServer((host, port), ConversionHandler)
+    server.daemon_threads = True
+    server.state = state
+    server.verbose = verbose
+    return server
+
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description="EPS 本地转换服务")
+    parser.add_argument('--host', default='127.0.0.1', help="监听地址（默认只接受本机请求）")
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('-j', '--workers', type=int, default=os.cpu_count() or 2,
+                        help="同时渲染的最大数量")
+    parser.add_argument('--reserved', type=int,
+                        help=f"为 interactive 请求保留的渲染线程数（默认 {LANES[DEFAULT_LANE]['reserved']}）")
+    parser.add_argument('--cache-dir', default=str(default_cache_dir()))
+    parser.add_argument('--cache-size', type=int, default=2048, help="缓存上限（MB）")
+    parser.add_argument('--root', help="只允许通过 path 参数访问此目录下的文件")
+    parser.add_argument('-v', '--verbose', action='store_true', help="输出访问日志")
+    args = parser.parse_args()
+
+    print("EPS 本地转换服务")
+    print("=" * 60)
+
+    reap_orphans()
+    gs_path, gs_version = find_ghostscript()
+    if not gs_path:
+        print("❌ 未找到 Ghostscript")
+        return 1
+    print(f"✓ Ghostscript: {gs_version}")
+
+    state = create_state(gs_path, args.cache_dir, args.workers, args.cache_size, args.root,
+                         args.reserved)
+    server = make_server(args.host, args.port, state, args.verbose)
+    print(f"✓ 缓存: {state['cache_dir']} ({state['cache_bytes'] / 1024 / 1024:.1f} MB)")
+    lanes = state['scheduler']['lanes']
+    print(f"✓ 渲染线程: {args.workers}  ("
+          + ", ".join(f"{name} 权重{cfg['weight']} 保留{cfg['reserved']}" for name, cfg in lanes.items())
+          + ")")
+    print(f"✓ 监听: http://{args.host}:{server.server_port}  (Ctrl-C 退出)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\n正在停止服务...")
+    finally:
+        server.server_close()
+        shutdown_scheduler(state['scheduler'])
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
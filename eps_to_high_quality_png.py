@@ -1,78 +1,211 @@
 #!/usr/bin/env python3
 
 import os
+import re
 import subprocess
 import sys
+import time
 from pathlib import Path
-import glob
-
-def find_ghostscript():
-    """查找Ghostscript"""
-    possible_paths = [
-        r"C:\Program Files\gs\gs*\bin\gswin64c.exe",
-        r"C:\Program Files (x86)\gs\gs*\bin\gswin64c.exe",
-        "gs", "gswin64c", "gswin32c"
-    ]
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from eps_core import find_ghostscript, get_eps_files, backend
+from gs_profile import resolve_render_params, render_args, load_gs_profile
+from font_index import font_args
+from tool_sandbox import run_limited, predict_limits, reap_orphans
+from output_layout import output_path, prepare_output, commit_output, discard_output
+from service_client import service_url, check_service, fetch_from_service
+
+# 渐进模式的预览：低DPI、关闭抗锯齿，几秒内给出整批结果
+PREVIEW_DPI = 72
+PREVIEW_PARAMS = {'TextAlphaBits': 1, 'GraphicsAlphaBits': 1}
+PREVIEW_TIMEOUT = 60
+PREVIEW_SUFFIX = '.preview.png'     # 预览单独存放，中断后不会被当成最终结果
+BACKGROUND_NICE = 10  # 最终渲染阶段降低的调度优先级
+
+# 自动裁剪/透明背景：Ghostscript 输出未压缩的 PPM，映射到内存中直接处理，最后只编码一次PNG
+TRIM_FUZZ = 2          # 各通道都不低于 255-TRIM_FUZZ 的像素视为背景白
+TRIM_MARGIN_PT = 2     # 裁剪后保留的白边（点）
+ROW_CHUNK = 256        # 按行分块处理，内存占用与图像高度无关
+_PPM_TOKEN = re.compile(rb'\s*(#[^\n]*\n|\S+)')
+
+# NumPy/Pillow 只在第一次自动裁剪/透明处理时导入，普通渲染和导入本模块的其他工具不付导入时间
+np = None
+Image = None
+
+def build_png_command(eps_file, png_file, gs_path, dpi=450, render_params=None,
+                      device='png16m'):
+    """构建EPS转PNG的Ghostscript命令；device='ppmraw' 时输出未压缩的像素供后处理"""
+    params = resolve_render_params(render_params)
     
-    for path_pattern in possible_paths:
-        if '*' in path_pattern:
-            matches = glob.glob(path_pattern)
-            if matches:
-                path = sorted(matches)[-1]
-            else:
-                continue
-        else:
-            path = path_pattern
-        
+    # 使用最高质量设置
+    return [
+        gs_path,
+        '-dNOPAUSE',
+        '-dBATCH',
+        '-dSAFER',
+        '-dEPSCrop',                    # 自动裁剪
+        f'-sDEVICE={device}',           # 24位真彩色
+        f'-r{dpi}',                     # 超高DPI
+        *render_args(params),           # 抗锯齿/降采样/本机调优参数
+        '-dColorConversionStrategy=/LeaveColorUnchanged',  # 保持颜色
+        *font_args(),                   # 字体索引生成的 Fontmap/FONTPATH
+        f'-sOutputFile={png_file}',
+        str(eps_file)
+    ]
+
+def load_imaging():
+    """导入 NumPy 和 Pillow，缺少时抛出 RuntimeError"""
+    global np, Image
+    if np is None:
         try:
-            result = subprocess.run([path, '--version'], 
-                                  capture_output=True, check=True, timeout=10,
-                                  encoding='utf-8', errors='ignore')
-            version = result.stdout.strip()
-            return path, version
-        except Exception:
-            continue
-    
-    return None, None
+            import numpy
+            from PIL import Image as pil_image
+        except ImportError:
+            raise RuntimeError("自动裁剪/透明背景需要 NumPy 和 Pillow (pip install numpy Pillow)")
+        np, Image = numpy, pil_image
+
+def imaging_available():
+    """不导入即可判断 NumPy 和 Pillow 是否已安装"""
+    return bool(backend('pil') and backend('tracer'))
+
+def map_ppm(ppm_file):
+    """把二进制PPM(P6)映射为 (高, 宽, 3) 的只读数组，不读入内存"""
+    with open(ppm_file, 'rb') as f:
+        header = f.read(1024)
+    # 头部: P6 宽 高 最大值，中间可能有 # 注释行（Ghostscript 会写入生成器信息）
+    tokens = []
+    pos = 0
+    while len(tokens) < 4:
+        match = _PPM_TOKEN.match(header, pos)
+        if not match:
+            raise ValueError(f"无法解析PPM头: {ppm_file}")
+        pos = match.end()
+        if not match.group(1).startswith(b'#'):
+            tokens.append(match.group(1))
+    if tokens[0] != b'P6' or tokens[3] != b'255':
+        raise ValueError(f"不支持的PPM格式: {tokens[0].decode(errors='ignore')}")
+    width, height = int(tokens[1]), int(tokens[2])
+    return np.memmap(ppm_file, dtype=np.uint8, mode='r', offset=pos + 1,
+                     shape=(height, width, 3))
+
+
+def content_bounds(pixels, fuzz=TRIM_FUZZ):
+    """非白色内容的范围 (x0, y0, x1, y1)，全白时返回None
+
+    按行分块比较，一次遍历同时得到有内容的行和列
+    """
+    height, width = pixels.shape[:2]
+    rows = np.zeros(height, dtype=bool)
+    cols = np.zeros(width, dtype=bool)
+    for start in range(0, height, ROW_CHUNK):
+        ink = (pixels[start:start + ROW_CHUNK] < 255 - fuzz).any(axis=2)
+        rows[start:start + len(ink)] = ink.any(axis=1)
+        cols |= ink.any(axis=0)
+    if not rows.any():
+        return None
+    ys = np.flatnonzero(rows)
+    xs = np.flatnonzero(cols)
+    return int(xs[0]), int(ys[0]), int(xs[-1]) + 1, int(ys[-1]) + 1
+
+
+def white_to_alpha(pixels):
+    """白色背景转透明：把每个像素看作某颜色以 alpha 覆盖在白底上，反解出颜色和 alpha
+
+    抗锯齿边缘得到对应的半透明，放在任何背景上都没有白色毛边
+    """
+    height, width = pixels.shape[:2]
+    rgba = np.empty((height, width, 4), dtype=np.uint8)
+    for start in range(0, height, ROW_CHUNK):
+        ink = 255 - pixels[start:start + ROW_CHUNK].astype(np.uint16)
+        alpha = ink.max(axis=2)
+        safe = np.maximum(alpha, 1)[..., None]
+        stop = start + len(ink)
+        rgba[start:stop, :, :3] = 255 - (ink * 255 + safe // 2) // safe
+        rgba[start:stop, :, 3] = alpha
+    return rgba
+
+
+def finish_raster(ppm_file, png_file, dpi, trim=True, transparent=False):
+    """对 Ghostscript 输出的PPM做裁剪/透明处理并编码为PNG，返回输出尺寸 (宽, 高)"""
+    pixels = map_ppm(ppm_file)
+    try:
+        if trim:
+            bounds = content_bounds(pixels)
+            if bounds:  # 全白的页面保持原样
+                margin = round(TRIM_MARGIN_PT * dpi / 72)
+                height, width = pixels.shape[:2]
+                x0, y0, x1, y1 = bounds
+                pixels = pixels[max(0, y0 - margin):min(height, y1 + margin),
+                                max(0, x0 - margin):min(width, x1 + margin)]
+        if transparent:
+            img = Image.fromarray(white_to_alpha(pixels), 'RGBA')
+        else:
+            img = Image.fromarray(np.ascontiguousarray(pixels), 'RGB')
+        img.save(png_file, 'PNG', dpi=(dpi, dpi))
+        return img.size
+    finally:
+        del pixels  # 释放映射，Windows 上才能删除文件
+
+
+def render_png(eps_file, gs_path, dpi, png_file, render_params=None, indexed=True,
+               timeout=180, nice=0, trim=False, transparent=False, service=None):
+    """渲染一个PNG：先写临时文件，成功后原子替换（覆盖旧文件不需要事先删除），返回文件大小
+
+    出错时清理临时文件并抛出异常；nice>0 时以较低优先级运行 Ghostscript。
+    trim/transparent 时 Ghostscript 输出PPM，裁去白边/把白色背景转为透明后编码一次。
+    service 为转换服务地址时以 bulk 优先级交给服务渲染（服务不支持裁剪/透明和自定义渲染参数，这些情况仍在本地）
+    """
+    ppm_file = None
+    try:
+        tmp_file = prepare_output(png_file)
+        if service and not (trim or transparent or render_params):
+            with open(tmp_file, 'wb') as sink:
+                fetch_from_service(service, eps_file, 'png', sink, dpi=dpi)
+        else:
+            if trim or transparent:
+                load_imaging()
+                ppm_file = tmp_file.with_suffix('.ppm')
+                cmd = build_png_command(eps_file, ppm_file, gs_path, dpi, render_params, 'ppmraw')
+            else:
+                cmd = build_png_command(eps_file, tmp_file, gs_path, dpi, render_params)
+            limits = predict_limits(eps_file, dpi, timeout=timeout)
+            if nice:
+                limits['nice'] = nice
+            run_limited(cmd, timeout=timeout, limits=limits, check=True)
+        if ppm_file:
+            finish_raster(ppm_file, tmp_file, dpi, trim, transparent)
+        return commit_output(eps_file, png_file, record=indexed)
+    except BaseException:
+        discard_output(png_file)
+        raise
+    finally:
+        if ppm_file:
+            try:
+                ppm_file.unlink()
+            except FileNotFoundError:
+                pass
+
+def convert_eps_to_png(eps_file, gs_path, dpi=450, png_file=None, render_params=None,
+                       trim=False, transparent=False, service=None):
+    """将EPS转换为超高质量PNG
 
-def convert_eps_to_png(eps_file, gs_path, dpi=450):
-    """将EPS转换为超高质量PNG"""
-    png_file = eps_file.with_suffix('.png')
+    render_params 覆盖默认的 -d 渲染参数（抗锯齿、降采样等），
+    未指定的项依次使用本机调优配置和默认值；trim 裁去白边，transparent 把白色背景转为透明；
+    service 为转换服务地址时以 bulk 优先级交给服务渲染
+    """
+    indexed = png_file is None
+    if png_file is None:
+        png_file = output_path(eps_file, '.png')
     
     print(f"转换: {eps_file.name} -> {png_file.name}")
     
     try:
-        # 删除可能存在的文件
-        if png_file.exists():
-            png_file.unlink()
-        
-        # 使用最高质量设置
-        cmd = [
-            gs_path,
-            '-dNOPAUSE',
-            '-dBATCH',
-            '-dSAFER',
-            '-dEPSCrop',                    # 自动裁剪
-            '-sDEVICE=png16m',              # 24位真彩色
-            f'-r{dpi}',                     # 超高DPI
-            '-dTextAlphaBits=4',            # 文字抗锯齿
-            '-dGraphicsAlphaBits=4',        # 图形抗锯齿
-            '-dDownScaleFactor=1',          # 不降采样
-            '-dColorConversionStrategy=/LeaveColorUnchanged',  # 保持颜色
-            f'-sOutputFile={png_file}',
-            str(eps_file)
-        ]
-        
-        result = subprocess.run(cmd,
-                              capture_output=True,
-                              text=True,
-                              check=True,
-                              timeout=180,  # 3分钟超时
-                              encoding='utf-8',
-                              errors='ignore')
-        
-        if png_file.exists() and png_file.stat().st_size > 0:
-            file_size = png_file.stat().st_size / (1024 * 1024)  # MB
+        size = render_png(eps_file, gs_path, dpi, png_file, render_params, indexed,
+                          trim=trim, transparent=transparent, service=service)
+        if size > 0:
+            if indexed:
+                remove_preview(output_path(eps_file, PREVIEW_SUFFIX))  # 之前中断的渐进转换留下的预览
+            file_size = size / (1024 * 1024)  # MB
             print(f"  ✓ 成功: {file_size:.1f} MB, {dpi} DPI")
             return True
         else:
@@ -91,12 +224,91 @@ def convert_eps_to_png(eps_file, gs_path, dpi=450):
         print(f"  ❌ 异常: {e}")
         return False
 
-def get_eps_files():
-    """获取当前目录下所有EPS文件"""
-    current_dir = Path.cwd()
-    eps_files = list(current_dir.glob("*.eps"))
-    eps_files.extend(current_dir.glob("*.EPS"))
-    return sorted(list(set(eps_files)))
+def _error_text(e):
+    if isinstance(e, subprocess.TimeoutExpired):
+        return "转换超时"
+    if isinstance(e, subprocess.CalledProcessError):
+        lines = [l.strip() for l in (e.stderr or '').splitlines()
+                 if l.strip() and not l.startswith('GPL')]
+        return next((l for l in lines if 'Error' in l), f"返回码 {e.returncode}")
+    return str(e)
+
+def remove_preview(preview_file):
+    try:
+        Path(preview_file).unlink()
+    except FileNotFoundError:
+        pass
+
+def convert_progressive(eps_files, gs_path, dpi=450, workers=None, trim=False,
+                        transparent=False, service=None):
+    """渐进转换：先为整批文件生成低DPI预览，再以较低优先级渲染最终质量（在前台进行，完成后返回）
+
+    预览写到单独的 *.preview.png（不登记输出索引），最终PNG写到正式输出路径，完成或失败后删除预览；
+    中途中断时正式路径上不会有低分辨率结果，重新运行或 eps_watch 会把这些文件当作未转换。
+    service 为转换服务地址时最终质量交给服务以 bulk 优先级渲染。返回 (成功数, 失败数, 总字节数)
+    """
+    cpus = os.cpu_count() or 2
+    workers = workers or min(len(eps_files), cpus)
+    outputs = {eps_file: output_path(eps_file, '.png') for eps_file in eps_files}
+    previews = {eps_file: output_path(eps_file, PREVIEW_SUFFIX) for eps_file in eps_files}
+    
+    # 阶段1：预览
+    t0 = time.time()
+    preview_count = 0
+    # 中断时取消排队的任务，只等正在渲染的几个结束（输出是原子替换的，不会留下半个文件）
+    pool = ThreadPoolExecutor(max_workers=workers)
+    try:
+        futures = {pool.submit(render_png, eps_file, gs_path, PREVIEW_DPI, previews[eps_file],
+                               PREVIEW_PARAMS, indexed=False, timeout=PREVIEW_TIMEOUT, trim=trim,
+                               transparent=transparent): eps_file
+                   for eps_file in eps_files}
+        for future in as_completed(futures):
+            eps_file = futures[future]
+            try:
+                if future.result() > 0:
+                    preview_count += 1
+                    print(f"  预览 ✓ {previews[eps_file].name}")
+            except Exception as e:
+                print(f"  预览 ❌ {eps_file.name}: {_error_text(e)}")
+    finally:
+        pool.shutdown(cancel_futures=True)
+    print(f"\n✓ 预览完成: {preview_count}/{len(eps_files)} 个文件, 用时 {time.time() - t0:.1f}s")
+    print(f"开始以低优先级渲染最终质量 ({dpi} DPI)，可先查看 *{PREVIEW_SUFFIX}，"
+          f"每个文件完成后删除其预览...")
+    print("-" * 60)
+    
+    # 阶段2：最终质量；只用一半的CPU并降低优先级，不影响查看预览和其他交互操作
+    success_count = 0
+    fail_count = 0
+    total_size = 0
+    t1 = time.time()
+    pool = ThreadPoolExecutor(max_workers=max(1, min(workers, cpus // 2)))
+    try:
+        futures = {pool.submit(render_png, eps_file, gs_path, dpi, outputs[eps_file],
+                               nice=BACKGROUND_NICE, trim=trim,
+                               transparent=transparent, service=service): eps_file
+                   for eps_file in eps_files}
+        for done, future in enumerate(as_completed(futures), 1):
+            eps_file = futures[future]
+            try:
+                size = future.result()
+            except Exception as e:
+                size = 0
+                error = _error_text(e)
+            else:
+                error = "文件未生成"
+            remove_preview(previews[eps_file])
+            if size > 0:
+                success_count += 1
+                total_size += size
+                print(f"  [{done}/{len(eps_files)}] 最终 ✓ {outputs[eps_file].name} "
+                      f"({size / (1024 * 1024):.1f} MB, {time.time() - t1:.0f}s)")
+            else:
+                fail_count += 1
+                print(f"  [{done}/{len(eps_files)}] 最终 ❌ {eps_file.name}: {error}（已删除预览）")
+    finally:
+        pool.shutdown(cancel_futures=True)
+    return success_count, fail_count, total_size
 
 def main():
     """主函数"""
@@ -110,6 +322,9 @@ def main():
     print("这些PNG可以在需要时手动转换为SVG或直接使用")
     print()
     
+    # 清理上次崩溃遗留的 Ghostscript/Inkscape 进程
+    reap_orphans()
+    
     # 查找Ghostscript
     gs_path, gs_version = find_ghostscript()
     if not gs_path:
@@ -119,6 +334,10 @@ def main():
     
     print(f"✓ Ghostscript: {gs_version}")
     
+    profile = load_gs_profile()
+    if profile:
+        print(f"✓ 已加载本机渲染参数: {', '.join(f'{k}={v}' for k, v in profile.items())}")
+    
     # 获取EPS文件
     eps_files = get_eps_files()
     
@@ -157,8 +376,19 @@ def main():
     
     scale_factor = dpi / 150  # 150 DPI作为基准
     
+    trim = transparent = False
+    if not imaging_available():
+        print("\n💡 安装 NumPy 和 Pillow 后可自动裁剪白边、生成透明背景")
+    else:
+        response = input("自动裁剪白边 (BoundingBox 不准确时有用)? (y/n, 默认n): ")
+        trim = response.lower().strip() in ['y', 'yes', '是']
+        response = input("白色背景转为透明? (y/n, 默认n): ")
+        transparent = response.lower().strip() in ['y', 'yes', '是']
+    
     print(f"\n转换设置:")
-    print(f"- 输出格式: PNG (24位真彩色)")
+    print(f"- 输出格式: PNG ({'32位透明背景' if transparent else '24位真彩色'})")
+    if trim:
+        print(f"- 自动裁剪: 白边保留 {TRIM_MARGIN_PT} 点")
     print(f"- 分辨率: {dpi} DPI")
     print(f"- 缩放倍数: {scale_factor:.1f}x")
     print(f"- 抗锯齿: 最高级别")
@@ -172,6 +402,23 @@ def main():
         print("操作已取消")
         return
     
+    progressive = False
+    if len(eps_files) > 1:
+        response = input(f"渐进模式: 先几秒内生成全部预览 (*{PREVIEW_SUFFIX})，"
+                         f"再以低优先级渲染 {dpi} DPI? (y/n, 默认y): ")
+        progressive = response.lower().strip() not in ['n', 'no', '否']
+    
+    # 设置了 EPS_SERVICE_URL 时批量渲染交给转换服务的 bulk 通道，不挤占交互转换
+    service = service_url()
+    if service and (trim or transparent):
+        print("💡 转换服务不支持裁剪/透明背景，在本地渲染")
+        service = None
+    elif service and not check_service(service):
+        print(f"⚠ 转换服务不可用: {service}，在本地渲染")
+        service = None
+    elif service:
+        print(f"✓ 使用转换服务 (bulk 优先级): {service}")
+    
     print("\n开始转换...")
     print("-"*60)
     
@@ -180,15 +427,20 @@ def main():
     fail_count = 0
     total_size = 0
     
-    for i, eps_file in enumerate(eps_files, 1):
-        print(f"\n[{i}/{len(eps_files)}] ", end="")
-        if convert_eps_to_png(eps_file, gs_path, dpi):
-            success_count += 1
-            png_file = eps_file.with_suffix('.png')
-            if png_file.exists():
-                total_size += png_file.stat().st_size
-        else:
-            fail_count += 1
+    if progressive:
+        success_count, fail_count, total_size = convert_progressive(
+            eps_files, gs_path, dpi, trim=trim, transparent=transparent, service=service)
+    else:
+        for i, eps_file in enumerate(eps_files, 1):
+            print(f"\n[{i}/{len(eps_files)}] ", end="")
+            if convert_eps_to_png(eps_file, gs_path, dpi, trim=trim, transparent=transparent,
+                                  service=service):
+                success_count += 1
+                png_file = output_path(eps_file, '.png')
+                if png_file.exists():
+                    total_size += png_file.stat().st_size
+            else:
+                fail_count += 1
     
     # 显示结果
     print("\n" + "="*60)
@@ -201,7 +453,7 @@ def main():
     if success_count > 0:
         print(f"\n✓ PNG文件已保存在: {Path.cwd()}")
         print(f"✓ 质量: {dpi} DPI ({scale_factor:.1f}x)")
-        print(f"✓ 格式: 24位真彩色PNG")
+        print(f"✓ 格式: {'32位透明背景' if transparent else '24位真彩色'}PNG")
         
         print(f"\n💡 后续选项:")
         print(f"1. 直接使用这些高质量PNG文件")
@@ -1,46 +1,29 @@
 #!/usr/bin/env python3
 
 import os
-import subprocess
 import sys
 from pathlib import Path
-import glob
 import tempfile
 
+import eps_core
+from eps_core import get_eps_files
+from gs_profile import load_gs_profile, render_args
+from font_index import font_args, fontmap_file
+from tool_sandbox import run_limited, predict_limits, reap_orphans
+from output_layout import output_path, prepare_output, commit_output, discard_output
+from failure_cache import (describe_error, classify_failure, file_digest, tool_fingerprint,
+                           load_failure_cache, lookup_failure, record_failure,
+                           is_permanent, print_failure_report, FAILURE_LABELS)
+
 def find_ghostscript():
     """查找系统中的Ghostscript安装"""
-    possible_paths = [
-        r"C:\Program Files\gs\gs*\bin\gswin64c.exe",
-        r"C:\Program Files (x86)\gs\gs*\bin\gswin64c.exe",
-        r"C:\Program Files\gs\gs*\bin\gswin32c.exe", 
-        r"C:\Program Files (x86)\gs\gs*\bin\gswin32c.exe",
-        "gs", "gswin64c", "gswin32c"
-    ]
-    
-    for path_pattern in possible_paths:
-        if '*' in path_pattern:
-            matches = glob.glob(path_pattern)
-            if matches:
-                path = sorted(matches)[-1]
-            else:
-                continue
-        else:
-            path = path_pattern
-        
-        try:
-            result = subprocess.run([path, '--version'], 
-                                  capture_output=True, check=True, timeout=10,
-                                  encoding='utf-8', errors='ignore')
-            version = result.stdout.strip()
-            print(f"✓ 找到 Ghostscript: {path}")
-            print(f"  版本: {version}")
-            return path
-        except Exception:
-            continue
-    
-    return None
+    gs_path, version = eps_core.find_ghostscript()
+    if gs_path:
+        print(f"✓ 找到 Ghostscript: {gs_path}")
+        print(f"  版本: {version}")
+    return gs_path
 
-def test_eps_file(eps_file, gs_path):
+def test_eps_file(eps_file, gs_path, error_log=None):
     """测试EPS文件的有效性"""
     print(f"\n检测EPS文件: {eps_file.name}")
     
@@ -61,6 +44,8 @@ def test_eps_file(eps_file, gs_path):
                 print("  ✓ 检测到EPSF二进制文件头")
             else:
                 print("  ❌ 未识别的文件格式")
+                if error_log is not None:
+                    error_log.append((f"unrecognized header: {header[:16]!r}", False))
                 return False
                 
     except Exception as e:
@@ -69,13 +54,9 @@ def test_eps_file(eps_file, gs_path):
     
     # 使用Ghostscript测试文件
     try:
-        cmd = [gs_path, '-dNODISPLAY', '-dBATCH', '-dSAFER', str(eps_file)]
-        result = subprocess.run(cmd,
-                              capture_output=True,
-                              text=True,
-                              timeout=30,
-                              encoding='utf-8',
-                              errors='ignore')
+        cmd = [gs_path, '-dNODISPLAY', '-dBATCH', '-dSAFER', *font_args(), str(eps_file)]
+        result = run_limited(cmd, timeout=30,
+                             limits=predict_limits(eps_file, timeout=30))
         
         if result.returncode == 0:
             print("  ✓ Ghostscript可以解析此文件")
@@ -84,19 +65,22 @@ def test_eps_file(eps_file, gs_path):
             print("  ❌ Ghostscript无法解析此文件")
             if result.stderr:
                 print(f"  错误: {result.stderr.strip()[:200]}")
+            if error_log is not None:
+                error_log.append((result.stderr + result.stdout, False))
             return False
             
     except Exception as e:
         print(f"  ❌ Ghostscript测试失败: {e}")
+        if error_log is not None:
+            error_log.append(describe_error(e))
         return False
 
-def convert_method_1_svg(eps_file, gs_path, scale_factor=3):
+def convert_method_1_svg(eps_file, gs_path, scale_factor=3, error_log=None):
     """方法1: 直接转换为SVG"""
-    svg_file = eps_file.with_suffix('.svg')
+    svg_file = output_path(eps_file, '.svg')
     
     try:
-        if svg_file.exists():
-            svg_file.unlink()
+        tmp_file = prepare_output(svg_file)
         
         dpi = int(72 * scale_factor)
         cmd = [
@@ -107,18 +91,15 @@ def convert_method_1_svg(eps_file, gs_path, scale_factor=3):
             '-dEPSCrop',
             '-sDEVICE=svg',
             f'-r{dpi}',
-            f'-sOutputFile={svg_file}',
+            *font_args(),
+            f'-sOutputFile={tmp_file}',
             str(eps_file)
         ]
         
         print(f"    执行命令: {' '.join(cmd)}")
         
-        result = subprocess.run(cmd,
-                              capture_output=True,
-                              text=True,
-                              timeout=120,
-                              encoding='utf-8',
-                              errors='ignore')
+        result = run_limited(cmd, timeout=120,
+                             limits=predict_limits(eps_file, timeout=120))
         
         print(f"    返回码: {result.returncode}")
         if result.stdout:
@@ -126,22 +107,26 @@ def convert_method_1_svg(eps_file, gs_path, scale_factor=3):
         if result.stderr:
             print(f"    错误: {result.stderr[:200]}")
         
-        if svg_file.exists() and svg_file.stat().st_size > 0:
+        if commit_output(eps_file, svg_file) > 0:
             return True
         else:
+            if error_log is not None:
+                error_log.append((result.stderr + result.stdout, False))
             return False
             
     except Exception as e:
+        discard_output(svg_file)
         print(f"    异常: {e}")
+        if error_log is not None:
+            error_log.append(describe_error(e))
         return False
 
-def convert_method_2_png(eps_file, gs_path, scale_factor=3):
+def convert_method_2_png(eps_file, gs_path, scale_factor=3, error_log=None):
     """方法2: 转换为高分辨率PNG"""
-    png_file = eps_file.with_suffix('.png')
+    png_file = output_path(eps_file, '.png')
     
     try:
-        if png_file.exists():
-            png_file.unlink()
+        tmp_file = prepare_output(png_file)
         
         dpi = int(150 * scale_factor)  # 使用更高的DPI
         cmd = [
@@ -152,41 +137,44 @@ def convert_method_2_png(eps_file, gs_path, scale_factor=3):
             '-dEPSCrop',
             '-sDEVICE=png16m',  # 24位PNG
             f'-r{dpi}',
-            f'-sOutputFile={png_file}',
+            *render_args(load_gs_profile()),  # 本机调优参数
+            *font_args(),
+            f'-sOutputFile={tmp_file}',
             str(eps_file)
         ]
         
         print(f"    执行命令: {' '.join(cmd)}")
         
-        result = subprocess.run(cmd,
-                              capture_output=True,
-                              text=True,
-                              timeout=120,
-                              encoding='utf-8',
-                              errors='ignore')
+        result = run_limited(cmd, timeout=120,
+                             limits=predict_limits(eps_file, dpi, timeout=120))
         
         print(f"    返回码: {result.returncode}")
         if result.stderr:
             print(f"    错误: {result.stderr[:200]}")
         
-        if png_file.exists() and png_file.stat().st_size > 0:
-            file_size = png_file.stat().st_size / 1024
+        size = commit_output(eps_file, png_file)
+        if size > 0:
+            file_size = size / 1024
             print(f"    ✓ PNG生成成功: {file_size:.1f} KB")
             return True
         else:
+            if error_log is not None:
+                error_log.append((result.stderr + result.stdout, False))
             return False
             
     except Exception as e:
+        discard_output(png_file)
         print(f"    异常: {e}")
+        if error_log is not None:
+            error_log.append(describe_error(e))
         return False
 
-def convert_method_3_pdf(eps_file, gs_path, scale_factor=3):
+def convert_method_3_pdf(eps_file, gs_path, scale_factor=3, error_log=None):
     """方法3: 先转PDF再处理"""
-    pdf_file = eps_file.with_suffix('.pdf')
+    pdf_file = output_path(eps_file, '.pdf')
     
     try:
-        if pdf_file.exists():
-            pdf_file.unlink()
+        tmp_file = prepare_output(pdf_file)
         
         cmd = [
             gs_path,
@@ -196,71 +184,87 @@ def convert_method_3_pdf(eps_file, gs_path, scale_factor=3):
             '-dEPSCrop',
             '-sDEVICE=pdfwrite',
             '-dPDFSETTINGS=/prepress',
-            f'-sOutputFile={pdf_file}',
+            *font_args(),
+            f'-sOutputFile={tmp_file}',
             str(eps_file)
         ]
         
         print(f"    执行命令: {' '.join(cmd)}")
         
-        result = subprocess.run(cmd,
-                              capture_output=True,
-                              text=True,
-                              timeout=120,
-                              encoding='utf-8',
-                              errors='ignore')
+        result = run_limited(cmd, timeout=120,
+                             limits=predict_limits(eps_file, timeout=120))
         
         print(f"    返回码: {result.returncode}")
         if result.stderr:
             print(f"    错误: {result.stderr[:200]}")
         
-        if pdf_file.exists() and pdf_file.stat().st_size > 0:
-            file_size = pdf_file.stat().st_size / 1024
+        size = commit_output(eps_file, pdf_file)
+        if size > 0:
+            file_size = size / 1024
             print(f"    ✓ PDF生成成功: {file_size:.1f} KB")
             return True
         else:
+            if error_log is not None:
+                error_log.append((result.stderr + result.stdout, False))
             return False
             
     except Exception as e:
+        discard_output(pdf_file)
         print(f"    异常: {e}")
+        if error_log is not None:
+            error_log.append(describe_error(e))
         return False
 
-def convert_eps_diagnostic(eps_file, gs_path, scale_factor=3):
-    """诊断式转换EPS文件"""
+def convert_eps_diagnostic(eps_file, gs_path, scale_factor=3, failure_cache=None):
+    """诊断式转换EPS文件
+
+    failure_cache 为负面结果缓存（可选）：已知失败的文件直接跳过，新的失败按原因分类记录
+    """
     print(f"\n正在转换: {eps_file.name}")
     
-    # 首先测试文件有效性
-    if not test_eps_file(eps_file, gs_path):
-        print("  ❌ 文件测试失败，跳过转换")
-        return False
+    if failure_cache is not None:
+        digest = file_digest(eps_file)
+        fingerprint = tool_fingerprint([gs_path, fontmap_file()], scope='diagnostic')
+        known = lookup_failure(failure_cache, digest, fingerprint)
+        if known:
+            print(f"  ⏭ 已知失败，跳过: {FAILURE_LABELS.get(known['class'], known['class'])}")
+            print(f"    {known['detail'].splitlines()[0] if known['detail'] else ''}")
+            return False
     
-    # 尝试不同的转换方法
-    methods = [
-        ("直接转SVG", convert_method_1_svg),
-        ("转PNG", convert_method_2_png),
-        ("转PDF", convert_method_3_pdf),
-    ]
+    error_log = []
     
-    for method_name, method_func in methods:
-        print(f"\n  尝试方法: {method_name}")
-        try:
-            if method_func(eps_file, gs_path, scale_factor):
-                print(f"  ✓ {method_name} 成功")
-                return True
-            else:
-                print(f"  ❌ {method_name} 失败")
-        except Exception as e:
-            print(f"  ❌ {method_name} 异常: {e}")
+    # 首先测试文件有效性
+    if not test_eps_file(eps_file, gs_path, error_log):
+        print("  ❌ 文件测试失败，跳过转换")
+    else:
+        # 尝试不同的转换方法
+        methods = [
+            ("直接转SVG", convert_method_1_svg),
+            ("转PNG", convert_method_2_png),
+            ("转PDF", convert_method_3_pdf),
+        ]
+        
+        for method_name, method_func in methods:
+            print(f"\n  尝试方法: {method_name}")
+            try:
+                if method_func(eps_file, gs_path, scale_factor, error_log):
+                    print(f"  ✓ {method_name} 成功")
+                    return True
+                else:
+                    print(f"  ❌ {method_name} 失败")
+            except Exception as e:
+                print(f"  ❌ {method_name} 异常: {e}")
+                error_log.append(describe_error(e))
+        
+        print("  ❌ 所有转换方法均失败")
     
-    print("  ❌ 所有转换方法均失败")
+    failure_class, detail = classify_failure(
+        [text for text, _ in error_log], any(timed_out for _, timed_out in error_log), eps_file)
+    print(f"  失败原因: {FAILURE_LABELS.get(failure_class, failure_class)}")
+    if failure_cache is not None and is_permanent(failure_class):
+        record_failure(failure_cache, digest, fingerprint, eps_file.name, failure_class, detail)
     return False
 
-def get_eps_files():
-    """获取当前目录下所有EPS文件"""
-    current_dir = Path.cwd()
-    eps_files = list(current_dir.glob("*.eps"))
-    eps_files.extend(current_dir.glob("*.EPS"))
-    return sorted(list(set(eps_files)))
-
 def main():
     """主函数"""
     print("EPS 转换器 - 诊断版")
@@ -269,6 +273,9 @@ def main():
     print(f"Python版本: {sys.version}")
     print()
     
+    # 清理上次崩溃遗留的 Ghostscript/Inkscape 进程
+    reap_orphans()
+    
     # 查找Ghostscript
     print("检查Ghostscript...")
     gs_path = find_ghostscript()
@@ -293,8 +300,9 @@ def main():
     print("1. 测试单个文件 (诊断)")
     print("2. 批量转换所有文件")
     print("3. 测试前5个文件")
+    print("4. 查看失败原因报告")
     
-    choice = input("\n请选择 (1-3): ").strip()
+    choice = input("\n请选择 (1-4): ").strip()
     
     if choice == "1":
         # 单文件测试
@@ -315,10 +323,12 @@ def main():
         # 批量转换
         response = input(f"\n是否转换所有 {len(eps_files)} 个文件? (y/n): ").lower().strip()
         if response in ['y', 'yes', '是']:
+            failure_cache = load_failure_cache()
             success_count = 0
             for i, eps_file in enumerate(eps_files, 1):
                 print(f"\n[{i}/{len(eps_files)}]", "="*50)
-                if convert_eps_diagnostic(eps_file, gs_path, scale_factor=3):
+                if convert_eps_diagnostic(eps_file, gs_path, scale_factor=3,
+                                          failure_cache=failure_cache):
                     success_count += 1
             
             print(f"\n总结: 成功 {success_count}/{len(eps_files)} 个文件")
@@ -328,14 +338,20 @@ def main():
         test_files = eps_files[:5]
         print(f"\n测试前 {len(test_files)} 个文件:")
         
+        failure_cache = load_failure_cache()
         success_count = 0
         for i, eps_file in enumerate(test_files, 1):
             print(f"\n[{i}/{len(test_files)}]", "="*50)
-            if convert_eps_diagnostic(eps_file, gs_path, scale_factor=3):
+            if convert_eps_diagnostic(eps_file, gs_path, scale_factor=3,
+                                      failure_cache=failure_cache):
                 success_count += 1
         
         print(f"\n测试结果: 成功 {success_count}/{len(test_files)} 个文件")
     
+    elif choice == "4":
+        print()
+        print_failure_report(load_failure_cache())
+    
     else:
         print("无效选择")
     
@@ -8,87 +8,67 @@ import os
 import subprocess
 import sys
 from pathlib import Path
-import glob
+
+import eps_core
+from eps_core import get_eps_files
+from font_index import font_args
+from tool_sandbox import run_limited, predict_limits, reap_orphans
+from output_layout import output_path, prepare_output, commit_output, discard_output
+from svg_optimizer import optimize_in_place, DEFAULT_PRECISION
 
 def find_ghostscript():
     """查找系统中的Ghostscript安装"""
-    # Windows系统可能的Ghostscript路径
-    possible_paths = [
-        # 64位版本
-        r"C:\Program Files\gs\gs*\bin\gswin64c.exe",
-        r"C:\Program Files (x86)\gs\gs*\bin\gswin64c.exe",
-        # 32位版本
-        r"C:\Program Files\gs\gs*\bin\gswin32c.exe", 
-        r"C:\Program Files (x86)\gs\gs*\bin\gswin32c.exe",
-        # 通用名称（如果在PATH中）
-        "gs", "gswin64c", "gswin32c"
+    gs_path, version = eps_core.find_ghostscript()
+    if gs_path:
+        print(f"✓ 找到 Ghostscript: {gs_path}")
+        print(f"  版本: {version}")
+    return gs_path
+
+def build_svg_command(eps_file, svg_file, gs_path, scale_factor=3):
+    """构建EPS转SVG的Ghostscript命令"""
+    # 使用更高的分辨率来实现缩放效果
+    dpi = int(72 * scale_factor)  # EPS默认是72 DPI
+    
+    return [
+        gs_path,
+        '-dNOPAUSE',           # 不暂停等待用户输入
+        '-dBATCH',             # 批处理模式
+        '-dSAFER',             # 安全模式
+        '-dEPSCrop',           # 自动裁剪到EPS边界
+        '-sDEVICE=svg',        # 输出SVG格式
+        f'-r{dpi}',            # 设置分辨率（实现缩放）
+        *font_args(),          # 字体索引生成的 Fontmap/FONTPATH
+        f'-sOutputFile={svg_file}',  # 输出文件
+        str(eps_file)          # 输入EPS文件
     ]
-    
-    for path_pattern in possible_paths:
-        if '*' in path_pattern:
-            # 处理通配符路径（查找版本号）
-            matches = glob.glob(path_pattern)
-            if matches:
-                # 选择最新版本（按字母排序）
-                path = sorted(matches)[-1]
-            else:
-                continue
-        else:
-            path = path_pattern
-        
-        try:
-            # 测试Ghostscript是否工作
-            result = subprocess.run([path, '--version'], 
-                                  capture_output=True, check=True, timeout=10,
-                                  encoding='utf-8', errors='ignore')
-            version = result.stdout.strip()
-            print(f"✓ 找到 Ghostscript: {path}")
-            print(f"  版本: {version}")
-            return path
-        except Exception:
-            continue
-    
-    return None
 
-def convert_eps_to_svg_gs(eps_file, gs_path, scale_factor=3):
-    """使用Ghostscript将EPS转换为SVG"""
-    svg_file = eps_file.with_suffix('.svg')
+def convert_eps_to_svg_gs(eps_file, gs_path, scale_factor=3, optimize=None):
+    """使用Ghostscript将EPS转换为SVG
+
+    optimize 为坐标保留的小数位数时，输出先经过 svg_optimizer 流式优化再替换为最终文件
+    """
+    svg_file = output_path(eps_file, '.svg')
     
     print(f"正在转换: {eps_file.name} -> {svg_file.name}")
     
     try:
-        # 删除可能存在的输出文件
-        if svg_file.exists():
-            svg_file.unlink()
+        # 先写临时文件，成功后原子替换为最终输出
+        tmp_file = prepare_output(svg_file)
         
         # 构建Ghostscript命令
-        # 使用更高的分辨率来实现缩放效果
-        dpi = int(72 * scale_factor)  # EPS默认是72 DPI
-        
-        cmd = [
-            gs_path,
-            '-dNOPAUSE',           # 不暂停等待用户输入
-            '-dBATCH',             # 批处理模式
-            '-dSAFER',             # 安全模式
-            '-dEPSCrop',           # 自动裁剪到EPS边界
-            '-sDEVICE=svg',        # 输出SVG格式
-            f'-r{dpi}',            # 设置分辨率（实现缩放）
-            f'-sOutputFile={svg_file}',  # 输出文件
-            str(eps_file)          # 输入EPS文件
-        ]
+        cmd = build_svg_command(eps_file, tmp_file, gs_path, scale_factor)
         
         # 执行转换
-        result = subprocess.run(cmd,
-                              capture_output=True,
-                              text=True,
-                              check=True,
-                              timeout=120,  # 2分钟超时
-                              encoding='utf-8',
-                              errors='ignore')
+        result = run_limited(cmd, timeout=120,
+                             limits=predict_limits(eps_file, timeout=120), check=True)
+        
+        if optimize is not None and tmp_file.exists():
+            optimize_in_place(tmp_file, optimize)
         
         # 检查输出文件
-        if svg_file.exists() and svg_file.stat().st_size > 0:
-            file_size = svg_file.stat().st_size / 1024
+        size = commit_output(eps_file, svg_file)
+        if size > 0:
+            file_size = size / 1024
             print(f"✓ 转换成功: {svg_file.name} ({file_size:.1f} KB, {scale_factor}x)")
             return True
         else:
@@ -96,6 +76,7 @@ def convert_eps_to_svg_gs(eps_file, gs_path, scale_factor=3):
             return False
             
     except subprocess.CalledProcessError as e:
+        discard_output(svg_file)
         print(f"❌ Ghostscript错误: {e}")
         if e.stderr:
             # 显示关键错误信息
@@ -105,19 +86,14 @@ def convert_eps_to_svg_gs(eps_file, gs_path, scale_factor=3):
                     print(f"   错误: {line.strip()}")
         return False
     except subprocess.TimeoutExpired:
+        discard_output(svg_file)
         print(f"❌ 转换超时: {eps_file.name}")
         return False
     except Exception as e:
+        discard_output(svg_file)
         print(f"❌ 转换失败: {e}")
         return False
 
-def get_eps_files():
-    """获取当前目录下所有EPS文件"""
-    current_dir = Path.cwd()
-    eps_files = list(current_dir.glob("*.eps"))
-    eps_files.extend(current_dir.glob("*.EPS"))
-    return sorted(list(set(eps_files)))
-
 def install_ghostscript_guide():
     """显示Ghostscript安装指南"""
     print("\n" + "="*60)
@@ -141,6 +117,9 @@ def main():
     print(f"当前目录: {Path.cwd()}")
     print()
     
+    # 清理上次崩溃遗留的 Ghostscript/Inkscape 进程
+    reap_orphans()
+    
     # 查找Ghostscript
     print("检查Ghostscript...")
     gs_path = find_ghostscript()
@@ -180,6 +159,9 @@ def main():
         print("操作已取消")
         return
     
+    response = input(f"是否优化SVG体积（合并路径、坐标保留{DEFAULT_PRECISION}位小数）? (y/n): ")
+    optimize = DEFAULT_PRECISION if response.lower().strip() in ['y', 'yes', '是'] else None
+    
     print("\n开始转换...")
     print("-"*60)
     
@@ -189,7 +171,7 @@ def main():
     
     for i, eps_file in enumerate(eps_files, 1):
         print(f"\n[{i}/{len(eps_files)}] ", end="")
-        if convert_eps_to_svg_gs(eps_file, gs_path, scale_factor=3):
+        if convert_eps_to_svg_gs(eps_file, gs_path, scale_factor=3, optimize=optimize):
             success_count += 1
         else:
             fail_count += 1
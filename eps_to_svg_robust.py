@@ -1,73 +1,50 @@
 #!/usr/bin/env python3
 
 import os
-import subprocess
 import sys
 from pathlib import Path
 import tempfile
+import argparse
+import functools
+
+from eps_core import LazyTools, get_eps_files
+from batch_journal import open_journal, journal_append, completed_files
+from failure_cache import (describe_error, classify_failure, file_digest, tool_fingerprint,
+                           load_failure_cache, lookup_failure, record_failure,
+                           forget_failure, is_permanent, print_failure_report, FAILURE_LABELS)
+from font_index import font_args, fontmap_file
+from tool_sandbox import run_limited, predict_limits, reap_orphans
+from output_layout import output_path, prepare_output, commit_output
+from svg_optimizer import optimize_in_place, DEFAULT_PRECISION
+from service_client import service_url, check_service, fetch_from_service, DEFAULT_SERVICE
+
+TRACE_PRESET = 'balanced'  # 方法4的矢量化预设，见 raster_tracer.PRESETS
+
+JOURNAL_NAME = '.eps_svg_journal.jsonl'
 
 def check_tools():
-    """检查可用的转换工具"""
-    tools = {}
-    
-    # 检查Inkscape
-    inkscape_paths = [
-        r"C:\Program Files\Inkscape\bin\inkscape.exe",
-        r"C:\Program Files (x86)\Inkscape\bin\inkscape.exe",
-        "inkscape"
-    ]
-    
-    for path in inkscape_paths:
-        try:
-            subprocess.run([path, '--version'], 
-                          capture_output=True, check=True, timeout=10,
-                          encoding='utf-8', errors='ignore')
-            tools['inkscape'] = path
-            print(f"✓ 找到 Inkscape: {path}")
-            break
-        except:
-            continue
-    
-    # 检查Ghostscript
-    gs_paths = [
-        r"C:\Program Files\gs\gs*\bin\gswin64c.exe",
-        r"C:\Program Files (x86)\gs\gs*\bin\gswin32c.exe",
-        "gs", "gswin64c", "gswin32c"
-    ]
-    
-    for path_pattern in gs_paths:
-        if '*' in path_pattern:
-            # 处理通配符路径
-            import glob
-            matches = glob.glob(path_pattern)
-            if matches:
-                path = matches[0]
-            else:
-                continue
-        else:
-            path = path_pattern
-            
-        try:
-            subprocess.run([path, '--version'], 
-                          capture_output=True, check=True, timeout=10,
-                          encoding='utf-8', errors='ignore')
-            tools['ghostscript'] = path
-            print(f"✓ 找到 Ghostscript: {path}")
-            break
-        except:
-            continue
-    
-    # 检查PIL/Pillow
+    """可用的转换工具表；各工具在第一次用到时才探测（只走 Ghostscript 的方法不会启动 Inkscape 或导入 Pillow）"""
+    return LazyTools()
+
+def method0_service(eps_file, svg_file, tools, scale_factor=3, error_log=None, service=None):
+    """方法0: 交给本地转换服务以 bulk 优先级渲染（Ghostscript SVG）
+
+    服务按优先级通道调度，批量转换不会挤占交互请求；服务失败时继续尝试本地方法
+    """
+    if not service:
+        return False
     try:
-        from PIL import Image
-        tools['pil'] = True
-        print("✓ 找到 PIL/Pillow")
-    except ImportError:
-        print("- PIL/Pillow 未安装")
-    
-    return tools
+        with open(svg_file, 'wb') as sink:
+            # 服务按 72×scale DPI 渲染SVG，本脚本的本地方法按 96×scale，换算成相同的输出尺寸
+            return fetch_from_service(service, eps_file, 'svg', sink,
+                                      scale_factor=scale_factor * 96 / 72) > 0
+    except Exception as e:
+        print(f"   转换服务失败: {e}")
+        if error_log is not None:
+            error_log.append(describe_error(e))
+        return False
 
-def method1_inkscape_direct(eps_file, svg_file, tools, scale_factor=3):
+def method1_inkscape_direct(eps_file, svg_file, tools, scale_factor=3, error_log=None):
     """方法1: 直接使用Inkscape转换"""
     if 'inkscape' not in tools:
         return False
@@ -83,21 +60,19 @@ def method1_inkscape_direct(eps_file, svg_file, tools, scale_factor=3):
             f'--export-dpi={96 * scale_factor}',  # 使用DPI缩放
         ]
         
-        result = subprocess.run(cmd,
-                              capture_output=True,
-                              text=True,
-                              check=True,
-                              timeout=120,
-                              encoding='utf-8',
-                              errors='ignore')
+        result = run_limited(cmd, timeout=120,
+                             limits=predict_limits(eps_file, timeout=120, cap_memory=False),
+                             check=True)
         
         return svg_file.exists()
         
     except Exception as e:
         print(f"   Inkscape直接转换失败: {e}")
+        if error_log is not None:
+            error_log.append(describe_error(e))
         return False
 
-def method2_ghostscript_pdf(eps_file, svg_file, tools, scale_factor=3):
+def method2_ghostscript_pdf(eps_file, svg_file, tools, scale_factor=3, error_log=None):
     """方法2: 使用Ghostscript转PDF再用Inkscape转SVG"""
     if 'ghostscript' not in tools or 'inkscape' not in tools:
         return False
@@ -113,16 +88,13 @@ def method2_ghostscript_pdf(eps_file, svg_file, tools, scale_factor=3):
             '-dBATCH',
             '-dSAFER',
             '-sDEVICE=pdfwrite',
+            *font_args(),
             f'-sOutputFile={pdf_file}',
             str(eps_file)
         ]
         
-        subprocess.run(gs_cmd,
-                      capture_output=True,
-                      check=True,
-                      timeout=60,
-                      encoding='utf-8',
-                      errors='ignore')
+        run_limited(gs_cmd, timeout=60,
+                    limits=predict_limits(eps_file, timeout=60), check=True)
         
         if not pdf_file.exists():
             return False
@@ -137,12 +109,8 @@ def method2_ghostscript_pdf(eps_file, svg_file, tools, scale_factor=3):
             f'--export-dpi={96 * scale_factor}',
         ]
         
-        subprocess.run(ink_cmd,
-                      capture_output=True,
-                      check=True,
-                      timeout=60,
-                      encoding='utf-8',
-                      errors='ignore')
+        run_limited(ink_cmd, timeout=60,
+                    limits=predict_limits(eps_file, timeout=60, cap_memory=False), check=True)
         
         # 清理临时文件
         try:
@@ -154,6 +122,8 @@ def method2_ghostscript_pdf(eps_file, svg_file, tools, scale_factor=3):
         
     except Exception as e:
         print(f"   Ghostscript+Inkscape转换失败: {e}")
+        if error_log is not None:
+            error_log.append(describe_error(e))
         # 清理可能的临时文件
         try:
             if 'pdf_file' in locals():
@@ -162,7 +132,7 @@ def method2_ghostscript_pdf(eps_file, svg_file, tools, scale_factor=3):
             pass
         return False
 
-def method3_ghostscript_svg(eps_file, svg_file, tools, scale_factor=3):
+def method3_ghostscript_svg(eps_file, svg_file, tools, scale_factor=3, error_log=None):
     """方法3: 直接使用Ghostscript转SVG"""
     if 'ghostscript' not in tools:
         return False
@@ -176,129 +146,171 @@ def method3_ghostscript_svg(eps_file, svg_file, tools, scale_factor=3):
             '-dSAFER',
             '-sDEVICE=svg',
             f'-r{96 * scale_factor}',  # 设置分辨率
+            *font_args(),
             f'-sOutputFile={svg_file}',
             str(eps_file)
         ]
         
-        subprocess.run(cmd,
-                      capture_output=True,
-                      check=True,
-                      timeout=120,
-                      encoding='utf-8',
-                      errors='ignore')
+        run_limited(cmd, timeout=120,
+                    limits=predict_limits(eps_file, timeout=120), check=True)
         
         return svg_file.exists()
         
     except Exception as e:
         print(f"   Ghostscript直接转换失败: {e}")
+        if error_log is not None:
+            error_log.append(describe_error(e))
         return False
 
-def method4_pil_conversion(eps_file, svg_file, tools, scale_factor=3):
-    """方法4: 使用PIL转换为PNG再转SVG"""
-    if 'pil' not in tools or 'inkscape' not in tools:
+def method4_pil_conversion(eps_file, svg_file, tools, scale_factor=3, error_log=None,
+                           preset=TRACE_PRESET, draft=False):
+    """方法4: 使用PIL按目标分辨率渲染位图，再在进程内矢量化为SVG路径（不需要Inkscape）
+
+    draft=True 时按 72 DPI 渲染并用 fast 预设矢量化，用于快速预览
+    """
+    if 'pil' not in tools or 'tracer' not in tools:
         return False
     
     try:
-        from PIL import Image
+        from raster_tracer import open_eps, trace_to_svg
         
-        with tempfile.NamedTemporaryFile(suffix='.png', delete=False) as tmp_png:
-            png_file = Path(tmp_png.name)
+        # Step 1: EPS -> 位图（Ghostscript 直接按目标分辨率渲染，不再放大重采样）
+        img, size = open_eps(eps_file, scale_factor, draft)
         
-        # Step 1: EPS -> PNG (使用PIL)
-        with Image.open(str(eps_file)) as img:
-            # 计算新尺寸
-            width, height = img.size
-            new_width = int(width * scale_factor)
-            new_height = int(height * scale_factor)
-            
-            # 调整大小并保存为PNG
-            img_resized = img.resize((new_width, new_height), Image.Resampling.LANCZOS)
-            img_resized.save(str(png_file), 'PNG', dpi=(96 * scale_factor, 96 * scale_factor))
-        
-        if not png_file.exists():
-            return False
-        
-        # Step 2: PNG -> SVG (使用Inkscape)
-        cmd = [
-            tools['inkscape'],
-            str(png_file),
-            '--export-type=svg',
-            f'--export-filename={svg_file}',
-        ]
-        
-        subprocess.run(cmd,
-                      capture_output=True,
-                      check=True,
-                      timeout=60,
-                      encoding='utf-8',
-                      errors='ignore')
-        
-        # 清理临时文件
-        try:
-            png_file.unlink()
-        except:
-            pass
+        # Step 2: 位图 -> SVG路径 (NumPy矢量化，不启动子进程)
+        with img:
+            stats = trace_to_svg(img, svg_file, 'fast' if draft else preset, size)
+        print(f"   矢量化: {stats['colors']} 色, {stats['paths']} 条轮廓, {stats['seconds']:.1f}s")
         
         return svg_file.exists()
         
     except Exception as e:
         print(f"   PIL转换失败: {e}")
-        try:
-            if 'png_file' in locals():
-                png_file.unlink()
-        except:
-            pass
+        if error_log is not None:
+            error_log.append(describe_error(e))
         return False
 
-def convert_eps_to_svg(eps_file, tools, scale_factor=3):
-    """尝试多种方法转换EPS到SVG"""
-    svg_file = eps_file.with_suffix('.svg')
+def convert_eps_to_svg(eps_file, tools, scale_factor=3, journal=None, failure_cache=None,
+                       retry_failed=False, optimize=None, service=None):
+    """尝试多种方法转换EPS到SVG
+
+    各方法先写入同目录的临时文件，成功后原子改名为最终输出，
+    中断时不会留下写了一半的SVG；journal 为检查点日志句柄（可选）。
+    failure_cache 为负面结果缓存（可选），内容和工具链都未变的已知失败文件直接跳过，
+    retry_failed 为真时仍然重试并更新缓存；optimize 为坐标精度时对输出做流式优化；
+    service 为转换服务地址时先以 bulk 优先级交给服务，失败后再用本地方法
+    """
+    svg_file = output_path(eps_file, '.svg')
+    tmp_file = prepare_output(svg_file)
     
     print(f"正在转换: {eps_file.name} -> {svg_file.name}")
     
-    # 如果目标文件已存在，先删除
-    if svg_file.exists():
-        try:
-            svg_file.unlink()
-        except:
-            pass
+    if failure_cache is not None:
+        digest = file_digest(eps_file)
+        fingerprint = tool_fingerprint([*tools.identity(), fontmap_file()], scope='svg_robust')
+        known = lookup_failure(failure_cache, digest, fingerprint)
+        if known and not retry_failed:
+            label = FAILURE_LABELS.get(known['class'], known['class'])
+            print(f"⏭ 已知失败，跳过: {label}")
+            if journal is not None:
+                journal_append(journal, {'file': eps_file.name, 'state': 'failed',
+                                         'class': known['class'], 'cached': True})
+            return False
+    
+    if journal is not None:
+        journal_append(journal, {'file': eps_file.name, 'state': 'started'})
     
     # 按优先级尝试不同方法
     methods = [
         ("Inkscape直接转换", method1_inkscape_direct),
         ("Ghostscript+Inkscape", method2_ghostscript_pdf),
         ("Ghostscript直接转换", method3_ghostscript_svg),
-        ("PIL+Inkscape转换", method4_pil_conversion),
+        ("PIL+矢量化", method4_pil_conversion),
     ]
+    if service:
+        methods.insert(0, ("转换服务 (bulk)", functools.partial(method0_service, service=service)))
     
-    for method_name, method_func in methods:
+    error_log = []
+    try:
+        for method_name, method_func in methods:
+            # 清理上一个方法或上次中断留下的临时文件
+            if tmp_file.exists():
+                tmp_file.unlink()
+            try:
+                print(f"   尝试: {method_name}")
+                if not method_func(eps_file, tmp_file, tools, scale_factor, error_log):
+                    continue
+                if optimize is not None and tmp_file.exists():
+                    optimize_in_place(tmp_file, optimize)
+                size = commit_output(eps_file, svg_file)
+                if size > 0:
+                    if journal is not None:
+                        # 输出不在源目录时记录绝对路径，续传时照样能核对
+                        output = (svg_file.name if svg_file.parent == eps_file.parent
+                                  else os.path.abspath(svg_file))
+                        journal_append(journal, {'file': eps_file.name, 'state': 'done',
+                                                 'output': output, 'size': size,
+                                                 'method': method_name})
+                    if failure_cache is not None and known:
+                        forget_failure(failure_cache, digest, fingerprint)
+                    print(f"✓ 成功: {svg_file.name} ({size / 1024:.1f} KB, {scale_factor}x)")
+                    return True
+            except Exception as e:
+                print(f"   {method_name} 出错: {e}")
+                error_log.append(describe_error(e))
+                continue
+    finally:
         try:
-            print(f"   尝试: {method_name}")
-            if method_func(eps_file, svg_file, tools, scale_factor):
-                file_size = svg_file.stat().st_size / 1024
-                print(f"✓ 成功: {svg_file.name} ({file_size:.1f} KB, {scale_factor}x)")
-                return True
-        except Exception as e:
-            print(f"   {method_name} 出错: {e}")
-            continue
+            if tmp_file.exists():
+                tmp_file.unlink()
+        except OSError:
+            pass
     
+    failure_class = None
+    if error_log:
+        failure_class, detail = classify_failure(
+            [text for text, _ in error_log], any(timed_out for _, timed_out in error_log),
+            eps_file)
+        if failure_cache is not None and is_permanent(failure_class):
+            record_failure(failure_cache, digest, fingerprint, eps_file.name,
+                           failure_class, detail)
+    if journal is not None:
+        journal_append(journal, {'file': eps_file.name, 'state': 'failed',
+                                 'class': failure_class})
     print(f"❌ 所有方法均失败: {eps_file.name}")
+    if failure_class:
+        print(f"   原因: {FAILURE_LABELS.get(failure_class, failure_class)}")
     return False
 
-def get_eps_files():
-    """获取当前目录下所有EPS文件"""
-    current_dir = Path.cwd()
-    eps_files = list(current_dir.glob("*.eps"))
-    eps_files.extend(current_dir.glob("*.EPS"))
-    return sorted(list(set(eps_files)))
-
 def main():
     """主函数"""
+    parser = argparse.ArgumentParser(description="EPS to SVG 转换器 - 强健版")
+    parser.add_argument('--resume', action='store_true',
+                        help="根据检查点日志继续上次中断的批量转换")
+    parser.add_argument('--retry-failed', action='store_true',
+                        help="忽略失败缓存，重新尝试已知失败的文件")
+    parser.add_argument('--failure-report', action='store_true',
+                        help="按原因汇总已记录的失败文件后退出")
+    parser.add_argument('--optimize', nargs='?', type=int, const=DEFAULT_PRECISION,
+                        metavar='PRECISION',
+                        help=f"流式优化输出的SVG，坐标保留的小数位数（默认 {DEFAULT_PRECISION}）")
+    parser.add_argument('--service', nargs='?', const=DEFAULT_SERVICE, metavar='URL',
+                        help=f"以 bulk 优先级交给转换服务（默认 $EPS_SERVICE_URL 或 {DEFAULT_SERVICE}），"
+                             "与交互转换共用渲染线程")
+    args = parser.parse_args()
+    
+    if args.failure_report:
+        print_failure_report(load_failure_cache())
+        return
+    
     print("EPS to SVG 转换器 - 强健版")
     print("=" * 60)
     print(f"当前目录: {Path.cwd()}")
     print()
     
+    # 清理上次崩溃遗留的 Ghostscript/Inkscape 进程
+    reap_orphans()
+    
     # 检查工具
     print("检查可用工具...")
     tools = check_tools()
@@ -314,6 +326,14 @@ def main():
     
     print(f"\n可用工具: {', '.join(tools.keys())}")
     
+    service = service_url(args.service)
+    if service:
+        if check_service(service):
+            print(f"✓ 转换服务 (bulk): {service}，服务失败的文件再用本地方法")
+        else:
+            print(f"⚠ 转换服务不可用: {service}，全部在本地转换")
+            service = None
+    
     # 获取EPS文件
     eps_files = get_eps_files()
     
@@ -322,6 +342,18 @@ def main():
         input("按回车键退出...")
         return
     
+    journal_file = Path.cwd() / JOURNAL_NAME
+    skipped_count = 0
+    if args.resume:
+        done = completed_files(journal_file, Path.cwd())
+        skipped_count = sum(1 for f in eps_files if f.name in done)
+        eps_files = [f for f in eps_files if f.name not in done]
+        print(f"\n✓ 续传: 跳过 {skipped_count} 个已完成的文件")
+        if not eps_files:
+            print("所有文件均已完成")
+            input("按回车键退出...")
+            return
+    
     print(f"\n找到 {len(eps_files)} 个EPS文件:")
     for i, file in enumerate(eps_files[:10], 1):
         file_size = file.stat().st_size / 1024
@@ -343,18 +375,26 @@ def main():
     success_count = 0
     fail_count = 0
     
-    for i, eps_file in enumerate(eps_files, 1):
-        print(f"\n[{i}/{len(eps_files)}] ", end="")
-        if convert_eps_to_svg(eps_file, tools, scale_factor=3):
-            success_count += 1
-        else:
-            fail_count += 1
+    failure_cache = load_failure_cache()
+    
+    with open_journal(journal_file, resume=args.resume, scale_factor=3) as journal:
+        for i, eps_file in enumerate(eps_files, 1):
+            print(f"\n[{i}/{len(eps_files)}] ", end="")
+            if convert_eps_to_svg(eps_file, tools, scale_factor=3, journal=journal,
+                                  failure_cache=failure_cache,
+                                  retry_failed=args.retry_failed, optimize=args.optimize,
+                                  service=service):
+                success_count += 1
+            else:
+                fail_count += 1
     
     # 显示结果
     print("\n" + "=" * 60)
     print("转换完成!")
     print(f"成功: {success_count} 个文件")
     print(f"失败: {fail_count} 个文件")
+    if skipped_count:
+        print(f"跳过: {skipped_count} 个已完成的文件")
     
     if success_count > 0:
         print(f"\nSVG文件已保存在: {Path.cwd()}")
@@ -366,6 +406,7 @@ if __name__ == "__main__":
         main()
     except KeyboardInterrupt:
         print("\n\n操作被用户中断")
+        print("使用 --resume 可从中断处继续")
         input("按回车键退出...")
     except Exception as e:
         print(f"\n程序出错: {e}")
@@ -0,0 +1,323 @@
+#!/usr/bin/env python3
+"""
+EPS 监视目录守护进程
+监视目录中的EPS文件（Linux使用inotify，其他系统轮询），文件停止增长后自动转换为PNG/SVG，
+删除EPS时同步删除其输出；工作队列有上限，队列满时暂缓派发（背压）
+"""
+
+import os
+import sys
+import time
+import queue
+import select
+import struct
+import argparse
+import threading
+from pathlib import Path
+
+from eps_core import find_ghostscript, convert
+from tool_sandbox import reap_orphans
+from output_layout import output_path, remove_output
+
+EPS_SUFFIXES = ('.eps', '.EPS')
+OUTPUT_SUFFIXES = {'png': '.png', 'svg': '.svg'}
+
+# inotify 事件掩码（见 <sys/inotify.h>）
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_Q_OVERFLOW = 0x00004000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+WATCH_MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+EVENT_HEADER = struct.Struct('iIII')
+
+
+def is_eps(path):
+    return path.suffix in EPS_SUFFIXES
+
+
+def file_signature(path):
+    """文件的 (大小, 修改时间)，文件不存在返回None"""
+    try:
+        st = path.stat()
+    except FileNotFoundError:
+        return None
+    return st.st_size, st.st_mtime_ns
+
+
+def scan_directories(directories):
+    """扫描目录中的所有EPS文件，返回 {路径: 签名}"""
+    snapshot = {}
+    for directory in directories:
+        for path in directory.iterdir():
+            if is_eps(path) and path.is_file():
+                signature = file_signature(path)
+                if signature is not None:
+                    snapshot[path] = signature
+    return snapshot
+
+
+# ---------------------------------------------------------------- 文件事件源
+
+def open_inotify(directories):
+    """打开inotify并监视目录，不支持时返回None"""
+    if not sys.platform.startswith('linux'):
+        return None
+    try:
+        import ctypes
+        import ctypes.util
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if fd < 0:
+            return None
+        watches = {}
+        for directory in directories:
+            wd = libc.inotify_add_watch(fd, os.fsencode(directory), WATCH_MASK)
+            if wd < 0:
+                os.close(fd)
+                return None
+            watches[wd] = directory
+        return fd, watches
+    except (OSError, AttributeError):
+        return None
+
+
+def read_inotify(inotify, timeout):
+    """等待inotify事件，返回 (变化的路径集合, 删除的路径集合, 是否需要全量重扫)"""
+    fd, watches = inotify
+    changed, deleted = set(), set()
+    ready, _, _ = select.select([fd], [], [], timeout)
+    if not ready:
+        return changed, deleted, False
+    try:
+        data = os.read(fd, 64 * 1024)
+    except BlockingIOError:
+        return changed, deleted, False
+
+    offset = 0
+    overflow = False
+    while offset + EVENT_HEADER.size <= len(data):
+        wd, mask, _, name_len = EVENT_HEADER.unpack_from(data, offset)
+        offset += EVENT_HEADER.size
+        name = data[offset:offset + name_len].rstrip(b'\0')
+        offset += name_len
+        if mask & IN_Q_OVERFLOW:
+            overflow = True
+            continue
+        if wd not in watches or not name:
+            continue
+        path = watches[wd] / os.fsdecode(name)
+        if not is_eps(path):
+            continue
+        if mask & (IN_DELETE | IN_MOVED_FROM):
+            deleted.add(path)
+            changed.discard(path)
+        else:
+            changed.add(path)
+            deleted.discard(path)
+    return changed, deleted, overflow
+
+
+def diff_snapshots(old, new):
+    """对比两次轮询快照，返回 (变化的路径集合, 删除的路径集合)"""
+    changed = {p for p, sig in new.items() if old.get(p) != sig}
+    deleted = set(old) - set(new)
+    return changed, deleted
+
+
+# ---------------------------------------------------------------- 转换任务
+
+def outputs_for(eps_file, formats):
+    return [output_path(eps_file, OUTPUT_SUFFIXES[fmt]) for fmt in formats]
+
+
+def needs_conversion(eps_file, formats):
+    """输出缺失或比源文件旧时需要转换"""
+    try:
+        src_mtime = eps_file.stat().st_mtime
+    except FileNotFoundError:
+        return False
+    for out_file in outputs_for(eps_file, formats):
+        try:
+            if out_file.stat().st_mtime < src_mtime:
+                return True
+        except FileNotFoundError:
+            return True
+    return False
+
+
+def remove_outputs(eps_file, formats):
+    """源文件删除后清理其输出（及输出索引中的记录）"""
+    for fmt in formats:
+        if remove_output(eps_file, OUTPUT_SUFFIXES[fmt]):
+            print(f"🗑 已删除输出: {eps_file.stem}{OUTPUT_SUFFIXES[fmt]}")
+
+
+def worker_loop(work_queue, state, gs_path, formats, dpi, scale_factor):
+    """工作线程：从队列取文件并转换"""
+    while True:
+        eps_file = work_queue.get()
+        if eps_file is None:
+            work_queue.task_done()
+            return
+        try:
+            if eps_file.exists():
+                convert(eps_file, gs_path, formats, dpi, scale_factor)
+        except Exception as e:
+            print(f"❌ {eps_file.name} 转换异常: {e}")
+        finally:
+            with state['lock']:
+                state['in_flight'].discard(eps_file)
+                # 转换期间文件又被修改，重新排队
+                if eps_file in state['dirty']:
+                    state['dirty'].discard(eps_file)
+                    state['pending'][eps_file] = (file_signature(eps_file), time.monotonic())
+            work_queue.task_done()
+
+
+# ---------------------------------------------------------------- 主循环
+
+def watch(directories, gs_path, formats, dpi=450, scale_factor=3, settle=2.0,
+          poll_interval=1.0, workers=2, queue_size=16, force_polling=False, stop_event=None):
+    """监视目录直到 stop_event 被设置（或 Ctrl-C）"""
+    directories = [Path(d).resolve() for d in directories]
+    stop_event = stop_event or threading.Event()
+    work_queue = queue.Queue(maxsize=queue_size)
+    state = {
+        'lock': threading.Lock(),
+        'pending': {},      # 路径 -> (签名, 最后变化时间)，等待文件稳定
+        'in_flight': set(), # 已派发或正在转换
+        'dirty': set(),     # 转换期间又发生变化
+    }
+
+    threads = [threading.Thread(target=worker_loop, daemon=True,
+                                args=(work_queue, state, gs_path, formats, dpi, scale_factor))
+               for _ in range(workers)]
+    for t in threads:
+        t.start()
+
+    inotify = None if force_polling else open_inotify(directories)
+    print(f"✓ 监视方式: {'inotify' if inotify else f'轮询 ({poll_interval}s)'}")
+    for directory in directories:
+        print(f"✓ 监视目录: {directory}")
+
+    def mark_changed(paths):
+        now = time.monotonic()
+        with state['lock']:
+            for path in paths:
+                if path in state['in_flight']:
+                    state['dirty'].add(path)
+                else:
+                    state['pending'][path] = (file_signature(path), now)
+
+    # 启动时补齐缺失或过期的输出
+    snapshot = scan_directories(directories)
+    mark_changed(p for p in snapshot if needs_conversion(p, formats))
+
+    backpressure = False
+    try:
+        while not stop_event.is_set():
+            if inotify:
+                changed, deleted, overflow = read_inotify(inotify, min(0.5, settle))
+                if overflow:
+                    print("⚠ inotify事件队列溢出，重新扫描目录")
+                    snapshot = scan_directories(directories)
+                    changed = {p for p in snapshot if needs_conversion(p, formats)}
+            else:
+                stop_event.wait(poll_interval)
+                new_snapshot = scan_directories(directories)
+                changed, deleted = diff_snapshots(snapshot, new_snapshot)
+                snapshot = new_snapshot
+
+            for path in deleted:
+                with state['lock']:
+                    state['pending'].pop(path, None)
+                remove_outputs(path, formats)
+            mark_changed(changed)
+
+            # 派发已稳定的文件：大小和修改时间在 settle 秒内没有变化
+            now = time.monotonic()
+            with state['lock']:
+                candidates = [(p, sig, t) for p, (sig, t) in state['pending'].items()
+                              if now - t >= settle]
+            for path, signature, _ in candidates:
+                current = file_signature(path)
+                with state['lock']:
+                    if current is None:
+                        state['pending'].pop(path, None)
+                        continue
+                    if current != signature:
+                        state['pending'][path] = (current, now)
+                        continue
+                    try:
+                        work_queue.put_nowait(path)
+                    except queue.Full:
+                        # 背压：保留在pending中，等工作线程腾出队列
+                        if not backpressure:
+                            print(f"⏳ 工作队列已满 ({queue_size})，暂缓派发")
+                            backpressure = True
+                        break
+                    backpressure = False
+                    del state['pending'][path]
+                    state['in_flight'].add(path)
+    finally:
+        if inotify:
+            os.close(inotify[0])
+        # 丢弃尚未开始的任务，只等待正在进行的转换
+        while True:
+            try:
+                work_queue.get_nowait()
+                work_queue.task_done()
+            except queue.Empty:
+                break
+        for _ in threads:
+            work_queue.put(None)
+        for t in threads:
+            t.join()
+
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description="EPS 监视目录自动转换")
+    parser.add_argument('directories', nargs='*', default=['.'], help="监视的目录")
+    parser.add_argument('--format', nargs='+', choices=['png', 'svg'], default=['png'],
+                        dest='formats')
+    parser.add_argument('--dpi', type=int, default=450, help="PNG分辨率")
+    parser.add_argument('--scale', type=float, default=3, help="SVG缩放倍数")
+    parser.add_argument('--settle', type=float, default=2.0, help="文件停止变化多少秒后转换")
+    parser.add_argument('--poll-interval', type=float, default=1.0, help="轮询间隔秒")
+    parser.add_argument('--polling', action='store_true', help="强制使用轮询")
+    parser.add_argument('-j', '--workers', type=int, default=2, help="转换线程数")
+    parser.add_argument('--queue-size', type=int, default=16, help="工作队列上限")
+    args = parser.parse_args()
+
+    print("EPS 监视目录守护进程")
+    print("=" * 60)
+
+    reap_orphans()
+    gs_path, gs_version = find_ghostscript()
+    if not gs_path:
+        print("❌ 未找到 Ghostscript")
+        return 1
+    print(f"✓ Ghostscript: {gs_version}")
+
+    for directory in args.directories:
+        if not Path(directory).is_dir():
+            print(f"❌ 目录不存在: {directory}")
+            return 1
+
+    print(f"✓ 输出格式: {', '.join(args.formats)}  (Ctrl-C 退出)")
+    try:
+        watch(args.directories, gs_path, args.formats, args.dpi, args.scale,
+              args.settle, args.poll_interval, args.workers, args.queue_size, args.polling)
+    except KeyboardInterrupt:
+        print("\n已停止监视")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
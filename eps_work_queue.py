@@ -0,0 +1,355 @@
+#!/usr/bin/env python3
+"""
+EPS 多节点共享工作队列
+在共享文件系统（NFS/SMB）上用锁文件目录协调多台机器：
+节点以限时租约认领文件并定期续约，过期租约可被其他节点回收，结果集中记录
+
+目录结构:
+    queue_dir/meta.json         源目录等队列信息
+    queue_dir/tasks/<id>.json   待转换文件
+    queue_dir/leases/<id>.lease 租约（O_EXCL 原子创建）
+    queue_dir/done/<id>.json    转换结果
+"""
+
+import os
+import sys
+import json
+import time
+import uuid
+import random
+import socket
+import hashlib
+import argparse
+import threading
+import multiprocessing
+from pathlib import Path
+from datetime import datetime
+
+from eps_core import find_ghostscript, get_eps_files, convert
+from tool_sandbox import reap_orphans
+
+DEFAULT_LEASE_SECONDS = 120
+
+
+def _write_json_atomic(path, data):
+    """先写临时文件再改名，读者不会看到写了一半的JSON"""
+    tmp = path.with_name(f".{path.name}.{uuid.uuid4().hex}.tmp")
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def _read_json(path):
+    try:
+        return json.loads(path.read_text(encoding='utf-8'))
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def task_id(name):
+    return hashlib.sha1(name.encode('utf-8')).hexdigest()[:16]
+
+
+def init_queue(queue_dir, source_dir):
+    """创建队列并加入源目录下的所有EPS文件，返回新增任务数"""
+    queue_dir = Path(queue_dir)
+    source_dir = Path(source_dir).resolve()
+    for sub in ('tasks', 'leases', 'done'):
+        (queue_dir / sub).mkdir(parents=True, exist_ok=True)
+    _write_json_atomic(queue_dir / 'meta.json', {'source_root': str(source_dir)})
+
+    cwd = Path.cwd()
+    os.chdir(source_dir)
+    try:
+        eps_files = get_eps_files()
+    finally:
+        os.chdir(cwd)
+
+    added = 0
+    for eps_file in eps_files:
+        name = eps_file.name
+        task_file = queue_dir / 'tasks' / f"{task_id(name)}.json"
+        if not task_file.exists():
+            _write_json_atomic(task_file, {'name': name})
+            added += 1
+    return added
+
+
+# ---------------------------------------------------------------- 租约
+
+def try_claim(queue_dir, tid, node, lease_seconds):
+    """尝试认领任务，成功返回租约令牌，失败返回None"""
+    lease_file = Path(queue_dir) / 'leases' / f"{tid}.lease"
+    token = uuid.uuid4().hex
+    lease = {'node': node, 'token': token, 'expires': time.time() + lease_seconds}
+
+    for _ in range(2):
+        try:
+            fd = os.open(lease_file, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644)
+        except FileExistsError:
+            current = _read_json(lease_file)
+            if current is not None and current.get('expires', 0) > time.time():
+                return None
+            if current is None and not _abandoned(lease_file, lease_seconds):
+                return None  # 其他节点刚创建、还没写入内容的租约
+            # 租约过期：改名是原子的，只有一个节点能回收成功
+            stale = lease_file.with_name(f"{lease_file.name}.stale.{token}")
+            try:
+                os.rename(lease_file, stale)
+            except FileNotFoundError:
+                return None
+            # 读取和改名之间租约可能已被续约或被其他节点回收重建，改走的必须还是同一个过期租约
+            if _read_json(stale) != current:
+                _restore_lease(stale, lease_file)
+                return None
+            stale.unlink()
+            continue
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(lease, f)
+            f.flush()
+            os.fsync(f.fileno())
+        return token
+    return None
+
+
+def _abandoned(lease_file, lease_seconds):
+    """无法解析的租约（创建后还没写入就中断）超过一个租期未修改才视为过期"""
+    try:
+        return lease_file.stat().st_mtime + lease_seconds <= time.time()
+    except FileNotFoundError:
+        return False
+
+
+def _restore_lease(stale, lease_file):
+    """把误改走的租约放回原处；原处已有新租约时不覆盖（link 不会替换已存在的文件）"""
+    try:
+        os.link(stale, lease_file)
+    except FileExistsError:
+        pass
+    except OSError:
+        # 不支持硬链接的共享文件系统：原处为空时改名放回
+        if not lease_file.exists():
+            os.replace(stale, lease_file)
+            return
+    stale.unlink()
+
+
+def owns_lease(queue_dir, tid, token):
+    lease = _read_json(Path(queue_dir) / 'leases' / f"{tid}.lease")
+    return lease is not None and lease.get('token') == token
+
+
+def renew_lease(queue_dir, tid, node, token, lease_seconds):
+    """续约；租约已被其他节点回收时返回False"""
+    if not owns_lease(queue_dir, tid, token):
+        return False
+    lease_file = Path(queue_dir) / 'leases' / f"{tid}.lease"
+    _write_json_atomic(lease_file, {'node': node, 'token': token,
+                                    'expires': time.time() + lease_seconds})
+    return True
+
+
+def release_lease(queue_dir, tid, token):
+    if owns_lease(queue_dir, tid, token):
+        try:
+            (Path(queue_dir) / 'leases' / f"{tid}.lease").unlink()
+        except FileNotFoundError:
+            pass
+
+
+def _heartbeat(queue_dir, tid, node, token, lease_seconds, stop, lost):
+    """后台续约线程"""
+    while not stop.wait(lease_seconds / 3):
+        if not renew_lease(queue_dir, tid, node, token, lease_seconds):
+            lost.set()
+            return
+
+
+# ---------------------------------------------------------------- 工作节点
+
+def run_worker(queue_dir, gs_path, formats, dpi=450, scale_factor=3, node=None,
+               lease_seconds=DEFAULT_LEASE_SECONDS, source_root=None, idle_exit=True):
+    """循环认领并转换任务，没有可认领的任务时返回处理数量"""
+    queue_dir = Path(queue_dir)
+    node = node or f"{socket.gethostname()}:{os.getpid()}"
+    meta = _read_json(queue_dir / 'meta.json') or {}
+    source_root = Path(source_root or meta.get('source_root', '.'))
+    rng = random.Random(node)
+    processed = 0
+
+    while True:
+        done_ids = {p.stem for p in (queue_dir / 'done').glob('*.json')}
+        todo = [p.stem for p in (queue_dir / 'tasks').glob('*.json') if p.stem not in done_ids]
+        if not todo:
+            return processed
+        # 各节点按不同顺序遍历，减少对同一文件的争抢
+        rng.shuffle(todo)
+
+        claimed_any = False
+        for tid in todo:
+            if (queue_dir / 'done' / f"{tid}.json").exists():
+                continue
+            token = try_claim(queue_dir, tid, node, lease_seconds)
+            if token is None:
+                continue
+            claimed_any = True
+            task = _read_json(queue_dir / 'tasks' / f"{tid}.json")
+            eps_file = source_root / task['name']
+
+            stop, lost = threading.Event(), threading.Event()
+            beat = threading.Thread(target=_heartbeat, daemon=True,
+                                    args=(queue_dir, tid, node, token, lease_seconds, stop, lost))
+            beat.start()
+            t0 = time.time()
+            try:
+                ok = convert(eps_file, gs_path, formats, dpi, scale_factor)
+                error = None
+            except Exception as e:
+                ok, error = False, str(e)
+            finally:
+                stop.set()
+                beat.join()
+
+            if lost.is_set():
+                print(f"⚠ {task['name']}: 租约已被其他节点回收，丢弃本次结果")
+                continue
+            _write_json_atomic(queue_dir / 'done' / f"{tid}.json", {
+                'name': task['name'], 'status': 'ok' if ok else 'failed', 'node': node,
+                'seconds': round(time.time() - t0, 3), 'error': error,
+                'finished': datetime.now().isoformat(timespec='seconds'),
+            })
+            release_lease(queue_dir, tid, token)
+            processed += 1
+
+        if not claimed_any:
+            if idle_exit and not _has_live_leases(queue_dir):
+                return processed
+            # 其他节点持有剩余任务，等待它们完成或租约过期
+            time.sleep(min(2, lease_seconds / 4))
+
+
+def _has_live_leases(queue_dir):
+    now = time.time()
+    for lease_file in (Path(queue_dir) / 'leases').glob('*.lease'):
+        lease = _read_json(lease_file)
+        if lease is None or lease.get('expires', 0) > now:
+            return True
+    return False
+
+
+def _worker_process(args):
+    queue_dir, gs_path, formats, dpi, scale_factor, node, lease_seconds, source_root = args
+    return run_worker(queue_dir, gs_path, formats, dpi, scale_factor, node,
+                      lease_seconds, source_root)
+
+
+def queue_status(queue_dir):
+    """汇总队列状态"""
+    queue_dir = Path(queue_dir)
+    tasks = {p.stem for p in (queue_dir / 'tasks').glob('*.json')}
+    results = [_read_json(p) for p in (queue_dir / 'done').glob('*.json')]
+    results = [r for r in results if r]
+    leases = [_read_json(p) for p in (queue_dir / 'leases').glob('*.lease')]
+    now = time.time()
+    by_node = {}
+    for r in results:
+        by_node[r['node']] = by_node.get(r['node'], 0) + 1
+    return {
+        'total': len(tasks),
+        'ok': sum(1 for r in results if r['status'] == 'ok'),
+        'failed': sum(1 for r in results if r['status'] == 'failed'),
+        'leased': sum(1 for l in leases if l and l.get('expires', 0) > now),
+        'expired_leases': sum(1 for l in leases if l and l.get('expires', 0) <= now),
+        'by_node': by_node,
+    }
+
+
+def requeue_failed(queue_dir):
+    """删除失败记录，使其可被重新认领"""
+    count = 0
+    for done_file in (Path(queue_dir) / 'done').glob('*.json'):
+        result = _read_json(done_file)
+        if result and result['status'] == 'failed':
+            done_file.unlink()
+            count += 1
+    return count
+
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description="EPS 多节点共享工作队列")
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    p_init = sub.add_parser('init', help="创建队列并加入EPS文件")
+    p_init.add_argument('queue_dir')
+    p_init.add_argument('source_dir', nargs='?', default='.')
+
+    p_work = sub.add_parser('work', help="作为工作节点处理队列")
+    p_work.add_argument('queue_dir')
+    p_work.add_argument('--format', nargs='+', choices=['png', 'svg'], default=['png'],
+                        dest='formats')
+    p_work.add_argument('--dpi', type=int, default=450)
+    p_work.add_argument('--scale', type=float, default=3)
+    p_work.add_argument('--lease', type=float, default=DEFAULT_LEASE_SECONDS, help="租约秒数")
+    p_work.add_argument('--root', help="本机上的源目录路径（挂载点不同时使用）")
+    p_work.add_argument('-p', '--processes', type=int, default=1, help="本机工作进程数")
+
+    p_status = sub.add_parser('status', help="显示队列状态")
+    p_status.add_argument('queue_dir')
+
+    p_requeue = sub.add_parser('requeue-failed', help="重新排队失败的文件")
+    p_requeue.add_argument('queue_dir')
+
+    args = parser.parse_args()
+
+    if args.command == 'init':
+        added = init_queue(args.queue_dir, args.source_dir)
+        print(f"✓ 已加入 {added} 个新任务: {Path(args.queue_dir).resolve()}")
+        return 0
+
+    if args.command == 'status':
+        status = queue_status(args.queue_dir)
+        print(f"总数: {status['total']}  成功: {status['ok']}  失败: {status['failed']}  "
+              f"处理中: {status['leased']}  过期租约: {status['expired_leases']}")
+        for node, count in sorted(status['by_node'].items()):
+            print(f"  {node}: {count}")
+        return 0
+
+    if args.command == 'requeue-failed':
+        print(f"✓ 已重新排队 {requeue_failed(args.queue_dir)} 个文件")
+        return 0
+
+    reap_orphans()
+    gs_path, gs_version = find_ghostscript()
+    if not gs_path:
+        print("❌ 未找到 Ghostscript")
+        return 1
+    print(f"✓ Ghostscript: {gs_version}")
+
+    host = socket.gethostname()
+    t0 = time.time()
+    if args.processes <= 1:
+        processed = run_worker(args.queue_dir, gs_path, args.formats, args.dpi, args.scale,
+                               None, args.lease, args.root)
+    else:
+        jobs = [(args.queue_dir, gs_path, args.formats, args.dpi, args.scale,
+                 f"{host}:w{i}", args.lease, args.root) for i in range(args.processes)]
+        with multiprocessing.Pool(args.processes) as pool:
+            processed = sum(pool.map(_worker_process, jobs))
+
+    elapsed = time.time() - t0
+    print("\n" + "=" * 60)
+    print(f"本节点处理 {processed} 个文件，用时 {elapsed:.1f}s")
+    status = queue_status(args.queue_dir)
+    print(f"队列: 成功 {status['ok']} / 失败 {status['failed']} / 总数 {status['total']}")
+    return 0
+
+
+if __name__ == "__main__":
+    try:
+        sys.exit(main())
+    except KeyboardInterrupt:
+        print("\n\n操作被用户中断（未完成的租约将在过期后被回收）")
+        sys.exit(130)
@@ -0,0 +1,286 @@
+#!/usr/bin/env python3
+"""
+转换失败分类与负面结果缓存
+把 Ghostscript/Inkscape 的错误输出归类（未定义操作符、缺少字体、超时、limitcheck、文件头损坏等），
+按 文件内容哈希 + 工具版本 记录失败结果；文件或工具链不变时直接跳过已知失败的文件。
+缓存是只追加的JSONL日志：每条失败/删除各追加一行（多个批量/监视进程可同时写入），
+读取时重放，过期记录过多时在文件锁下压缩
+"""
+
+import os
+import re
+import json
+import time
+import shutil
+import signal
+import hashlib
+import subprocess
+from pathlib import Path
+
+try:
+    import fcntl
+except ImportError:  # Windows：不压缩日志
+    fcntl = None
+
+# (分类, 正则) —— 按顺序匹配，先匹配到的优先
+FAILURE_PATTERNS = [
+    ('missing_font', re.compile(
+        r"Can't find \(or can't open\) font|Didn't find this font|/invalidfont|"
+        r"Font \S+ not found|Unable to load default font", re.I)),
+    ('undefined_operator', re.compile(r'Error: /undefined in ')),
+    ('missing_file', re.compile(r'Error: /undefinedfilename|Could not open the file|'
+                                r'No such file', re.I)),
+    ('limitcheck', re.compile(r'Error: /limitcheck|Error: /(exec|dict)?stackoverflow')),
+    ('vmerror', re.compile(r'Error: /VMerror|out of memory', re.I)),
+    ('syntaxerror', re.compile(r'Error: /(syntaxerror|typecheck|rangecheck|unmatchedmark)')),
+    ('ioerror', re.compile(r'Error: /ioerror')),
+    ('cpu_limit', re.compile(r'CPU time limit exceeded')),
+]
+
+FAILURE_LABELS = {
+    'undefined_operator': "未定义的操作符",
+    'missing_font': "缺少字体",
+    'timeout': "超时",
+    'limitcheck': "超出解释器限制 (limitcheck)",
+    'corrupt_header': "文件头损坏",
+    'missing_file': "找不到文件",
+    'vmerror': "内存不足",
+    'syntaxerror': "PostScript语法/类型错误",
+    'ioerror': "读写错误",
+    'cpu_limit': "超出CPU时间上限",
+    'unknown': "未知原因",
+}
+
+# 只与文件内容和工具链有关、重试也不会成功的分类；超时、读写错误和资源不足可能只是当时负载过高
+PERMANENT_CLASSES = {'undefined_operator', 'missing_font', 'limitcheck', 'corrupt_header',
+                     'syntaxerror'}
+
+DETAIL_LIMIT = 2000  # 缓存中保留的错误文本长度
+COMPACT_SLACK = 1000  # 日志行数超过 有效记录数×2 + 此值 时压缩
+
+
+def describe_error(exc):
+    """从subprocess异常中提取 (错误文本, 是否超时)，不截断stderr"""
+    if isinstance(exc, subprocess.TimeoutExpired):
+        return f"timeout after {exc.timeout}s", True
+    stderr = getattr(exc, 'stderr', None)
+    stdout = getattr(exc, 'output', None)
+    parts = [p if isinstance(p, str) else p.decode('utf-8', 'ignore')
+             for p in (stderr, stdout) if p]
+    text = "\n".join(parts) if parts else str(exc)
+    sigxcpu = getattr(signal, 'SIGXCPU', None)
+    if sigxcpu is not None and getattr(exc, 'returncode', None) == -sigxcpu:
+        text += "\nCPU time limit exceeded (SIGXCPU)"
+    return text, False
+
+
+def is_permanent(failure_class):
+    """失败是否确定（内容和工具链不变时重试必然再次失败）"""
+    return failure_class in PERMANENT_CLASSES
+
+
+def has_valid_header(eps_file):
+    """检查PostScript文本头或DOS-EPS二进制头"""
+    try:
+        with open(eps_file, 'rb') as f:
+            header = f.read(4)
+    except OSError:
+        return False
+    return header.startswith(b'%!') or header == b'\xC5\xD0\xD3\xC6'
+
+
+def classify_failure(texts, timed_out=False, eps_file=None):
+    """把错误文本归类，返回 (分类, 关键错误行)"""
+    if isinstance(texts, str):
+        texts = [texts]
+    text = "\n".join(t for t in texts if t)
+    key_lines = [line.strip() for line in text.splitlines()
+                 if line.strip() and not line.startswith('GPL')
+                 and ('Error' in line or 'error' in line or 'font' in line.lower())]
+    detail = "\n".join(key_lines or text.strip().splitlines()[-5:])[:DETAIL_LIMIT]
+
+    if eps_file is not None and not has_valid_header(eps_file):
+        return 'corrupt_header', detail
+    for failure_class, pattern in FAILURE_PATTERNS:
+        if pattern.search(text):
+            return failure_class, detail
+    if timed_out:
+        return 'timeout', detail
+    return 'unknown', detail
+
+
+# ---------------------------------------------------------------- 负面缓存
+
+def cache_path():
+    """缓存日志路径，可用环境变量 EPS_FAILURE_CACHE 覆盖"""
+    override = os.environ.get('EPS_FAILURE_CACHE')
+    if override:
+        return Path(override)
+    return Path.home() / '.eps_converter' / 'failure_cache.jsonl'
+
+
+def file_digest(path):
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def tool_fingerprint(tool_paths, scope=''):
+    """工具链指纹：各可执行文件的路径、大小和修改时间，升级后自动失效
+
+    scope 区分不同的转换流程（各脚本尝试的方法不同，失败结果不能互相套用）
+    """
+    parts = [scope]
+    for path in sorted(p for p in tool_paths if isinstance(p, str)):
+        resolved = shutil.which(path) or path
+        try:
+            st = os.stat(resolved)
+            parts.append(f"{resolved}:{st.st_size}:{int(st.st_mtime)}")
+        except OSError:
+            parts.append(resolved)
+    return hashlib.sha1("|".join(parts).encode('utf-8')).hexdigest()[:16]
+
+
+class _log_lock:
+    """日志旁的锁文件：追加时共享锁，压缩时独占锁（压缩期间的追加不会写进被替换掉的旧文件）"""
+
+    def __init__(self, exclusive=False):
+        self.exclusive = exclusive
+        self.fd = None
+
+    def __enter__(self):
+        if fcntl is not None:
+            path = cache_path()
+            path.parent.mkdir(parents=True, exist_ok=True)
+            self.fd = os.open(str(path.with_name(path.name + '.lock')), os.O_RDWR | os.O_CREAT, 0o644)
+            fcntl.flock(self.fd, fcntl.LOCK_EX if self.exclusive else fcntl.LOCK_SH)
+        return self
+
+    def __exit__(self, *exc):
+        if self.fd is not None:
+            os.close(self.fd)  # 关闭即释放锁
+
+
+def _replay(path, cache):
+    """按顺序重放日志，返回行数；忽略中断造成的残缺行"""
+    lines = 0
+    try:
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                lines += 1
+                try:
+                    record = json.loads(line)
+                    key = record.pop('key')
+                except (ValueError, KeyError, AttributeError):
+                    continue
+                if record.get('forget'):
+                    cache.pop(key, None)
+                else:
+                    cache[key] = record
+    except FileNotFoundError:
+        pass
+    return lines
+
+
+def _legacy_cache():
+    """旧版整体JSON缓存（failure_cache.json），第一次读取时并入日志"""
+    legacy = cache_path().with_suffix('.json')
+    if os.environ.get('EPS_FAILURE_CACHE') or not legacy.exists():
+        return None
+    try:
+        return legacy, json.loads(legacy.read_text(encoding='utf-8'))
+    except (OSError, ValueError):
+        return legacy, {}
+
+
+def load_failure_cache():
+    """读取缓存，返回 {键: 记录}；过期记录过多时压缩日志"""
+    cache = {}
+    lines = _replay(cache_path(), cache)
+    legacy = _legacy_cache()
+    if legacy is not None or lines > len(cache) * 2 + COMPACT_SLACK:
+        with _log_lock(exclusive=True):
+            cache = {}
+            if legacy is not None:
+                cache.update(legacy[1])
+            _replay(cache_path(), cache)  # 持锁重读，包括刚被其他进程追加的记录
+            save_failure_cache(cache)
+            if legacy is not None:
+                legacy[0].unlink()
+    return cache
+
+
+def save_failure_cache(cache):
+    """把当前有效记录整体写成新日志（压缩）；调用方应持有独占锁"""
+    path = cache_path()
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(f'.{os.getpid()}.tmp')
+    with open(tmp, 'w', encoding='utf-8') as f:
+        for key, entry in cache.items():
+            f.write(json.dumps({'key': key, **entry}, ensure_ascii=False) + '\n')
+    os.replace(tmp, path)
+
+
+def _append(record):
+    """追加一行：O_APPEND 下一次 write，多个进程同时追加也不会互相覆盖"""
+    path = cache_path()
+    line = (json.dumps(record, ensure_ascii=False) + '\n').encode('utf-8')
+    with _log_lock():
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd = os.open(str(path), os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, line)
+        finally:
+            os.close(fd)
+
+
+def cache_key(digest, fingerprint):
+    return f"{digest}:{fingerprint}"
+
+
+def lookup_failure(cache, digest, fingerprint):
+    """已知的确定失败时返回缓存记录；旧版本记下的暂时性失败（超时、内存不足等）不算"""
+    entry = cache.get(cache_key(digest, fingerprint))
+    return entry if entry is not None and is_permanent(entry.get('class')) else None
+
+
+def record_failure(cache, digest, fingerprint, name, failure_class, detail):
+    key = cache_key(digest, fingerprint)
+    cache[key] = {
+        'file': name,
+        'class': failure_class,
+        'detail': detail,
+        'ts': round(time.time()),
+    }
+    _append({'key': key, **cache[key]})
+
+
+def forget_failure(cache, digest, fingerprint):
+    """重试成功后删除失败记录"""
+    key = cache_key(digest, fingerprint)
+    if cache.pop(key, None) is not None:
+        _append({'key': key, 'forget': True})
+
+
+def failure_report(cache):
+    """按分类汇总失败记录，返回 [(分类, 数量, 示例文件名列表)]"""
+    groups = {}
+    for entry in cache.values():
+        groups.setdefault(entry['class'], []).append(entry['file'])
+    report = [(cls, len(files), sorted(files)[:5]) for cls, files in groups.items()]
+    return sorted(report, key=lambda item: -item[1])
+
+
+def print_failure_report(cache):
+    report = failure_report(cache)
+    if not report:
+        print("没有失败记录")
+        return
+    total = sum(count for _, count, _ in report)
+    print(f"失败记录: {total} 个文件")
+    for cls, count, examples in report:
+        print(f"  {FAILURE_LABELS.get(cls, cls)} [{cls}]: {count}")
+        for name in examples:
+            print(f"    - {name}")
@@ -0,0 +1,435 @@
+#!/usr/bin/env python3
+"""
+字体资源索引：为 Ghostscript 生成精简的 Fontmap 和 FONTPATH
+
+引用了未嵌入字体的EPS，每次调用 Ghostscript 都要重新搜索 Fontmap 和系统字体目录，字体很多的机器上很慢；
+找不到的字体还要走代用流程。这里一次性扫描语料库中引用的字体（%%DocumentNeededResources、
+%%DocumentFonts、%%IncludeResource、findfont/selectfont）和系统字体目录，生成只包含所需字体的 Fontmap
+（找不到的字体直接映射到相近的标准字体）和对应的 FONTPATH，各转换脚本构建 gs 命令时自动加上
+
+系统字体的扫描结果按 (路径, 大小, 修改时间) 缓存，重建索引时只解析新增或改动的字体文件
+
+用法:
+    python font_index.py build ./figures ./archive      # 扫描语料库并生成 Fontmap
+    python font_index.py build ./figures --font-dir ~/fonts
+    python font_index.py report                          # 缺失字体报告
+    python font_index.py clear
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import struct
+import argparse
+from pathlib import Path
+
+FONT_EXTENSIONS = {'.pfb', '.pfa', '.t1', '.ttf', '.otf'}
+HEAD_BYTES = 256 * 1024         # DSC 注释所在的文件头
+TAIL_BYTES = 64 * 1024          # (atend) 时注释在文件末尾
+
+# Ghostscript 自带的 35 种标准字体，不需要系统字体
+STANDARD_FONTS = {
+    'Times-Roman', 'Times-Bold', 'Times-Italic', 'Times-BoldItalic',
+    'Helvetica', 'Helvetica-Bold', 'Helvetica-Oblique', 'Helvetica-BoldOblique',
+    'Helvetica-Narrow', 'Helvetica-Narrow-Bold', 'Helvetica-Narrow-Oblique',
+    'Helvetica-Narrow-BoldOblique',
+    'Courier', 'Courier-Bold', 'Courier-Oblique', 'Courier-BoldOblique',
+    'Symbol', 'ZapfDingbats', 'ZapfChancery-MediumItalic',
+    'AvantGarde-Book', 'AvantGarde-BookOblique', 'AvantGarde-Demi', 'AvantGarde-DemiOblique',
+    'Bookman-Light', 'Bookman-LightItalic', 'Bookman-Demi', 'Bookman-DemiItalic',
+    'NewCenturySchlbk-Roman', 'NewCenturySchlbk-Italic', 'NewCenturySchlbk-Bold',
+    'NewCenturySchlbk-BoldItalic',
+    'Palatino-Roman', 'Palatino-Italic', 'Palatino-Bold', 'Palatino-BoldItalic',
+}
+# 代用字体：家族 -> (常规, 粗体, 斜体, 粗斜体)
+SUBSTITUTES = {
+    'Times': ('Times-Roman', 'Times-Bold', 'Times-Italic', 'Times-BoldItalic'),
+    'Helvetica': ('Helvetica', 'Helvetica-Bold', 'Helvetica-Oblique', 'Helvetica-BoldOblique'),
+    'Courier': ('Courier', 'Courier-Bold', 'Courier-Oblique', 'Courier-BoldOblique'),
+}
+
+_NAME = rb'[^\s/\[\]{}()<>%]+'
+_DSC_LIST_RE = re.compile(rb'^%%(DocumentNeededResources|DocumentNeededFonts|DocumentFonts|'
+                          rb'DocumentSuppliedResources|DocumentSuppliedFonts):(.*)$', re.M)
+_DSC_CONT_RE = re.compile(rb'^%%\+(.*)$', re.M)
+_INCLUDE_RE = re.compile(rb'^%%(?:IncludeResource:\s*font|IncludeFont:)\s+(' + _NAME + rb')', re.M)
+_EMBEDDED_RE = re.compile(rb'^%%(?:BeginResource:\s*font|BeginFont:)\s+(' + _NAME + rb')|'
+                          rb'/FontName\s*/(' + _NAME + rb')\s+def', re.M)
+_FINDFONT_RE = re.compile(rb'/(' + _NAME + rb')\s+(?:findfont|[-\d.]+\s+selectfont)')
+_TYPE1_NAME_RE = re.compile(rb'%!(?:PS-AdobeFont-1\.\d|FontType1-1\.\d):\s*(' + _NAME + rb')|'
+                            rb'/FontName\s*/(' + _NAME + rb')\s+def')
+_VALID_NAME_RE = re.compile(r'^[!-~]+$')
+
+_args_cache = None
+
+
+def index_dir():
+    """索引目录，可用环境变量 EPS_FONT_INDEX 覆盖"""
+    override = os.environ.get('EPS_FONT_INDEX')
+    if override:
+        return Path(override)
+    return Path.home() / '.eps_converter' / 'fonts'
+
+
+def system_font_dirs():
+    """本机的系统字体目录（只返回存在的），环境变量 EPS_FONT_DIRS 可追加目录"""
+    home = Path.home()
+    if sys.platform.startswith('win'):
+        windir = os.environ.get('WINDIR', r'C:\Windows')
+        dirs = [Path(windir) / 'Fonts']
+        if os.environ.get('LOCALAPPDATA'):
+            dirs.append(Path(os.environ['LOCALAPPDATA']) / 'Microsoft' / 'Windows' / 'Fonts')
+    elif sys.platform == 'darwin':
+        dirs = [Path('/System/Library/Fonts'), Path('/Library/Fonts'), home / 'Library' / 'Fonts']
+    else:
+        dirs = [Path('/usr/share/fonts'), Path('/usr/local/share/fonts'),
+                home / '.fonts', home / '.local' / 'share' / 'fonts']
+    extra = os.environ.get('EPS_FONT_DIRS')
+    if extra:
+        dirs += [Path(d) for d in extra.split(os.pathsep) if d]
+    return [d for d in dirs if d.is_dir()]
+
+
+# ---------------------------------------------------------------- 字体文件
+
+def _postscript_name(table):
+    """从 TrueType/OpenType 的 name 表读取 PostScript 名称（nameID 6）"""
+    if len(table) < 6:
+        return None
+    _, count, string_offset = struct.unpack_from('>HHH', table, 0)
+    for i in range(count):
+        pos = 6 + 12 * i
+        if pos + 12 > len(table):
+            return None
+        platform_id, _, _, name_id, size, offset = struct.unpack_from('>HHHHHH', table, pos)
+        if name_id != 6:
+            continue
+        raw = table[string_offset + offset:string_offset + offset + size]
+        name = raw.decode('utf-16-be' if platform_id in (0, 3) else 'latin-1', errors='ignore')
+        return name.strip('\x00 ') or None
+    return None
+
+
+def font_name(font_file):
+    """字体文件的 PostScript 名称，无法识别时返回None（只读取文件头和 name 表）"""
+    try:
+        with open(font_file, 'rb') as f:
+            if font_file.suffix.lower() in ('.ttf', '.otf'):
+                head = f.read(12)
+                if len(head) < 12 or head[:4] == b'ttcf':
+                    return None  # 字体集合无法在 Fontmap 中单独引用
+                num_tables = struct.unpack_from('>H', head, 4)[0]
+                table_dir = f.read(16 * num_tables)
+                name = None
+                for pos in range(0, len(table_dir) - 15, 16):
+                    tag, _, offset, length = struct.unpack_from('>4sIII', table_dir, pos)
+                    if tag == b'name':
+                        f.seek(offset)
+                        name = _postscript_name(f.read(length))
+                        break
+            else:
+                head = f.read(8192)
+                if head[:2] == b'\x80\x01':
+                    head = head[6:]  # PFB 段头
+                match = _TYPE1_NAME_RE.search(head)
+                name = (match.group(1) or match.group(2)).decode('latin-1') if match else None
+    except (OSError, struct.error):
+        return None
+    return name if name and _VALID_NAME_RE.match(name) else None
+
+
+def scan_font_dirs(dirs, cache=None):
+    """扫描字体目录，返回 {路径: [名称, 大小, 修改时间]}；cache 中未变化的文件不重新解析"""
+    cache = cache or {}
+    fonts = {}
+    for root in dirs:
+        for dirpath, _, filenames in os.walk(root, followlinks=True):
+            for filename in filenames:
+                if os.path.splitext(filename)[1].lower() not in FONT_EXTENSIONS:
+                    continue
+                path = os.path.join(dirpath, filename)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                cached = cache.get(path)
+                if cached and cached[1] == st.st_size and cached[2] == int(st.st_mtime):
+                    fonts[path] = cached
+                else:
+                    fonts[path] = [font_name(Path(path)), st.st_size, int(st.st_mtime)]
+    return fonts
+
+
+# ---------------------------------------------------------------- EPS 字体引用
+
+def _dsc_fonts(data):
+    """从 DSC 注释中取出 (需要的字体, 文件自带的字体)"""
+    needed, supplied = set(), set()
+    for match in _DSC_LIST_RE.finditer(data):
+        keyword, tokens = match.group(1), match.group(2).split()
+        pos = match.end() + 1
+        while True:  # %%+ 续行
+            cont = _DSC_CONT_RE.match(data, pos)
+            if not cont:
+                break
+            tokens += cont.group(1).split()
+            pos = cont.end() + 1
+        if tokens == [b'(atend)']:
+            continue
+        target = supplied if keyword.startswith(b'DocumentSupplied') else needed
+        if keyword.endswith(b'Resources'):
+            # 资源列表形如 "font A B procset P 1 0"：只取 font 后面的名称
+            kind = None
+            for token in tokens:
+                if token in (b'font', b'procset', b'file', b'pattern', b'form', b'encoding'):
+                    kind = token
+                elif kind == b'font':
+                    target.add(token)
+        else:
+            target.update(tokens)
+    return needed, supplied
+
+
+def eps_font_refs(eps_file):
+    """EPS文件引用但未自带的字体名称集合
+
+    优先使用 DSC 注释；没有 DSC 字体注释时退而扫描整个文件中的 findfont/selectfont
+    """
+    with open(eps_file, 'rb') as f:
+        head = f.read(HEAD_BYTES)
+        f.seek(0, os.SEEK_END)
+        size = f.tell()
+        tail = b''
+        if size > HEAD_BYTES:
+            f.seek(max(HEAD_BYTES, size - TAIL_BYTES))
+            tail = f.read()
+
+    needed, supplied = _dsc_fonts(head + b'\n' + tail)
+    needed.update(_INCLUDE_RE.findall(head))
+    if not needed and not supplied:
+        with open(eps_file, 'rb') as f:
+            data = f.read()
+        needed.update(_FINDFONT_RE.findall(data))
+        supplied.update(a or b for a, b in _EMBEDDED_RE.findall(data))
+    else:
+        supplied.update(a or b for a, b in _EMBEDDED_RE.findall(head))
+    names = {n.decode('latin-1') for n in needed - supplied}
+    return {n for n in names if _VALID_NAME_RE.match(n)}
+
+
+def iter_eps(paths):
+    """展开命令行上的文件和目录（目录递归查找 .eps）"""
+    for path in map(Path, paths):
+        if path.is_dir():
+            for dirpath, _, filenames in os.walk(path):
+                for filename in sorted(filenames):
+                    if filename.lower().endswith('.eps'):
+                        yield Path(dirpath) / filename
+        elif path.exists():
+            yield path
+
+
+def substitute_for(name):
+    """为缺失字体挑选相近的标准字体"""
+    lower = name.lower()
+    if 'symbol' in lower:
+        return 'Symbol'
+    if 'dingbat' in lower:
+        return 'ZapfDingbats'
+    if re.search(r'courier|mono|typewriter|consol|code', lower):
+        family = 'Courier'
+    elif 'sans' not in lower and re.search(
+            r'times|serif|roman|garamond|georgia|minion|palat|cambria|century|caslon|baskerv|'
+            r'bodoni|book|song|ming', lower):
+        family = 'Times'
+    else:
+        family = 'Helvetica'
+    bold = bool(re.search(r'bold|black|heavy|demi|semibold', lower))
+    italic = bool(re.search(r'italic|oblique|slant|it$', lower))
+    return SUBSTITUTES[family][bold + 2 * italic]
+
+
+# ---------------------------------------------------------------- 生成索引
+
+def _ps_string(path):
+    """PostScript 字符串字面量；Windows 路径统一用正斜杠"""
+    text = str(path).replace('\\', '/')
+    return '(' + text.replace('(', '\\(').replace(')', '\\)') + ')'
+
+
+def build_index(corpus, font_dirs=None, verbose=True):
+    """扫描语料库和字体目录，生成 Fontmap 和参数文件，返回索引摘要
+
+    只有语料库实际引用的字体进入 Fontmap；找不到的字体映射到代用的标准字体
+    """
+    directory = index_dir()
+    directory.mkdir(parents=True, exist_ok=True)
+    cache_file = directory / 'system_fonts.json'
+    t0 = time.time()
+
+    # 1. 语料库引用的字体
+    refs = {}
+    eps_count = 0
+    for eps_file in iter_eps(corpus):
+        eps_count += 1
+        try:
+            names = eps_font_refs(eps_file)
+        except OSError as e:
+            if verbose:
+                print(f"  ⚠ 无法读取 {eps_file}: {e}")
+            continue
+        for name in names:
+            refs.setdefault(name, []).append(str(eps_file))
+    if verbose:
+        print(f"✓ 扫描 {eps_count} 个EPS文件，引用了 {len(refs)} 种未嵌入字体 ({time.time() - t0:.1f}s)")
+
+    # 2. 系统字体（按大小/修改时间复用上次的解析结果）
+    t1 = time.time()
+    try:
+        cache = json.loads(cache_file.read_text(encoding='utf-8'))
+    except (FileNotFoundError, ValueError):
+        cache = {}
+    # Fontmap 中必须是绝对路径，Ghostscript 的工作目录与这里不同
+    dirs = [Path(d).absolute() for d in (font_dirs or [])] + system_font_dirs()
+    fonts = scan_font_dirs(dirs, cache)
+    tmp = cache_file.with_suffix('.tmp')
+    tmp.write_text(json.dumps(fonts, ensure_ascii=False), encoding='utf-8')
+    os.replace(tmp, cache_file)
+    by_name = {}
+    for path, (name, _, _) in sorted(fonts.items()):
+        if name:
+            # 同名字体优先 Type1（Ghostscript 原生格式），其次先扫描到的
+            current = by_name.get(name)
+            if current is None or (Path(path).suffix.lower() in ('.pfb', '.pfa', '.t1')
+                                   and Path(current).suffix.lower() not in ('.pfb', '.pfa', '.t1')):
+                by_name[name] = path
+    if verbose:
+        print(f"✓ 字体目录中共 {len(fonts)} 个字体文件，{len(by_name)} 种字体 ({time.time() - t1:.1f}s)")
+
+    # 3. 生成 Fontmap：找到的字体指向文件，缺失的字体映射到代用字体
+    found, missing = {}, {}
+    for name in sorted(refs):
+        if name in STANDARD_FONTS:
+            continue
+        if name in by_name:
+            found[name] = by_name[name]
+        else:
+            missing[name] = {'substitute': substitute_for(name), 'files': refs[name]}
+
+    lines = [f"% 由 font_index.py 生成，{time.strftime('%Y-%m-%d %H:%M:%S')}",
+             f"% {len(found)} 种字体，{len(missing)} 种缺失字体使用代用字体"]
+    lines += [f"/{name} {_ps_string(path)} ;" for name, path in found.items()]
+    lines += [f"/{name} /{info['substitute']} ;" for name, info in missing.items()]
+    fontmap = directory / 'Fontmap'
+    tmp = fontmap.with_suffix('.tmp')
+    tmp.write_text('\n'.join(lines) + '\n', encoding='utf-8')
+    os.replace(tmp, fontmap)
+
+    summary = {
+        'built': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'fontmap': str(fontmap),
+        # Ghostscript 只需要能读取这些目录（-dSAFER 下 FONTPATH 中的目录才允许读取）
+        'fontpath': sorted({os.path.dirname(p) for p in found.values()}),
+        'eps_files': eps_count,
+        'found': found,
+        'missing': missing,
+    }
+    args_file = directory / 'gs_fonts.json'
+    tmp = args_file.with_suffix('.tmp')
+    tmp.write_text(json.dumps(summary, indent=2, ensure_ascii=False), encoding='utf-8')
+    os.replace(tmp, args_file)
+    global _args_cache
+    _args_cache = None
+    return summary
+
+
+def load_index():
+    """读取上次生成的索引摘要，没有时返回None"""
+    try:
+        return json.loads((index_dir() / 'gs_fonts.json').read_text(encoding='utf-8'))
+    except FileNotFoundError:
+        return None
+    except ValueError as e:
+        print(f"  ⚠ 字体索引无效，已忽略: {e}")
+        return None
+
+
+def font_args():
+    """生成的 Fontmap 对应的 Ghostscript 参数，没有索引时返回空列表（进程内缓存）
+
+    FONTMAP 同时列出 Ghostscript 自带的 Fontmap.GS，保留标准字体和默认别名
+    """
+    global _args_cache
+    if _args_cache is None:
+        index = load_index()
+        if not index or not Path(index['fontmap']).exists():
+            _args_cache = []
+        else:
+            _args_cache = [f"-sFONTMAP={os.pathsep.join(['Fontmap.GS', index['fontmap']])}"]
+            if index['fontpath']:
+                _args_cache.append(f"-sFONTPATH={os.pathsep.join(index['fontpath'])}")
+    return list(_args_cache)
+
+
+def fontmap_file():
+    """生成的 Fontmap 路径（字符串），用于失败缓存的工具链指纹；没有时返回None"""
+    path = index_dir() / 'Fontmap'
+    return str(path) if path.exists() else None
+
+
+def print_report(index):
+    """按缺失字体汇总受影响的文件"""
+    print(f"索引: {index['fontmap']} ({index['built']})")
+    print(f"EPS文件: {index['eps_files']}  找到字体: {len(index['found'])}  "
+          f"缺失字体: {len(index['missing'])}")
+    if not index['missing']:
+        print("✓ 所有引用的字体都已找到")
+        return
+    print("\n缺失字体（使用代用字体渲染，版面可能不同）:")
+    print("-" * 60)
+    for name, info in sorted(index['missing'].items(), key=lambda item: -len(item[1]['files'])):
+        files = info['files']
+        print(f"  {name:36s} -> {info['substitute']:22s} {len(files)} 个文件")
+        for eps_file in files[:3]:
+            print(f"      {eps_file}")
+        if len(files) > 3:
+            print(f"      ... 还有 {len(files) - 3} 个")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="EPS 字体资源索引")
+    sub = parser.add_subparsers(dest='command', required=True)
+    p_build = sub.add_parser('build', help="扫描语料库和字体目录，生成 Fontmap")
+    p_build.add_argument('corpus', nargs='+', help="EPS文件或目录（递归）")
+    p_build.add_argument('--font-dir', action='append', default=[],
+                         help="额外的字体目录，可重复指定")
+    sub.add_parser('report', help="缺失字体报告")
+    sub.add_parser('clear', help="删除索引，恢复 Ghostscript 默认字体查找")
+    args = parser.parse_args()
+
+    if args.command == 'clear':
+        for name in ('gs_fonts.json', 'Fontmap', 'system_fonts.json'):
+            try:
+                (index_dir() / name).unlink()
+            except FileNotFoundError:
+                pass
+        print(f"✓ 已删除字体索引: {index_dir()}")
+        return 0
+
+    if args.command == 'build':
+        index = build_index(args.corpus, args.font_dir)
+        print(f"✓ 已生成: {index['fontmap']}")
+        print()
+    else:
+        index = load_index()
+        if index is None:
+            print("❌ 还没有字体索引，请先运行: python font_index.py build <语料库目录>")
+            return 1
+    print_report(index)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
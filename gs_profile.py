@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+Ghostscript 渲染参数与本机配置文件
+由 eps_gs_tuner.py 生成，各转换脚本在渲染时自动加载
+"""
+
+import os
+import json
+import platform
+from pathlib import Path
+
+# 默认的光栅渲染参数（对应 -dKey=Value）
+DEFAULT_RENDER_PARAMS = {
+    'TextAlphaBits': 4,         # 文字抗锯齿
+    'GraphicsAlphaBits': 4,     # 图形抗锯齿
+    'DownScaleFactor': 1,       # 不降采样
+}
+
+# 只影响速度、不影响输出像素的参数，可由调优器写入配置文件
+TUNABLE_PARAMS = ('NumRenderingThreads', 'BandHeight', 'BufferSpace', 'MaxBitmap')
+
+_profile_cache = None
+
+
+def profile_path():
+    """本机配置文件路径，可用环境变量 EPS_GS_PROFILE 覆盖"""
+    override = os.environ.get('EPS_GS_PROFILE')
+    if override:
+        return Path(override)
+    host = platform.node() or 'localhost'
+    return Path.home() / '.eps_converter' / f'gs_profile_{host}.json'
+
+
+def load_gs_profile(reload=False):
+    """读取本机调优参数，没有配置文件时返回空字典"""
+    global _profile_cache
+    if _profile_cache is not None and not reload:
+        return dict(_profile_cache)
+
+    params = {}
+    path = profile_path()
+    try:
+        data = json.loads(path.read_text(encoding='utf-8'))
+        params = {k: v for k, v in data.get('params', {}).items() if k in TUNABLE_PARAMS}
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        print(f"  ⚠ 渲染参数配置文件无效，已忽略: {path} ({e})")
+
+    _profile_cache = params
+    return dict(params)
+
+
+def save_gs_profile(params, meta=None):
+    """保存本机调优参数"""
+    global _profile_cache
+    path = profile_path()
+    path.parent.mkdir(parents=True, exist_ok=True)
+    data = {
+        'host': platform.node(),
+        'params': {k: v for k, v in params.items() if k in TUNABLE_PARAMS},
+        'meta': meta or {},
+    }
+    tmp = path.with_suffix('.tmp')
+    tmp.write_text(json.dumps(data, indent=2, ensure_ascii=False), encoding='utf-8')
+    os.replace(tmp, path)
+    _profile_cache = dict(data['params'])
+    return path
+
+
+def resolve_render_params(render_params=None):
+    """合并默认参数、本机配置文件和调用方指定的参数"""
+    params = dict(DEFAULT_RENDER_PARAMS)
+    params.update(load_gs_profile())
+    if render_params:
+        params.update(render_params)
+    return params
+
+
+def render_args(params):
+    """把参数字典转换为Ghostscript命令行参数，值为None的项跳过"""
+    return [f'-d{key}={value}' for key, value in params.items() if value is not None]
@@ -0,0 +1,287 @@
+#!/usr/bin/env python3
+"""
+优先级通道调度
+渲染任务按通道（interactive / bulk）排队，固定数量的常驻工作线程按权重公平分配（步幅调度），
+interactive 通道保留若干工作线程，bulk 任务不能占用；
+没有空闲线程时，interactive 任务抢占正在运行的 bulk 任务：用 SIGSTOP 暂停其 Ghostscript 进程组，
+借用它的位置运行，完成后 SIGCONT 恢复。无法暂停时（Windows、任务还没启动子进程）只能排队等待。
+被暂停的时间不计入 run_limited/run_streaming 的超时
+
+每个任务在工作线程中运行，通过 tool_sandbox.watch_spawns 得知它启动的进程组
+"""
+
+import time
+import threading
+from collections import deque
+from concurrent.futures import Future
+
+from tool_sandbox import watch_spawns, suspend_group, resume_group
+
+# 通道 -> 权重（公平分配的比例）、保留的工作线程数、是否可以抢占其他通道；顺序即优先级
+LANES = {
+    'interactive': {'weight': 4, 'reserved': 1, 'preempt': True},
+    'bulk': {'weight': 1, 'reserved': 0, 'preempt': False},
+}
+DEFAULT_LANE = 'interactive'
+STATS_WINDOW = 10000                  # 统计最近若干个任务的等待/运行时间
+
+
+def create_scheduler(workers, reserved=None, lanes=None):
+    """创建调度器并启动常驻工作线程
+
+    reserved 为 {通道: 保留线程数}，覆盖 LANES 中的设置；保留总数最多为 workers - 1，
+    保证其他通道至少有一个线程可用（只有一个线程时只能靠抢占）
+    """
+    lanes = {name: dict(cfg) for name, cfg in (lanes or LANES).items()}
+    for name, count in (reserved or {}).items():
+        lanes[name]['reserved'] = max(int(count), 0)
+    budget = max(workers - 1, 0)
+    for cfg in lanes.values():
+        cfg['reserved'] = min(cfg['reserved'], budget)
+        budget -= cfg['reserved']
+
+    sched = {
+        'lanes': lanes,
+        'workers': workers,
+        'cond': threading.Condition(),
+        'queues': {name: deque() for name in lanes},
+        'running': {name: 0 for name in lanes},    # 占用常驻线程的任务数
+        'borrowed': {name: 0 for name in lanes},   # 借用被暂停任务位置的任务数
+        'pass': {name: 0.0 for name in lanes},     # 步幅调度的进度，每派发一个任务加 1/权重
+        'vtime': 0.0,
+        'busy': 0,
+        'active': [],
+        'stats': {name: {'wait': deque(maxlen=STATS_WINDOW), 'run': deque(maxlen=STATS_WINDOW),
+                         'done': 0, 'preempted': 0} for name in lanes},
+        'closed': False,
+        'threads': [],
+    }
+    for i in range(workers):
+        t = threading.Thread(target=_worker, args=(sched,), name=f'render-{i}', daemon=True)
+        t.start()
+        sched['threads'].append(t)
+    return sched
+
+
+def submit(sched, lane, fn):
+    """把任务 fn() 放入通道排队，返回 Future"""
+    if lane not in sched['lanes']:
+        raise ValueError(f"未知通道: {lane}（可用: {', '.join(sched['lanes'])}）")
+    job = {'fn': fn, 'future': Future(), 'lane': lane, 'queued': time.monotonic(),
+           'started': None, 'pids': set(), 'suspended': False}
+    with sched['cond']:
+        if sched['closed']:
+            raise RuntimeError("调度器已关闭")
+        _enqueue(sched, job)
+        _preempt(sched)
+        sched['cond'].notify_all()
+    return job['future']
+
+
+def promote(sched, future, lane):
+    """把还在排队的任务移到优先级更高的通道（合并的请求来自更高优先级时），移动了返回True"""
+    order = list(sched['lanes'])
+    with sched['cond']:
+        for name, queue in sched['queues'].items():
+            job = next((j for j in queue if j['future'] is future), None)
+            if job is None:
+                continue
+            if order.index(lane) >= order.index(name):
+                return False
+            queue.remove(job)
+            job['lane'] = lane
+            _enqueue(sched, job)
+            _preempt(sched)
+            sched['cond'].notify_all()
+            return True
+    return False
+
+
+def lane_snapshot(sched):
+    """各通道的排队/运行/暂停数和最近任务的等待、运行时间（毫秒，已排序）"""
+    with sched['cond']:
+        snapshot = {}
+        for name, cfg in sched['lanes'].items():
+            stats = sched['stats'][name]
+            snapshot[name] = {
+                'weight': cfg['weight'],
+                'reserved': cfg['reserved'],
+                'queued': len(sched['queues'][name]),
+                'running': sched['running'][name] + sched['borrowed'][name],
+                'suspended': sum(1 for j in sched['active'] if j['lane'] == name and j['suspended']),
+                'preempted': stats['preempted'],
+                'done': stats['done'],
+                'wait_ms': sorted(stats['wait']),
+                'run_ms': sorted(stats['run']),
+            }
+        return snapshot
+
+
+def shutdown_scheduler(sched, cancel=True):
+    """停止调度：恢复被暂停的任务，cancel 时取消排队中的任务，等待工作线程结束"""
+    with sched['cond']:
+        sched['closed'] = True
+        if cancel:
+            for queue in sched['queues'].values():
+                while queue:
+                    queue.popleft()['future'].cancel()
+        for job in sched['active']:
+            _resume(job)
+        sched['cond'].notify_all()
+    for t in list(sched['threads']):
+        t.join()
+
+
+# ---------------------------------------------------------------- 内部（调用时持有 cond）
+
+def _enqueue(sched, job):
+    lane = job['lane']
+    queue = sched['queues'][lane]
+    if not queue:
+        # 空闲过的通道从当前进度开始，不能攒下额度
+        sched['pass'][lane] = max(sched['pass'][lane], sched['vtime'])
+    queue.append(job)
+
+
+def _may_dispatch(sched, lane):
+    """lane 的任务能否占用一个常驻线程：还在保留额度内，或空闲线程多于其他通道尚未用到的保留数"""
+    free = sched['workers'] - sched['busy']
+    if free <= 0:
+        return False
+    if sched['running'][lane] < sched['lanes'][lane]['reserved']:
+        return True
+    unmet = sum(max(cfg['reserved'] - sched['running'][name], 0)
+                for name, cfg in sched['lanes'].items() if name != lane)
+    return free > unmet
+
+
+def _next_job(sched):
+    """按步幅调度选出下一个可以派发的任务（进度最小的通道，相同时按优先级）"""
+    order = list(sched['lanes'])
+    ready = [name for name in order
+             if sched['queues'][name] and _may_dispatch(sched, name)]
+    if not ready:
+        return None
+    lane = min(ready, key=lambda name: (sched['pass'][name], order.index(name)))
+    sched['vtime'] = sched['pass'][lane]
+    sched['pass'][lane] += 1 / sched['lanes'][lane]['weight']
+    return sched['queues'][lane].popleft()
+
+
+def _preempt(sched):
+    """可抢占通道有任务却没有可用线程时，暂停一个 bulk 任务并借用它的位置"""
+    for lane, cfg in sched['lanes'].items():
+        if not cfg['preempt']:
+            continue
+        while sched['queues'][lane] and not _may_dispatch(sched, lane) and not sched['closed']:
+            victims = [j for j in sched['active']
+                       if not sched['lanes'][j['lane']]['preempt'] and not j['suspended'] and j['pids']]
+            if not victims:
+                break
+            victim = max(victims, key=lambda j: j['started'])  # 最近启动的任务进度最少
+            if not any([suspend_group(pid) for pid in victim['pids']]):
+                break  # 不支持暂停（Windows），只能等待
+            victim['suspended'] = True
+            sched['stats'][victim['lane']]['preempted'] += 1
+            job = sched['queues'][lane].popleft()
+            sched['borrowed'][lane] += 1
+            t = threading.Thread(target=_run_borrowed, args=(sched, job, victim),
+                                 name='render-preempt', daemon=True)
+            sched['threads'].append(t)
+            t.start()
+
+
+def _resume(job):
+    if job['suspended']:
+        job['suspended'] = False
+        for pid in job['pids']:
+            resume_group(pid)
+
+
+# ---------------------------------------------------------------- 工作线程
+
+def _worker(sched):
+    cond = sched['cond']
+    while True:
+        with cond:
+            job = _next_job(sched)
+            while job is None:
+                if sched['closed'] and not any(sched['queues'].values()):
+                    return
+                cond.wait()
+                job = _next_job(sched)
+            sched['busy'] += 1
+            sched['running'][job['lane']] += 1
+            lane = job['lane']
+        try:
+            _run(sched, job)
+        finally:
+            with cond:
+                sched['busy'] -= 1
+                sched['running'][lane] -= 1
+                cond.notify_all()
+
+
+def _run_borrowed(sched, job, victim):
+    """在被暂停任务的位置上运行，之后继续处理排不上常驻线程的可抢占任务，最后恢复被暂停的任务"""
+    cond = sched['cond']
+    lane = job['lane']
+    try:
+        while job is not None:
+            _run(sched, job)
+            with cond:
+                job = None
+                if not sched['closed']:
+                    for name, cfg in sched['lanes'].items():
+                        if cfg['preempt'] and sched['queues'][name] and not _may_dispatch(sched, name):
+                            job = sched['queues'][name].popleft()
+                            sched['borrowed'][lane] -= 1
+                            sched['borrowed'][name] += 1
+                            lane = name
+                            break
+    finally:
+        with cond:
+            sched['borrowed'][lane] -= 1
+            _resume(victim)
+            sched['threads'].remove(threading.current_thread())
+            _preempt(sched)  # 恢复后若还有排队的可抢占任务，再暂停其他任务
+            cond.notify_all()
+
+
+def _run(sched, job):
+    if not job['future'].set_running_or_notify_cancel():
+        return
+    cond = sched['cond']
+
+    def on_spawn(pid, started):
+        with cond:
+            if not started:
+                job['pids'].discard(pid)
+                return
+            job['pids'].add(pid)
+            if job['suspended']:
+                suspend_group(pid)  # 暂停期间启动的进程组也立即暂停
+
+    with cond:
+        job['started'] = time.monotonic()
+        sched['active'].append(job)
+    watch_spawns(on_spawn)
+    try:
+        result = job['fn']()
+    except BaseException as e:
+        error, result = e, None
+    else:
+        error = None
+    finally:
+        watch_spawns(None)
+        finished = time.monotonic()
+        with cond:
+            sched['active'].remove(job)
+            stats = sched['stats'][job['lane']]
+            stats['done'] += 1
+            stats['wait'].append((job['started'] - job['queued']) * 1000)
+            stats['run'].append((finished - job['started']) * 1000)
+    if error is not None:
+        job['future'].set_exception(error)
+    else:
+        job['future'].set_result(result)
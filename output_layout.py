@@ -0,0 +1,308 @@
+#!/usr/bin/env python3
+"""
+输出目录布局
+默认输出写在源文件旁边（flat）；配置输出根目录后可以放到另一块磁盘，
+并按哈希或文件名前缀分到多级子目录，避免单个目录中有几十万个文件。
+输出先写临时文件再原子改名，根目录下的 SQLite 索引记录 源文件 -> 输出 的对应关系
+
+配置保存在 ~/.eps_converter/output_layout.json，可用环境变量覆盖:
+    EPS_OUTPUT_ROOT    输出根目录
+    EPS_OUTPUT_LAYOUT  flat / hash / prefix
+
+用法:
+    python output_layout.py show
+    python output_layout.py set --root /mnt/out --layout hash --depth 2
+    python output_layout.py lookup figure1.eps [--suffix .png]
+"""
+
+import os
+import sys
+import json
+import time
+import sqlite3
+import hashlib
+import argparse
+import threading
+from pathlib import Path
+
+from batch_journal import partial_path, atomic_replace
+
+LAYOUTS = ('flat', 'hash', 'prefix')
+DEFAULT_LAYOUT = {'root': None, 'layout': 'flat', 'depth': 2, 'index': None}
+INDEX_NAME = '.eps_output_index.sqlite'
+# 这些文件系统上 WAL 依赖的共享内存锁不可用，索引改用回滚日志
+NETWORK_FS = ('nfs', 'nfs4', 'cifs', 'smb3', 'smbfs', 'afs', 'ceph', 'glusterfs', 'lustre',
+              '9p', 'fuse.sshfs', 'fuse.glusterfs', 'fuse.cephfs')
+
+_layout_cache = None
+_created_dirs = set()
+_local = threading.local()
+
+
+def config_path():
+    return Path.home() / '.eps_converter' / 'output_layout.json'
+
+
+def load_layout(reload=False):
+    """读取输出布局配置（带缓存），环境变量优先"""
+    global _layout_cache
+    if _layout_cache is None or reload:
+        layout = dict(DEFAULT_LAYOUT)
+        try:
+            layout.update(json.loads(config_path().read_text(encoding='utf-8')))
+        except (FileNotFoundError, ValueError):
+            pass
+        if os.environ.get('EPS_OUTPUT_ROOT'):
+            layout['root'] = os.environ['EPS_OUTPUT_ROOT']
+        if os.environ.get('EPS_OUTPUT_LAYOUT'):
+            layout['layout'] = os.environ['EPS_OUTPUT_LAYOUT']
+        if layout['layout'] not in LAYOUTS:
+            raise ValueError(f"未知的输出布局: {layout['layout']}（可选 {', '.join(LAYOUTS)}）")
+        _layout_cache = layout
+    return _layout_cache
+
+
+def save_layout(layout):
+    path = config_path()
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(f'.{os.getpid()}.tmp')
+    tmp.write_text(json.dumps(layout, ensure_ascii=False, indent=2), encoding='utf-8')
+    os.replace(tmp, path)
+    load_layout(reload=True)
+
+
+def source_key(eps_file):
+    """源文件的哈希键（绝对路径），不同目录中的同名文件不会冲突"""
+    return hashlib.sha1(_source_id(eps_file).encode('utf-8')).hexdigest()
+
+
+def _source_id(eps_file):
+    # abspath 不解析符号链接，避免每个文件多出一串 lstat
+    return os.path.abspath(eps_file)
+
+
+def output_path(eps_file, suffix, layout=None):
+    """计算输出文件路径（纯计算，不访问文件系统）
+
+    flat:   源文件旁边；配置了根目录时直接放在根目录下
+    hash:   root/ab/cd/<名称>.<哈希前8位><后缀>，分布均匀且不会重名
+    prefix: root/f/i/<名称><后缀>，按文件名前缀分目录，便于人工查找（要求文件名唯一）
+    """
+    layout = layout or load_layout()
+    eps_file = Path(eps_file)
+    root = layout.get('root')
+    if not root:
+        return eps_file.with_suffix(suffix)
+    root = Path(root)
+    depth = int(layout.get('depth', 2))
+    stem = eps_file.stem
+
+    if layout['layout'] == 'hash':
+        key = source_key(eps_file)
+        shards = [key[i * 2:i * 2 + 2] for i in range(depth)]
+        return root.joinpath(*shards, f"{stem}.{key[:8]}{suffix}")
+    if layout['layout'] == 'prefix':
+        letters = stem.lower().ljust(depth, '_')[:depth]
+        shards = [c if c.isalnum() else '_' for c in letters]
+        return root.joinpath(*shards, f"{stem}{suffix}")
+    return root / f"{stem}{suffix}"
+
+
+def prepare_output(out_file):
+    """确保分片目录存在并返回临时文件路径；已创建的目录在进程内缓存，不重复mkdir"""
+    parent = Path(out_file).parent
+    if parent not in _created_dirs:
+        parent.mkdir(parents=True, exist_ok=True)
+        _created_dirs.add(parent)
+    return partial_path(out_file)
+
+
+def commit_output(eps_file, out_file, layout=None, record=True):
+    """把写完的临时文件原子替换为最终输出并登记索引，返回文件大小；临时文件为空时返回0
+
+    record=False 用于调用方自行指定的输出路径（如调优时的临时文件），不写入索引
+    """
+    tmp_file = partial_path(out_file)
+    try:
+        size = tmp_file.stat().st_size
+    except FileNotFoundError:
+        return 0
+    if size == 0:
+        discard_output(out_file)
+        return 0
+    atomic_replace(tmp_file, out_file)
+    if record:
+        record_output(eps_file, out_file, size, layout)
+    return size
+
+
+def discard_output(out_file):
+    try:
+        partial_path(out_file).unlink()
+    except FileNotFoundError:
+        pass
+
+
+def remove_output(eps_file, suffix, layout=None):
+    """删除源文件对应的输出及其索引记录，返回是否删除了文件"""
+    out_file = output_path(eps_file, suffix, layout)
+    try:
+        out_file.unlink()
+        removed = True
+    except FileNotFoundError:
+        removed = False
+    db = _connect(layout)
+    if db is not None:
+        with db:
+            db.execute("DELETE FROM outputs WHERE source = ? AND suffix = ?",
+                       (_source_id(eps_file), suffix))
+    return removed
+
+
+# ---------------------------------------------------------------- 索引
+
+def index_path(layout=None):
+    """索引文件路径；未配置根目录（输出在源文件旁边）时没有索引"""
+    layout = layout or load_layout()
+    if layout.get('index'):
+        return Path(layout['index'])
+    if not layout.get('root'):
+        return None
+    return Path(layout['root']) / INDEX_NAME
+
+
+def on_network_fs(path):
+    """path 是否在网络文件系统上：Linux 按 /proc/mounts 中最长匹配的挂载点判断，Windows 看UNC路径"""
+    path = os.path.realpath(path)
+    if os.name == 'nt':
+        return path.startswith('\\\\')
+    try:
+        with open('/proc/mounts', encoding='utf-8') as f:
+            mounts = [line.split()[1:3] for line in f if len(line.split()) >= 3]
+    except OSError:
+        return False
+    best, fstype = '', None
+    for mount_point, kind in mounts:
+        mount_point = mount_point.replace('\\040', ' ')
+        if (path == mount_point or path.startswith(mount_point.rstrip('/') + '/')) \
+                and len(mount_point) > len(best):
+            best, fstype = mount_point, kind
+    return fstype in NETWORK_FS
+
+
+def _connect(layout=None):
+    """每个线程一个连接；本地磁盘上用 WAL 模式允许多个进程同时读写，
+    网络文件系统上用回滚日志（WAL 的共享内存在多台机器之间不共享，并发写会损坏索引）"""
+    path = index_path(layout)
+    if path is None:
+        return None
+    connections = getattr(_local, 'connections', None)
+    if connections is None:
+        connections = _local.connections = {}
+    db = connections.get(path)
+    if db is None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        db = sqlite3.connect(str(path), timeout=30)
+        if on_network_fs(path.parent):
+            db.execute("PRAGMA journal_mode=DELETE")
+            db.execute("PRAGMA synchronous=FULL")
+        else:
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+        db.execute("""CREATE TABLE IF NOT EXISTS outputs (
+                          source TEXT NOT NULL, suffix TEXT NOT NULL, name TEXT NOT NULL,
+                          output TEXT NOT NULL, size INTEGER, ts REAL,
+                          PRIMARY KEY (source, suffix))""")
+        db.execute("CREATE INDEX IF NOT EXISTS outputs_name ON outputs (name)")
+        db.commit()
+        connections[path] = db
+    return db
+
+
+def record_output(eps_file, out_file, size, layout=None):
+    db = _connect(layout)
+    if db is None:
+        return
+    eps_file = Path(eps_file)
+    with db:
+        db.execute("INSERT OR REPLACE INTO outputs VALUES (?, ?, ?, ?, ?, ?)",
+                   (_source_id(eps_file), Path(out_file).suffix, eps_file.name,
+                    str(out_file), size, round(time.time(), 3)))
+
+
+def lookup_output(eps_file, suffix, layout=None):
+    """按源文件查找已登记的输出路径，没有记录返回None"""
+    db = _connect(layout)
+    if db is None:
+        return None
+    row = db.execute("SELECT output FROM outputs WHERE source = ? AND suffix = ?",
+                     (_source_id(eps_file), suffix)).fetchone()
+    return Path(row[0]) if row else None
+
+
+def find_outputs(name, suffix=None, layout=None):
+    """按源文件名查找输出（不同目录中的同名文件都会列出），返回 [(源文件, 输出, 大小)]"""
+    db = _connect(layout)
+    if db is None:
+        return []
+    query = "SELECT source, output, size FROM outputs WHERE name = ?"
+    params = [name]
+    if suffix:
+        query += " AND suffix = ?"
+        params.append(suffix)
+    return db.execute(query, params).fetchall()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="EPS 输出目录布局")
+    sub = parser.add_subparsers(dest='command', required=True)
+    sub.add_parser('show', help="显示当前配置")
+    p_set = sub.add_parser('set', help="修改配置")
+    p_set.add_argument('--root', help="输出根目录（空字符串表示输出到源文件旁边）")
+    p_set.add_argument('--layout', choices=LAYOUTS)
+    p_set.add_argument('--depth', type=int, help="分片目录层数")
+    p_set.add_argument('--index', help="索引文件路径（根目录在NFS上时建议放本地磁盘）")
+    p_lookup = sub.add_parser('lookup', help="按源文件名查找输出")
+    p_lookup.add_argument('name')
+    p_lookup.add_argument('--suffix')
+    args = parser.parse_args()
+
+    if args.command == 'set':
+        # 只修改配置文件中的值，不把环境变量的临时覆盖写进去
+        try:
+            stored = json.loads(config_path().read_text(encoding='utf-8'))
+        except (FileNotFoundError, ValueError):
+            stored = {}
+        stored = {**DEFAULT_LAYOUT, **stored}
+        for key in ('root', 'layout', 'depth', 'index'):
+            value = getattr(args, key)
+            if value is not None:
+                stored[key] = value or None
+        save_layout(stored)
+        args.command = 'show'
+
+    layout = load_layout()
+
+    if args.command == 'show':
+        print(f"配置文件: {config_path()}")
+        print(f"输出根目录: {layout['root'] or '（源文件旁边）'}")
+        print(f"布局: {layout['layout']}  分片层数: {layout['depth']}")
+        index = index_path(layout)
+        if index is None:
+            print("索引: 无")
+        else:
+            mode = '回滚日志（网络文件系统）' if on_network_fs(index.parent) else 'WAL'
+            print(f"索引: {index}  ({mode})")
+        return 0
+
+    rows = find_outputs(Path(args.name).name, args.suffix)
+    if not rows:
+        print("没有找到记录")
+        return 1
+    for source, output, size in rows:
+        print(f"{source} -> {output} ({(size or 0) / 1024:.1f} KB)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,423 @@
+#!/usr/bin/env python3
+"""
+位图矢量化（纯 NumPy）
+把渲染好的位图转成真正的SVG路径，不需要 Inkscape/potrace，也不启动子进程：
+1. 颜色量化：15位直方图上做加权 k-means
+2. 轮廓提取：按面积从大到小逐层取掩码，像素边界边一次性求出，指针跳跃串成闭合轮廓
+3. 曲线拟合：阶梯边取中点、按容差并行删点，拐角保留直线，其余拟合为三次贝塞尔曲线
+每一步都按整幅图的数组运算，不在 Python 中逐像素循环
+
+用法:
+    python raster_tracer.py figure.png                    # 输出 figure.svg
+    python raster_tracer.py figure.png -o out.svg --preset detailed
+    python raster_tracer.py figure.png --colors 4 --tolerance 2 --no-curves
+    python raster_tracer.py figure.eps --scale 3 --draft   # EPS直接渲染，快速预览
+"""
+
+import sys
+import math
+import time
+import argparse
+from pathlib import Path
+
+try:
+    import numpy as np
+    from PIL import Image
+except ImportError:
+    np = None
+    Image = None
+
+# 细节/速度预设：颜色数、删点容差（像素）、忽略的小斑点面积（像素）、
+# 追踪前的最大像素数（超过则先按整数倍缩小）、是否拟合曲线
+PRESETS = {
+    'fast': {'colors': 8, 'tolerance': 1.5, 'min_area': 16, 'max_pixels': 1_000_000,
+             'curves': True},
+    'balanced': {'colors': 16, 'tolerance': 1.0, 'min_area': 6, 'max_pixels': 4_000_000,
+                 'curves': True},
+    'detailed': {'colors': 32, 'tolerance': 0.5, 'min_area': 2, 'max_pixels': 16_000_000,
+                 'curves': True},
+}
+DEFAULT_PRESET = 'balanced'
+KMEANS_ITERATIONS = 10
+CORNER_COS = 0.5           # 转角超过60°视为拐角，不做平滑
+MAX_SIMPLIFY_PASSES = 24
+PRECISION = 1
+
+
+# ---------------------------------------------------------------- 颜色量化
+
+def quantize_colors(rgb, colors):
+    """把 (H, W, 3) uint8 图像量化为不超过 colors 种颜色，返回 (标签图, 调色板 uint8)"""
+    height, width, _ = rgb.shape
+    px = rgb.reshape(-1, 3)
+    # 每通道取高5位作为直方图桶，聚类只在出现过的桶上做
+    keys = ((px[:, 0].astype(np.int32) >> 3) << 10) | ((px[:, 1] >> 3).astype(np.int32) << 5) \
+        | (px[:, 2] >> 3).astype(np.int32)
+    counts = np.bincount(keys, minlength=1 << 15)
+    used = np.flatnonzero(counts)
+    weights = counts[used].astype(np.float64)
+    means = np.stack([np.bincount(keys, weights=px[:, c], minlength=1 << 15)[used]
+                      for c in range(3)], axis=1) / weights[:, None]
+
+    k = min(colors, len(used))
+    # 初始中心：最多的颜色，然后依次取 “出现次数 × 到已有中心距离²” 最大的颜色
+    centers = [means[np.argmax(weights)]]
+    nearest = ((means - centers[0]) ** 2).sum(axis=1)
+    for _ in range(1, k):
+        centers.append(means[np.argmax(weights * nearest)])
+        nearest = np.minimum(nearest, ((means - centers[-1]) ** 2).sum(axis=1))
+    centers = np.array(centers)
+
+    for _ in range(KMEANS_ITERATIONS):
+        assign = ((means[:, None, :] - centers[None, :, :]) ** 2).sum(axis=2).argmin(axis=1)
+        total = np.bincount(assign, weights=weights, minlength=k)
+        moved = np.stack([np.bincount(assign, weights=weights * means[:, c], minlength=k)
+                          for c in range(3)], axis=1)
+        nonempty = total > 0
+        updated = centers.copy()
+        updated[nonempty] = moved[nonempty] / total[nonempty, None]
+        if np.allclose(updated, centers, atol=0.5):
+            centers = updated
+            break
+        centers = updated
+    assign = ((means[:, None, :] - centers[None, :, :]) ** 2).sum(axis=2).argmin(axis=1)
+
+    lookup = np.zeros(1 << 15, dtype=np.int32)
+    lookup[used] = assign
+    labels = lookup[keys].reshape(height, width)
+    return labels, np.clip(np.rint(centers), 0, 255).astype(np.uint8)
+
+
+# ---------------------------------------------------------------- 轮廓提取
+
+def boundary_edges(mask):
+    """掩码的所有边界边（有向，区域在行进方向右侧，y 向下），返回 (起点, 终点, 方向, 顶点行宽)
+
+    方向编码 0:+x 1:+y 2:-x 3:-y；顶点编号 = 行 * (W + 3) + 列，坐标含 1 像素的填充边框
+    """
+    height, width = mask.shape
+    padded = np.zeros((height + 2, width + 2), dtype=bool)
+    padded[1:-1, 1:-1] = mask
+    stride = width + 3
+
+    above, below = padded[:-1, :], padded[1:, :]
+    left, right = padded[:, :-1], padded[:, 1:]
+    parts = []
+    r, c = np.nonzero(below & ~above)          # 上边界: +x
+    s = (r + 1) * stride + c
+    parts.append((s, s + 1, 0))
+    r, c = np.nonzero(above & ~below)          # 下边界: -x
+    s = (r + 1) * stride + c + 1
+    parts.append((s, s - 1, 2))
+    r, c = np.nonzero(left & ~right)           # 右边界: +y
+    s = r * stride + c + 1
+    parts.append((s, s + stride, 1))
+    r, c = np.nonzero(right & ~left)           # 左边界: -y
+    s = (r + 1) * stride + c + 1
+    parts.append((s, s - stride, 3))
+
+    start = np.concatenate([p[0] for p in parts])
+    end = np.concatenate([p[1] for p in parts])
+    dirs = np.concatenate([np.full(len(p[0]), p[2], dtype=np.int8) for p in parts])
+    return start, end, dirs, stride
+
+
+def link_edges(start, end, dirs):
+    """每条边的后继边；鞍点处向右转，使只有对角相接的像素分属不同轮廓"""
+    order = np.argsort(start, kind='stable')
+    sorted_start = start[order]
+    lo = np.searchsorted(sorted_start, end, 'left')
+    hi = np.searchsorted(sorted_start, end, 'right')
+    nxt = order[lo]
+    saddle = np.flatnonzero(hi - lo == 2)
+    if len(saddle):
+        second = order[lo[saddle] + 1]
+        turn_right = dirs[second] == (dirs[saddle] + 1) % 4
+        nxt[saddle] = np.where(turn_right, second, nxt[saddle])
+    return nxt
+
+
+def order_cycles(nxt):
+    """把后继关系分解为闭合轮廓：返回 (按轮廓和行进顺序排列的边下标, 每条边的轮廓编号)
+
+    指针跳跃：log2(n) 轮数组运算求出每个环的最小下标（作为环编号）和到环尾的距离
+    """
+    n = len(nxt)
+    idx = np.arange(n)
+    label = idx.copy()
+    ptr = nxt.copy()
+    span = 1
+    while span < n:
+        label = np.minimum(label, label[ptr])
+        ptr = ptr[ptr]
+        span *= 2
+
+    tail = nxt == label
+    dist = np.where(tail, 0, 1)
+    ptr = np.where(tail, idx, nxt)
+    span = 1
+    while span < n:
+        dist = dist + dist[ptr]
+        ptr = ptr[ptr]
+        span *= 2
+    order = np.lexsort((-dist, label))
+    return order, label[order]
+
+
+def cycle_neighbors(cid):
+    """按轮廓连续排列的点：环内后继/前驱下标、环内序号、所在环的点数"""
+    n = len(cid)
+    change = cid[1:] != cid[:-1]
+    first = np.r_[True, change]
+    last = np.r_[change, True]
+    starts = np.flatnonzero(first)
+    ends = np.flatnonzero(last)
+    which = np.cumsum(first) - 1
+    nxt = np.arange(1, n + 1)
+    nxt[ends] = starts
+    prv = np.arange(-1, n - 1)
+    prv[starts] = ends
+    local = np.arange(n) - starts[which]
+    size = (ends - starts + 1)[which]
+    return nxt, prv, local, size, starts
+
+
+def trace_mask(mask, tolerance, min_area, curves):
+    """把一层掩码转成SVG路径数据；没有轮廓时返回空字符串"""
+    start, end, dirs, stride = boundary_edges(mask)
+    if len(start) == 0:
+        return '', 0, 0
+    order, cid = order_cycles(link_edges(start, end, dirs))
+    vertex = start[order]
+    dirs = dirs[order]
+
+    # 只保留拐点（方向变化处）
+    _, prv, _, _, _ = cycle_neighbors(cid)
+    corner = dirs != dirs[prv]
+    pts = np.stack([vertex % stride - 1, vertex // stride - 1], axis=1).astype(np.float64)[corner]
+    cid = cid[corner]
+
+    # 去掉面积过小的斑点（鞋带公式，按环求和）
+    nxt, prv, _, _, starts = cycle_neighbors(cid)
+    cross = pts[:, 0] * pts[nxt, 1] - pts[nxt, 0] * pts[:, 1]
+    area = np.abs(np.add.reduceat(cross, starts)) / 2
+    keep_cycle = area >= max(min_area, 1)
+    keep = np.repeat(keep_cycle, np.diff(np.r_[starts, len(cid)]))
+    pts, cid = pts[keep], cid[keep]
+    if len(pts) == 0:
+        return '', 0, 0
+
+    # 阶梯边取中点：两侧直边都长于1像素的拐点才保留为真实拐角
+    nxt, prv, _, _, _ = cycle_neighbors(cid)
+    run_out = np.abs(pts[nxt] - pts).sum(axis=1)
+    run_in = run_out[prv]
+    keep_corner = (run_in > 1) & (run_out > 1)
+    mid = (pts + pts[nxt]) / 2
+    pts = np.stack([pts, mid], axis=1).reshape(-1, 2)
+    selected = np.stack([keep_corner, np.ones_like(keep_corner)], axis=1).reshape(-1)
+    cid = np.repeat(cid, 2)[selected]
+    pts = pts[selected]
+
+    pts, cid = simplify(pts, cid, tolerance)
+    d = format_cycles(pts, cid, curves)
+    return d, len(np.unique(cid)), len(pts)
+
+
+# ---------------------------------------------------------------- 曲线拟合
+
+def simplify(pts, cid, tolerance):
+    """并行删点：每轮只考虑环内序号奇偶相同的点（相邻点不会同时删掉），
+    到前后两点连线的距离小于容差就删除，直到连续两轮没有变化"""
+    idle = 0
+    for step in range(MAX_SIMPLIFY_PASSES):
+        nxt, prv, local, size, _ = cycle_neighbors(cid)
+        a, b = pts[prv], pts[nxt]
+        chord = b - a
+        length = np.hypot(chord[:, 0], chord[:, 1])
+        rel = pts - a
+        dist = np.where(length > 1e-9,
+                        np.abs(chord[:, 0] * rel[:, 1] - chord[:, 1] * rel[:, 0])
+                        / np.maximum(length, 1e-9),
+                        np.hypot(rel[:, 0], rel[:, 1]))
+        candidate = (local % 2 == step % 2) & ~((size % 2 == 1) & (local == size - 1))
+        drop = candidate & (size >= 6) & (dist < tolerance)
+        if not drop.any():
+            idle += 1
+            if idle >= 2:
+                break
+            continue
+        idle = 0
+        pts, cid = pts[~drop], cid[~drop]
+    return pts, cid
+
+
+def format_cycles(pts, cid, curves):
+    """生成路径数据：拐角之间用直线，其余用 Catmull-Rom 切线的三次贝塞尔曲线"""
+    nxt, prv, _, _, starts = cycle_neighbors(cid)
+    coords = np.round(pts, PRECISION)
+    if curves:
+        v_in = pts - pts[prv]
+        v_out = pts[nxt] - pts
+        len_in = np.hypot(v_in[:, 0], v_in[:, 1])
+        len_out = np.hypot(v_out[:, 0], v_out[:, 1])
+        cos = (v_in * v_out).sum(axis=1) / np.maximum(len_in * len_out, 1e-9)
+        corner = cos < CORNER_COS
+        tangent = (pts[nxt] - pts[prv]) / 6
+        t_len = np.hypot(tangent[:, 0], tangent[:, 1])
+        # 切线长度不超过相邻边的 1/3，避免曲线越过相邻点
+        limit = np.minimum(len_in, len_out) / 3
+        tangent *= np.minimum(1, limit / np.maximum(t_len, 1e-9))[:, None]
+        tangent[corner] = 0
+        straight = corner & corner[nxt]
+        c1 = np.round(pts + tangent, PRECISION)
+        c2 = np.round(pts[nxt] - tangent[nxt], PRECISION)
+    else:
+        straight = np.ones(len(pts), dtype=bool)
+
+    text = ['%.7g' % v for v in coords.reshape(-1).tolist()]
+    xs, ys = text[0::2], text[1::2]
+    if curves:
+        ctrl = np.concatenate([c1, c2], axis=1).reshape(-1).tolist()
+        ctrl = ['%.7g' % v for v in ctrl]
+    parts = []
+    bounds = list(starts) + [len(pts)]
+    for s, e in zip(bounds[:-1], bounds[1:]):
+        parts.append(f"M{xs[s]} {ys[s]}")
+        for i in range(s, e):
+            j = i + 1 if i + 1 < e else s
+            if straight[i]:
+                parts.append(f"L{xs[j]} {ys[j]}")
+            else:
+                k = i * 4
+                parts.append(f"C{ctrl[k]} {ctrl[k + 1]} {ctrl[k + 2]} {ctrl[k + 3]} {xs[j]} {ys[j]}")
+        parts.append('Z')
+    return ''.join(parts).replace(' -', '-')
+
+
+# ---------------------------------------------------------------- 入口
+
+def open_eps(eps_file, scale_factor=1, draft=False):
+    """用 Pillow 的EPS插件直接按目标分辨率渲染，返回 (已载入的图像, 目标尺寸)
+
+    load(scale=) 只接受整数倍，非整数倍时向上取整渲染，再由SVG的 width/height 声明目标尺寸，
+    不做额外的缩放。draft=True 时按 72 DPI 渲染，用于快速预览
+    """
+    img = Image.open(eps_file)
+    width, height = img.size
+    target = (max(1, round(width * scale_factor)), max(1, round(height * scale_factor)))
+    try:
+        img.load(scale=1 if draft else max(1, math.ceil(scale_factor)))
+    except BaseException:
+        img.close()
+        raise
+    return img, target
+
+
+def trace_image(img, preset=DEFAULT_PRESET, size=None, **overrides):
+    """把 PIL 图像转成SVG文本，返回 (svg文本, 统计)
+
+    size 为SVG声明的宽高（默认等于图像尺寸）；overrides 可覆盖预设中的单项
+    """
+    settings = dict(PRESETS[preset])
+    settings.update({k: v for k, v in overrides.items() if v is not None})
+    t0 = time.perf_counter()
+
+    full_width, full_height = size or img.size
+    factor = math.ceil(math.sqrt(img.size[0] * img.size[1] / settings['max_pixels']))
+    if factor > 1:
+        img = img.reduce(factor)
+    has_alpha = 'A' in img.getbands() or 'transparency' in img.info
+    data = np.asarray(img.convert('RGBA' if has_alpha else 'RGB'))
+    height, width = data.shape[:2]
+
+    labels, palette = quantize_colors(np.ascontiguousarray(data[..., :3]), settings['colors'])
+    if has_alpha:
+        labels[data[..., 3] < 128] = -1
+    counts = np.bincount(labels[labels >= 0].reshape(-1), minlength=len(palette))
+
+    # 最多的颜色作为背景（有透明区域时背景就是透明），其余按面积从大到小分层
+    layers = [c for c in np.argsort(-counts, kind='stable') if counts[c] > 0]
+    background = None
+    if not has_alpha and layers:
+        background = layers.pop(0)
+    rank = np.full(len(palette) + 1, -1, dtype=np.int32)
+    rank[layers] = np.arange(len(layers))
+    rank_img = rank[labels]                      # 标签 -1 取到 rank[-1]，即 -1
+
+    paths = []
+    cycles = points = 0
+    for i, color in enumerate(layers):
+        # 每层的掩码包含后面所有层，上层覆盖下层，相邻颜色之间不会露缝
+        d, n_cycles, n_points = trace_mask(rank_img >= i, settings['tolerance'],
+                                           settings['min_area'], settings['curves'])
+        if d:
+            paths.append((palette[color], d))
+            cycles += n_cycles
+            points += n_points
+
+    out = [f'<?xml version="1.0" encoding="UTF-8"?>\n'
+           f'<svg xmlns="http://www.w3.org/2000/svg" width="{full_width}" height="{full_height}"'
+           f' viewBox="0 0 {width} {height}">']
+    if background is not None:
+        out.append(f'<rect width="{width}" height="{height}" fill="{hex_color(palette[background])}"/>')
+    for color, d in paths:
+        out.append(f'<path fill="{hex_color(color)}" fill-rule="evenodd" d="{d}"/>')
+    out.append('</svg>\n')
+    stats = {'colors': len(layers) + (background is not None), 'paths': cycles,
+             'points': points, 'scale': factor, 'seconds': time.perf_counter() - t0}
+    return '\n'.join(out), stats
+
+
+def hex_color(rgb):
+    return '#%02x%02x%02x' % tuple(int(v) for v in rgb)
+
+
+def trace_to_svg(img, svg_file, preset=DEFAULT_PRESET, size=None, **overrides):
+    """矢量化并写入SVG文件，返回统计"""
+    svg, stats = trace_image(img, preset, size, **overrides)
+    Path(svg_file).write_text(svg, encoding='utf-8')
+    return stats
+
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description="位图矢量化（NumPy）")
+    parser.add_argument('image', help="输入位图（PNG/JPEG等）或EPS")
+    parser.add_argument('-o', '--output', help="输出SVG（默认与输入同名）")
+    parser.add_argument('--preset', choices=list(PRESETS), default=DEFAULT_PRESET,
+                        help="细节/速度预设")
+    parser.add_argument('--colors', type=int, help="颜色数")
+    parser.add_argument('--tolerance', type=float, help="删点容差（像素），越大越简化")
+    parser.add_argument('--min-area', type=int, help="忽略小于该面积（像素）的斑点")
+    parser.add_argument('--max-pixels', type=int, help="超过该像素数时先缩小再追踪")
+    parser.add_argument('--no-curves', action='store_true', help="只输出折线，更快更小")
+    parser.add_argument('--scale', type=float, default=1, help="EPS输入的缩放倍数")
+    parser.add_argument('--draft', action='store_true',
+                        help="EPS输入按 72 DPI 渲染并使用 fast 预设，用于快速预览")
+    args = parser.parse_args()
+
+    if np is None:
+        print("❌ 需要 NumPy 和 PIL/Pillow: pip install numpy Pillow")
+        return 1
+
+    src = Path(args.image)
+    out = Path(args.output) if args.output else src.with_suffix('.svg')
+    size = None
+    preset = 'fast' if args.draft else args.preset
+    if src.suffix.lower() == '.eps':
+        img, size = open_eps(src, args.scale, args.draft)
+    else:
+        img = Image.open(src)
+        img.load()
+    with img:
+        stats = trace_to_svg(img, out, preset, size, colors=args.colors,
+                             tolerance=args.tolerance, min_area=args.min_area,
+                             max_pixels=args.max_pixels,
+                             curves=False if args.no_curves else None)
+    print(f"✓ {out.name}: {stats['colors']} 色, {stats['paths']} 条轮廓, {stats['points']} 个节点, "
+          f"{out.stat().st_size / 1024:.1f} KB, {stats['seconds']:.2f}s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
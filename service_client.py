@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+"""
+转换服务客户端
+批量脚本把渲染交给本地转换服务（eps_service.py），以 bulk 优先级排队，与交互请求共用渲染线程：
+服务按通道调度，交互请求有保留线程，必要时暂停正在运行的批量渲染。
+服务地址取命令行参数或环境变量 EPS_SERVICE_URL；服务不可用时调用方改为在本地转换
+
+用法:
+    python service_client.py                          # 检查服务是否可用，显示各通道状态
+    python service_client.py fig.eps -o fig.png --dpi 300 --priority bulk
+"""
+
+import os
+import sys
+import json
+import argparse
+from pathlib import Path
+
+from output_layout import output_path, prepare_output, commit_output, discard_output
+
+SERVICE_ENV = 'EPS_SERVICE_URL'
+DEFAULT_SERVICE = 'http://127.0.0.1:8765'
+BULK = 'bulk'
+CHUNK_SIZE = 1024 * 1024
+
+
+class ServiceError(RuntimeError):
+    """服务判定转换失败（HTTP 422，暂时性失败为 503）或返回其他错误；failure_class 为服务给出的失败分类"""
+
+    def __init__(self, message, failure_class=None):
+        super().__init__(message)
+        self.failure_class = failure_class
+
+
+def service_url(url=None):
+    """服务地址：参数优先，其次环境变量 EPS_SERVICE_URL；都没有时返回None"""
+    url = url or os.environ.get(SERVICE_ENV)
+    return url.rstrip('/') if url else None
+
+
+def _request(url, data=None, headers=None, timeout=None):
+    # urllib.request 会连带导入 http.client/email，只在真正使用服务时才导入
+    from urllib.request import Request, urlopen
+    return urlopen(Request(url, data=data, headers=headers or {},
+                           method='POST' if data is not None else 'GET'), timeout=timeout)
+
+
+def check_service(url, timeout=2):
+    """服务可用时返回 True"""
+    try:
+        with _request(f"{url}/health", timeout=timeout) as response:
+            return response.status == 200
+    except (OSError, ValueError):
+        return False
+
+
+def service_stats(url, timeout=5):
+    with _request(f"{url}/stats", timeout=timeout) as response:
+        return json.load(response)
+
+
+def fetch_from_service(url, eps_file, fmt, sink, priority=BULK, dpi=450, scale_factor=3,
+                       timeout=None):
+    """上传 eps_file 请服务渲染，结果分块写入 sink（二进制文件对象），返回写入的字节数
+
+    bulk 请求可能排队或被交互请求暂停较长时间，默认不设读超时；
+    服务判定转换失败时抛出 ServiceError，连接失败抛出 OSError
+    """
+    from urllib.parse import urlencode
+    from urllib.error import HTTPError
+    query = urlencode({'format': fmt, 'dpi': dpi, 'scale': scale_factor, 'priority': priority})
+    eps_file = Path(eps_file)
+    try:
+        with open(eps_file, 'rb') as body, \
+                _request(f"{url}/convert?{query}", data=body,
+                         headers={'Content-Length': str(eps_file.stat().st_size),
+                                  'Content-Type': 'application/postscript'},
+                         timeout=timeout) as response:
+            written = 0
+            for chunk in iter(lambda: response.read(CHUNK_SIZE), b''):
+                sink.write(chunk)
+                written += len(chunk)
+            return written
+    except HTTPError as e:
+        try:
+            info = json.loads(e.read().decode('utf-8'))
+        except ValueError:
+            info = {}
+        detail = info.get('detail') or info.get('error') or str(e)
+        raise ServiceError(f"转换服务 HTTP {e.code}: {detail}", info.get('class')) from None
+
+
+def render_via_service(url, eps_file, out_file=None, fmt='png', priority=BULK, dpi=450,
+                       scale_factor=3, timeout=None):
+    """请服务渲染并原子写入输出（默认按输出布局），返回文件大小；失败时抛出异常且不留下临时文件"""
+    indexed = out_file is None
+    out_file = output_path(eps_file, f'.{fmt}') if indexed else Path(out_file)
+    tmp_file = prepare_output(out_file)
+    try:
+        with open(tmp_file, 'wb') as sink:
+            fetch_from_service(url, eps_file, fmt, sink, priority, dpi, scale_factor, timeout)
+        return commit_output(eps_file, out_file, record=indexed)
+    except BaseException:
+        discard_output(out_file)
+        raise
+
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description="EPS 转换服务客户端")
+    parser.add_argument('eps_file', nargs='?', help="要转换的EPS文件（不指定时只检查服务）")
+    parser.add_argument('-o', '--output', help="输出文件（默认按输出布局）")
+    parser.add_argument('--service', help=f"服务地址（默认 ${SERVICE_ENV} 或 {DEFAULT_SERVICE}）")
+    parser.add_argument('--format', choices=['png', 'svg'], default='png')
+    parser.add_argument('--dpi', type=int, default=450)
+    parser.add_argument('--scale', type=float, default=3)
+    parser.add_argument('--priority', choices=['interactive', BULK], default=BULK)
+    args = parser.parse_args()
+
+    url = service_url(args.service) or DEFAULT_SERVICE
+    if not check_service(url):
+        print(f"❌ 转换服务不可用: {url}")
+        return 1
+    if not args.eps_file:
+        stats = service_stats(url)
+        print(f"✓ 转换服务: {url}  (渲染线程 {stats['workers']})")
+        for name, lane in stats.get('lanes', {}).items():
+            print(f"  {name:12s} 排队 {lane['queued']:4d}  运行 {lane['running']:2d}  "
+                  f"暂停 {lane['suspended']:2d}  p50 {lane['p50_ms']} ms  p99 {lane['p99_ms']} ms")
+        return 0
+    try:
+        size = render_via_service(url, args.eps_file, args.output, args.format, args.priority,
+                                  args.dpi, args.scale)
+    except (ServiceError, OSError) as e:
+        print(f"❌ {e}")
+        return 1
+    print(f"✓ {args.eps_file}: {size / 1024:.1f} KB")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,921 @@
+#!/usr/bin/env python3
+"""
+SVG 流式优化
+对 Ghostscript/Inkscape 生成的SVG做后处理，用 iterparse 边读边写，内存占用与文件大小无关：
+- 坐标按指定精度量化，路径统一为绝对坐标的紧凑写法
+- 相邻且样式相同的路径合并为一条（填充路径要求包围盒不相交，保证渲染结果不变）
+- 去掉恒等变换和空的/无属性的分组，只有 transform 的分组直接并入子元素坐标
+- <defs> 中内容相同的字形/符号定义只保留一份，引用改指向保留的那份
+- 删除注释、<metadata> 和 Inkscape/Sodipodi 编辑器属性
+
+用法:
+    python svg_optimizer.py figure.svg                  # 原地优化
+    python svg_optimizer.py figure.svg -o figure.min.svg --precision 1
+    python svg_optimizer.py svg_dir/                    # 目录下的所有SVG
+    python svg_optimizer.py --selfcheck                 # 检查优化前后渲染等价
+"""
+
+import io
+import os
+import re
+import sys
+import time
+import math
+import hashlib
+import argparse
+from pathlib import Path
+from xml.etree.ElementTree import iterparse, parse, ParseError
+
+SVG_NS = 'http://www.w3.org/2000/svg'
+XLINK_NS = 'http://www.w3.org/1999/xlink'
+XML_NS = 'http://www.w3.org/XML/1998/namespace'
+EDITOR_NS = {'http://sodipodi.sourceforge.net/DTD/sodipodi-0.dtd',
+             'http://www.inkscape.org/namespaces/inkscape'}
+DEFAULT_PRECISION = 2
+MAX_MERGE = 200                  # 单条合并路径最多包含的原路径数
+IDENTITY = (1.0, 0.0, 0.0, 1.0, 0.0, 0.0)
+
+STREAMED = {'g', 'a', 'defs'}     # 边读边输出的容器，其他元素读完整个子树后输出
+NON_RENDERED = {'defs', 'symbol', 'clipPath', 'mask', 'pattern', 'marker',
+                'linearGradient', 'radialGradient', 'filter'}
+NUMERIC_ATTRS = {'x', 'y', 'width', 'height', 'x1', 'y1', 'x2', 'y2', 'cx', 'cy',
+                 'r', 'rx', 'ry', 'stroke-width', 'points', 'viewBox', 'transform'}
+INHERITED = ('fill', 'stroke', 'stroke-width', 'stroke-dasharray', 'fill-opacity', 'stroke-opacity')
+ALPHA_PROPS = ('fill', 'stroke', 'fill-opacity', 'stroke-opacity', 'opacity')
+TEXT_CONTENT = {'text', 'tspan', 'textPath'}   # 其中的文本和空白原样保留
+NO_MERGE_ATTRS = {'id', 'opacity', 'fill-opacity', 'stroke-opacity', 'marker-start',
+                  'marker-mid', 'marker-end', 'clip-path', 'mask', 'filter'}
+
+_NUMBER_RE = re.compile(r'[-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?')
+_PATH_TOKEN_RE = re.compile(r'([MmZzLlHhVvCcSsQqTtAa])|(' + _NUMBER_RE.pattern + ')')
+_TRANSFORM_RE = re.compile(r'(matrix|translate|scale|rotate|skewX|skewY)\s*\(([^)]*)\)')
+_HREF_RE = re.compile(r'url\(#([^)]+)\)')
+_ALPHA_COLOR_RE = re.compile(r'(rgba|hsla)\(|(rgb|hsl)\([^)]*/|#([0-9a-f]{4}|[0-9a-f]{8})$|transparent$',
+                             re.I)
+PATH_ARGS = {'M': 2, 'L': 2, 'H': 1, 'V': 1, 'C': 6, 'S': 4, 'Q': 4, 'T': 2, 'Z': 0}
+
+
+def escape(text):
+    """转义文本内容（不用 xml.sax.saxutils：它会连带导入 urllib/http，拖慢所有转换脚本的启动）"""
+    return text.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
+
+
+def quoteattr(value):
+    """属性值转义并加双引号"""
+    return '"' + (escape(value).replace('"', '&quot;').replace('\n', '&#10;')
+                  .replace('\r', '&#13;').replace('\t', '&#9;')) + '"'
+
+
+# ---------------------------------------------------------------- 数值与变换
+
+def format_number(value, precision):
+    text = '%.*f' % (precision, value)
+    if precision > 0:
+        text = text.rstrip('0').rstrip('.')
+    if text in ('-0', ''):
+        return '0'
+    if text.startswith('0.'):
+        return text[1:]
+    if text.startswith('-0.'):
+        return '-' + text[2:]
+    return text
+
+
+
+def quantize_numbers(text, precision):
+    """把属性值中的所有数字按精度重写"""
+    return _NUMBER_RE.sub(lambda m: format_number(float(m.group()), precision), text)
+
+
+def multiply(m1, m2):
+    """先应用 m2 再应用 m1"""
+    a1, b1, c1, d1, e1, f1 = m1
+    a2, b2, c2, d2, e2, f2 = m2
+    return (a1 * a2 + c1 * b2, b1 * a2 + d1 * b2,
+            a1 * c2 + c1 * d2, b1 * c2 + d1 * d2,
+            a1 * e2 + c1 * f2 + e1, b1 * e2 + d1 * f2 + f1)
+
+
+def parse_transform(text):
+    """解析 transform 属性为 6 元矩阵，无法解析时返回None"""
+    matrix = IDENTITY
+    pos = 0
+    for match in _TRANSFORM_RE.finditer(text):
+        if text[pos:match.start()].strip(' ,\t\n'):
+            return None
+        pos = match.end()
+        name = match.group(1)
+        args = [float(v) for v in _NUMBER_RE.findall(match.group(2))]
+        if name == 'matrix' and len(args) == 6:
+            m = tuple(args)
+        elif name == 'translate' and len(args) in (1, 2):
+            m = (1, 0, 0, 1, args[0], args[1] if len(args) == 2 else 0)
+        elif name == 'scale' and len(args) in (1, 2):
+            m = (args[0], 0, 0, args[1] if len(args) == 2 else args[0], 0, 0)
+        elif name == 'rotate' and len(args) in (1, 3):
+            rad = math.radians(args[0])
+            cos, sin = math.cos(rad), math.sin(rad)
+            m = (cos, sin, -sin, cos, 0, 0)
+            if len(args) == 3:
+                cx, cy = args[1], args[2]
+                m = multiply(multiply((1, 0, 0, 1, cx, cy), m), (1, 0, 0, 1, -cx, -cy))
+        elif name == 'skewX' and len(args) == 1:
+            m = (1, 0, math.tan(math.radians(args[0])), 1, 0, 0)
+        elif name == 'skewY' and len(args) == 1:
+            m = (1, math.tan(math.radians(args[0])), 0, 1, 0, 0)
+        else:
+            return None
+        matrix = multiply(matrix, m)
+    if text[pos:].strip(' ,\t\n'):
+        return None
+    return matrix
+
+
+def is_identity(m, eps=1e-9):
+    if m == IDENTITY:
+        return True
+    return all(abs(v - i) <= eps for v, i in zip(m, IDENTITY))
+
+
+def uniform_scale(m, eps=1e-6):
+    """旋转+等比缩放矩阵返回缩放系数，否则返回None（此时线宽无法等价换算）"""
+    a, b, c, d, _, _ = m
+    sx = math.hypot(a, b)
+    sy = math.hypot(c, d)
+    if abs(sx - sy) > eps * max(sx, 1) or abs(a * c + b * d) > eps * max(sx * sy, 1):
+        return None
+    return sx
+
+
+def format_transform(m, precision):
+    a, b, c, d, e, f = m
+    if abs(a - 1) < 1e-9 and abs(b) < 1e-9 and abs(c) < 1e-9 and abs(d - 1) < 1e-9:
+        values = (e, f)
+        name = 'translate'
+    else:
+        values = m
+        name = 'matrix'
+    # 线性部分保留更多位，避免放大后误差明显
+    parts = [format_number(v, max(precision, 4)) for v in values[:-2]] if name == 'matrix' else []
+    parts += [format_number(v, precision) for v in values[-2:]]
+    return f"{name}({' '.join(parts)})"
+
+
+# ---------------------------------------------------------------- 路径
+
+def parse_path(d):
+    """把路径数据转为绝对坐标的段列表 [(命令, [数值])]；含弧线或无法解析时返回None"""
+    segments = []
+    upper = None
+    rel = False
+    count = 0
+    args = []
+    cx = cy = sx = sy = 0.0
+    for letter, number in _PATH_TOKEN_RE.findall(d):
+        if letter:
+            if args or letter in 'Aa':
+                return None
+            if letter in 'Zz':
+                segments.append(('Z', []))
+                cx, cy = sx, sy
+                upper = None
+            else:
+                upper = letter.upper()
+                rel = letter != upper
+                count = PATH_ARGS[upper]
+            continue
+        if upper is None:
+            return None
+        args.append(float(number))
+        if len(args) < count:
+            continue
+        if upper == 'H':
+            cx = args[0] + cx if rel else args[0]
+            segments.append(('H', [cx]))
+        elif upper == 'V':
+            cy = args[0] + cy if rel else args[0]
+            segments.append(('V', [cy]))
+        else:
+            if rel:
+                args = [v + (cy if i & 1 else cx) for i, v in enumerate(args)]
+            segments.append((upper, args))
+            cx, cy = args[-2], args[-1]
+            if upper == 'M':
+                # M 之后的隐式坐标对视为 L
+                sx, sy = cx, cy
+                upper = 'L'
+        args = []
+    if args:
+        return None
+    return segments
+
+
+def transform_segments(segments, m):
+    """对绝对坐标段应用仿射变换（H/V 变换后改写为 L）"""
+    a, b, c, d, e, f = m
+    out = []
+    cx = cy = sx = sy = 0.0
+    for cmd, values in segments:
+        if cmd == 'Z':
+            out.append(('Z', []))
+            cx, cy = sx, sy
+            continue
+        if cmd == 'H':
+            cmd, values = 'L', [values[0], cy]
+        elif cmd == 'V':
+            cmd, values = 'L', [cx, values[0]]
+        pts = []
+        for i in range(0, len(values), 2):
+            x, y = values[i], values[i + 1]
+            pts += [a * x + c * y + e, b * x + d * y + f]
+        cx, cy = values[-2], values[-1]
+        if cmd == 'M':
+            sx, sy = cx, cy
+        out.append((cmd, pts))
+    return out
+
+
+def segments_bbox(segments):
+    """段列表的保守包围盒（含控制点）"""
+    xs, ys = [], []
+    for cmd, values in segments:
+        if cmd == 'H':
+            xs.append(values[0])
+        elif cmd == 'V':
+            ys.append(values[0])
+        else:
+            xs += values[0::2]
+            ys += values[1::2]
+    if not xs or not ys:
+        return None
+    return min(xs), min(ys), max(xs), max(ys)
+
+
+def format_segments(segments, precision):
+    parts = []
+    last = None
+    for cmd, values in segments:
+        numbers = ' '.join(format_number(v, precision) for v in values).replace(' -', '-')
+        if cmd == last and cmd not in 'MZ':
+            parts.append((' ' if numbers and not numbers.startswith('-') else '') + numbers)
+        else:
+            parts.append(cmd + numbers)
+        last = cmd
+    return ''.join(parts)
+
+
+def boxes_overlap(b1, b2):
+    return not (b1[2] < b2[0] or b2[2] < b1[0] or b1[3] < b2[1] or b2[3] < b1[1])
+
+
+# ---------------------------------------------------------------- 输出
+
+def local_name(tag):
+    return tag.rsplit('}', 1)[-1]
+
+
+def parse_style(attrs):
+    """style 属性中的声明，返回 dict"""
+    style = {}
+    for decl in attrs.get('style', '').split(';'):
+        if ':' in decl:
+            key, value = decl.split(':', 1)
+            style[key.strip()] = value.strip()
+    return style
+
+
+def is_translucent(key, value):
+    """颜色带透明度或不透明度小于1；重叠部分会叠加，这样的路径不能合并成一条"""
+    if value is None:
+        return False
+    value = value.strip()
+    if key in ('fill', 'stroke'):
+        return _ALPHA_COLOR_RE.match(value) is not None
+    number = _NUMBER_RE.match(value)
+    if number is None:
+        return False
+    return float(number.group()) / (100 if value.endswith('%') else 1) < 1
+
+
+def optimize_svg_stream(source, out, precision=DEFAULT_PRECISION):
+    """把 source（路径或二进制文件对象）优化后写入 out（文本文件对象），返回统计字典"""
+    stats = {'elements_in': 0, 'elements_out': 0, 'paths_merged': 0,
+             'groups_collapsed': 0, 'transforms_folded': 0, 'defs_deduped': 0}
+    prefixes = {}           # 命名空间URI -> 前缀
+    stack = []              # 流式容器帧
+    leaf_depth = 0
+    alias = {}              # 重复定义的id -> 保留的id
+    referenced = set()
+    def_hashes = {}
+
+    def qname(tag):
+        if tag.startswith('{'):
+            uri, name = tag[1:].split('}', 1)
+            if uri == SVG_NS:
+                return name
+            if uri == XML_NS:
+                return f"xml:{name}"
+            prefix = prefixes.get(uri)
+            return f"{prefix}:{name}" if prefix else name
+        return tag
+
+    def rewrite_refs(key, value):
+        if key in ('href', f'{{{XLINK_NS}}}href') and value.startswith('#'):
+            target = alias.get(value[1:], value[1:])
+            referenced.add(target)
+            return '#' + target
+        if 'url(#' in value:
+            def repl(match):
+                target = alias.get(match.group(1), match.group(1))
+                referenced.add(target)
+                return f'url(#{target})'
+            return _HREF_RE.sub(repl, value)
+        return value
+
+    def clean_attrs(attrs):
+        result = {}
+        for key, value in attrs.items():
+            if key.startswith('{') and key[1:].split('}', 1)[0] in EDITOR_NS:
+                continue
+            value = rewrite_refs(key, value)
+            name = local_name(key)
+            if name == 'transform':
+                m = parse_transform(value)
+                if m is not None:
+                    if is_identity(m):
+                        continue
+                    value = format_transform(m, precision)
+            elif name == 'd':
+                segments = parse_path(value)
+                if segments is not None:
+                    value = format_segments(segments, precision)
+            elif name in NUMERIC_ATTRS and key == name:
+                value = quantize_numbers(value, precision)
+            result[key] = value
+        return result
+
+    def attr_text(attrs):
+        return ''.join(f" {qname(k)}={quoteattr(v)}" for k, v in attrs.items())
+
+    def serialize(elem, attrs=None, verbatim=False):
+        """输出整个子树；文本元素内的空白（包括元素之间的）原样保留"""
+        stats['elements_out'] += 1
+        attrs = clean_attrs(elem.attrib) if attrs is None else attrs
+        verbatim = verbatim or local_name(elem.tag) in TEXT_CONTENT
+        parts = [f"<{qname(elem.tag)}{attr_text(attrs)}"]
+        text = elem.text if elem.text and (verbatim or elem.text.strip() or len(elem) == 0) else None
+        if text is None and len(elem) == 0:
+            parts.append('/>')
+            return ''.join(parts)
+        parts.append('>')
+        if text:
+            parts.append(escape(text))
+        for child in elem:
+            parts.append(serialize(child, verbatim=verbatim))
+            if child.tail and (verbatim or child.tail.strip()):
+                parts.append(escape(child.tail))
+        parts.append(f"</{qname(elem.tag)}>")
+        return ''.join(parts)
+
+    def write(text):
+        """写出子元素前，先补写尚未输出的祖先开始标签"""
+        for frame in stack:
+            if frame['open'] is not None:
+                out.write(frame['open'])
+                frame['open'] = None
+                frame['emitted'] = True
+        out.write(text)
+
+    def effective(frame, attrs, key):
+        style = parse_style(attrs)
+        if key in style:
+            return style[key]
+        if key in attrs:
+            return attrs[key]
+        return frame['inherit'].get(key)
+
+    def flush_merge(frame):
+        pending = frame['merge']
+        if pending is None:
+            return
+        frame['merge'] = None
+        attrs = dict(pending['attrs'])
+        attrs['d'] = ''.join(pending['d'])
+        stats['elements_out'] += 1
+        write(f"<path{attr_text(attrs)}/>")
+
+    def handle_path(frame, elem):
+        """路径：应用折叠的变换，尝试与前一条路径合并"""
+        attrs = dict(elem.attrib)
+        segments = parse_path(attrs.get('d', ''))
+        ctm = frame['ctm']
+        own = attrs.pop('transform', None)
+        m = ctm
+        if own is not None:
+            own_m = parse_transform(own)
+            m = multiply(ctm, own_m) if own_m is not None else None
+
+        fill = effective(frame, attrs, 'fill') or '#000'
+        stroke = effective(frame, attrs, 'stroke') or 'none'
+        declared = set(attrs) | set(parse_style(attrs))
+        # 渐变/图案、裁剪和虚线都依赖原坐标系，这类路径保留 transform 属性
+        foldable = (segments is not None and m is not None
+                    and 'url(' not in fill and 'url(' not in stroke
+                    and not {'clip-path', 'mask', 'filter'} & declared
+                    and effective(frame, attrs, 'stroke-dasharray') in (None, 'none'))
+        if foldable and not is_identity(m) and stroke != 'none':
+            scale = uniform_scale(m)
+            width = _NUMBER_RE.match(effective(frame, attrs, 'stroke-width') or '1')
+            if scale is None or width is None or 'stroke-width' in parse_style(attrs):
+                foldable = False
+            elif abs(scale - 1) > 1e-9:
+                attrs['stroke-width'] = format_number(float(width.group()) * scale,
+                                                      max(precision, 3))
+        if not foldable:
+            flush_merge(frame)
+            if m is not None:
+                if not is_identity(m):
+                    attrs['transform'] = format_transform(m, precision)
+            elif is_identity(ctm):
+                attrs['transform'] = own
+            else:
+                attrs['transform'] = format_transform(ctm, precision) + ' ' + own
+            write(serialize(elem, clean_attrs(attrs)))
+            return
+
+        if not is_identity(m):
+            segments = transform_segments(segments, m)
+            stats['transforms_folded'] += 1
+        attrs.pop('d', None)
+        attrs = clean_attrs(attrs)
+        d = format_segments(segments, precision)
+        bbox = segments_bbox(segments)
+        key = tuple(sorted(attrs.items()))
+        # 透明度可能写在 style 中或从分组继承；半透明的绘制合并后重叠处只叠加一次
+        mergeable = (not NO_MERGE_ATTRS & declared and bbox is not None
+                     and not any(is_translucent(k, effective(frame, attrs, k)) for k in ALPHA_PROPS))
+        filled = fill != 'none'
+
+        pending = frame['merge']
+        if (pending is not None and mergeable and pending['key'] == key
+                and pending['count'] < MAX_MERGE
+                and not (filled and boxes_overlap(bbox, pending['union'])
+                         and any(boxes_overlap(bbox, b) for b in pending['boxes']))):
+            pending['d'].append(d)
+            pending['boxes'].append(bbox)
+            u = pending['union']
+            pending['union'] = (min(u[0], bbox[0]), min(u[1], bbox[1]),
+                                max(u[2], bbox[2]), max(u[3], bbox[3]))
+            pending['count'] += 1
+            stats['paths_merged'] += 1
+            return
+        flush_merge(frame)
+        if mergeable:
+            frame['merge'] = {'key': key, 'attrs': attrs, 'd': [d], 'boxes': [bbox],
+                             'union': bbox, 'count': 1}
+        else:
+            attrs['d'] = d
+            stats['elements_out'] += 1
+            write(f"<path{attr_text(attrs)}/>")
+
+    def handle_leaf(frame, elem):
+        name = local_name(elem.tag)
+        if name == 'metadata' or (elem.tag.startswith('{')
+                                  and elem.tag[1:].split('}', 1)[0] in EDITOR_NS):
+            return  # 编辑器元数据不影响渲染
+        if name == 'path' and elem.tag.startswith(f'{{{SVG_NS}}}') and not frame['in_defs']:
+            handle_path(frame, elem)
+            return
+        flush_merge(frame)
+        attrs = clean_attrs(elem.attrib)
+
+        if frame['in_defs'] and 'id' in attrs:
+            # 内容相同的定义只保留第一份（已被引用过的id必须保留）
+            body = serialize(elem, {k: v for k, v in attrs.items() if k != 'id'})
+            stats['elements_out'] -= 1
+            digest = hashlib.sha1(body.encode('utf-8')).hexdigest()
+            first = def_hashes.get(digest)
+            if first is not None and attrs['id'] not in referenced:
+                alias[attrs['id']] = first
+                stats['defs_deduped'] += 1
+                return
+            def_hashes.setdefault(digest, attrs['id'])
+
+        if not frame['in_defs'] and name not in NON_RENDERED and not is_identity(frame['ctm']):
+            own = parse_transform(attrs.get('transform', '')) if 'transform' in attrs else IDENTITY
+            if own is not None:
+                attrs['transform'] = format_transform(multiply(frame['ctm'], own), precision)
+            else:
+                attrs['transform'] = format_transform(frame['ctm'], precision) + ' ' + attrs['transform']
+        write(serialize(elem, attrs))
+
+    def open_container(elem, parent):
+        name = local_name(elem.tag)
+        attrs = clean_attrs(elem.attrib)
+        in_defs = parent['in_defs'] or name == 'defs'
+        ctm = IDENTITY if in_defs else parent['ctm']
+        inherit = dict(parent['inherit'])
+        style = parse_style(attrs)
+        for key in INHERITED:
+            if key in style or key in attrs:
+                inherit[key] = style.get(key, attrs.get(key))
+
+        frame = {'elem': elem, 'name': name, 'ctm': ctm, 'inherit': inherit, 'in_defs': in_defs,
+                 'merge': None, 'open': None, 'emitted': False, 'close': None}
+        if name == 'g' and not in_defs:
+            own = parse_transform(attrs['transform']) if 'transform' in attrs else IDENTITY
+            if set(attrs) <= {'transform'} and own is not None:
+                # 无属性或只有变换的分组：不输出，变换并入子元素
+                frame['ctm'] = multiply(ctm, own)
+                stats['groups_collapsed'] += 1
+                return frame
+            if not is_identity(ctm):
+                attrs['transform'] = (format_transform(multiply(ctm, own), precision)
+                                      if own is not None else
+                                      format_transform(ctm, precision) + ' ' + attrs['transform'])
+                frame['ctm'] = IDENTITY
+            elif own is not None:
+                frame['ctm'] = IDENTITY
+        elif not in_defs and not is_identity(ctm) and name == 'a':
+            # <a> 不能带变换以外的语义改写，包一层分组承载累积变换
+            frame['open'] = f"<g transform={quoteattr(format_transform(ctm, precision))}>"
+            frame['close'] = '</g>'
+            frame['ctm'] = IDENTITY
+        tag = qname(elem.tag)
+        frame['open'] = (frame['open'] or '') + f"<{tag}{attr_text(attrs)}>"
+        frame['close'] = f"</{tag}>" + (frame['close'] or '')
+        stats['elements_out'] += 1
+        return frame
+
+    def close_container(frame):
+        flush_merge(frame)
+        if frame['emitted']:
+            out.write(frame['close'])
+        elif frame['close'] is not None:
+            stats['elements_out'] -= 1  # 没有任何内容的容器整个省略
+
+    root = None
+    for event, elem in iterparse(source, events=('start', 'end', 'start-ns')):
+        if event == 'start-ns':
+            prefix, uri = elem
+            if uri != SVG_NS and uri not in prefixes:
+                prefixes[uri] = prefix or f"ns{len(prefixes)}"
+            continue
+
+        if event == 'start':
+            stats['elements_in'] += 1
+            if root is None:
+                root = elem
+                ns_attrs = ''.join(f" xmlns:{p}={quoteattr(u)}" for u, p in prefixes.items())
+                out.write('<?xml version="1.0" encoding="UTF-8"?>\n')
+                out.write(f"<{qname(elem.tag)} xmlns={quoteattr(SVG_NS)}{ns_attrs}"
+                          f"{attr_text(dict(elem.attrib))}>")
+                stats['elements_out'] += 1
+                stack.append({'elem': elem, 'name': 'svg', 'ctm': IDENTITY, 'inherit': {},
+                              'in_defs': False, 'merge': None, 'open': None,
+                              'emitted': True, 'close': f"</{qname(elem.tag)}>"})
+            elif leaf_depth:
+                leaf_depth += 1
+            elif local_name(elem.tag) in STREAMED:
+                flush_merge(stack[-1])
+                stack.append(open_container(elem, stack[-1]))
+            else:
+                leaf_depth = 1
+            continue
+
+        # end
+        if leaf_depth > 1:
+            leaf_depth -= 1
+            continue
+        if leaf_depth == 1:
+            leaf_depth = 0
+            handle_leaf(stack[-1], elem)
+            stack[-1]['elem'].remove(elem)
+            continue
+        # 先输出（仍在栈上时）待合并的路径，write() 才会补写本分组的开始标签
+        close_container(stack[-1])
+        stack.pop()
+        if stack:
+            stack[-1]['elem'].remove(elem)
+        elem.clear()
+    out.write('\n')
+    return stats
+
+
+def optimize_svg_file(in_file, out_file=None, precision=DEFAULT_PRECISION):
+    """优化单个SVG文件（out_file 为空时原地替换），返回统计字典；解析失败时抛出 ParseError"""
+    in_file = Path(in_file)
+    out_file = Path(out_file) if out_file else in_file
+    tmp_file = out_file.with_name(f".{out_file.stem}.opt{os.getpid()}{out_file.suffix}")
+    size_in = in_file.stat().st_size
+    t0 = time.perf_counter()
+    try:
+        with open(in_file, 'rb') as src, \
+                open(tmp_file, 'w', encoding='utf-8', buffering=1024 * 1024) as dst:
+            stats = optimize_svg_stream(src, dst, precision)
+        os.replace(tmp_file, out_file)
+    finally:
+        if tmp_file.exists():
+            tmp_file.unlink()
+    elapsed = time.perf_counter() - t0
+    stats.update({
+        'bytes_in': size_in,
+        'bytes_out': out_file.stat().st_size,
+        'seconds': elapsed,
+    })
+    return stats
+
+
+def optimize_in_place(svg_file, precision=DEFAULT_PRECISION):
+    """转换流程中的可选后处理：原地优化并打印结果；优化失败时保留原输出，返回统计或None"""
+    try:
+        stats = optimize_svg_file(svg_file, precision=precision)
+    except (ParseError, OSError) as e:
+        print(f"   ⚠ SVG优化失败，保留原输出: {e}")
+        return None
+    saved = 1 - stats['bytes_out'] / stats['bytes_in'] if stats['bytes_in'] else 0
+    throughput = stats['bytes_in'] / 1024 / 1024 / stats['seconds'] if stats['seconds'] else 0
+    print(f"   优化: {stats['bytes_in'] / 1024:.1f} KB -> {stats['bytes_out'] / 1024:.1f} KB "
+          f"(-{saved:.0%}, {throughput:.1f} MB/s)")
+    return stats
+
+
+# ---------------------------------------------------------------- 等价性检查
+
+SHAPES = {'path', 'rect', 'circle', 'ellipse', 'line', 'polyline', 'polygon', 'text', 'use', 'image'}
+PAINT_PROPS = ('fill', 'stroke', 'stroke-width', 'stroke-dasharray', 'fill-rule', 'fill-opacity',
+               'stroke-opacity', 'stroke-linecap', 'stroke-linejoin', 'stroke-miterlimit',
+               'font-family', 'font-size', 'font-weight', 'font-style')
+CONTEXT_ATTRS = ('opacity', 'clip-path', 'mask', 'filter')   # 不继承、作用于整个子树
+OWN_ATTRS = ('marker-start', 'marker-mid', 'marker-end')
+GEOMETRY_TOLERANCE = 0.05
+
+# 自检用例：Ghostscript/Inkscape 输出中常见的分组填充、描边、变换、裁剪、重复定义和文本
+SELFCHECK_CASES = [
+    ("分组填充+变换", '<g fill="red" transform="translate(5,5)"><path d="M0 0L1 0L1 1Z"/></g>'),
+    ("分组描边", '<g stroke="blue" fill="none"><path d="M0 0L10 0"/><path d="M0 5L10 5"/></g>'),
+    ("矩阵中的裁剪分组",
+     '<defs><clipPath id="clip1"><path d="M0 0H50V50H0Z"/></clipPath></defs>'
+     '<g transform="matrix(2,0,0,2,0,0)"><g clip-path="url(#clip1)">'
+     '<path d="M1 1L20 1L20 20Z"/></g>'
+     '<g clip-path="url(#clip1)"><path fill="#00f" d="M1 1L9 1L9 9Z"/>'
+     '<path d="M30 30L40 30L40 40Z"/></g></g>'),
+    ("嵌套变换+线宽",
+     '<g transform="translate(10 0)"><g transform="scale(2)">'
+     '<rect x="1" y="1" width="2" height="3"/>'
+     '<path stroke="#000" stroke-width="0.5" fill="none" d="M0 0L5 5"/></g></g>'),
+    ("样式继承",
+     '<g style="fill:#0a0;stroke:#333"><rect x="0" y="0" width="4" height="4"/>'
+     '<path d="M10 10h5v5h-5z"/><path d="M20 20h5v5h-5z"/></g>'),
+    ("重复定义",
+     '<defs><clipPath id="c1"><rect width="9" height="9"/></clipPath>'
+     '<clipPath id="c2"><rect width="9" height="9"/></clipPath></defs>'
+     '<g clip-path="url(#c1)"><path d="M0 0L8 8"/></g>'
+     '<g clip-path="url(#c2)" fill="none" stroke="red"><path d="M0 8L8 0"/></g>'),
+    ("链接内的累积变换",
+     '<g transform="translate(3 4)"><a href="#top"><path d="M0 0L1 1Z"/></a></g>'),
+    ("半透明描边交叉",
+     '<path style="fill:none;stroke:#000;stroke-opacity:0.5" d="M0 0L10 10"/>'
+     '<path style="fill:none;stroke:#000;stroke-opacity:0.5" d="M0 10L10 0"/>'),
+    ("继承的半透明",
+     '<g fill-opacity="0.5" stroke="rgba(0,0,0,0.5)"><path fill="none" d="M0 0L10 10"/>'
+     '<path fill="none" d="M0 10L10 0"/><path d="M20 0h5v5h-5z"/><path d="M30 0h5v5h-5z"/></g>'),
+    ("文本空白",
+     '<text xml:space="preserve" x="1" y="10"><tspan>Hello</tspan> <tspan>World</tspan></text>'),
+]
+
+
+def _matrix_key(m):
+    return tuple(float(v) for v in m)
+
+
+def _canonical_value(key, value, ids, depth=0):
+    """属性值的规范形式：数字取1位小数，变换化为矩阵，引用替换为被引用元素的规范形式（不依赖id）"""
+    name = local_name(key)
+    if name in ('href',) and value.startswith('#'):
+        target = ids.get(value[1:])
+        return _canonical(target, ids, depth + 1) if target is not None and depth < 8 else value
+    if 'url(#' in value:
+        target = ids.get(_HREF_RE.search(value).group(1))
+        return _canonical(target, ids, depth + 1) if target is not None and depth < 8 else value
+    if name == 'transform':
+        m = parse_transform(value)
+        return value if m is None else quantize_numbers(format_transform(m, 4), 2)
+    if name == 'd':
+        segments = parse_path(value)
+        if segments is not None:
+            return format_segments(transform_segments(segments, IDENTITY), 1)
+    return quantize_numbers(value, 1)
+
+
+def _canonical(elem, ids, depth=0):
+    """被引用元素（裁剪路径、渐变、符号等）的规范形式，忽略id、恒等变换和编辑器数据"""
+    attrs = []
+    for key, value in sorted(elem.attrib.items()):
+        if local_name(key) == 'id' or (key.startswith('{') and key[1:].split('}', 1)[0] in EDITOR_NS):
+            continue
+        if local_name(key) == 'transform' and parse_transform(value) is not None \
+                and is_identity(parse_transform(value)):
+            continue
+        attrs.append((key, _canonical_value(key, value, ids, depth)))
+    children = tuple(_canonical(child, ids, depth) for child in elem
+                     if local_name(child.tag) != 'metadata')
+    return (local_name(elem.tag), tuple(attrs), (elem.text or '').strip(), children)
+
+
+def drawing_list(source):
+    """SVG实际绘制的图元列表 [(绘制属性, 几何)]
+
+    绘制属性包括继承后的填充/描边（线宽换算到设备坐标）和祖先上的裁剪/遮罩/滤镜/透明度
+    （连同其所在坐标系）；路径按子路径拆开并变换到根坐标系，用于比较优化前后的渲染结果
+    """
+    root = parse(source).getroot()
+    ids = {e.get('id'): e for e in root.iter() if e.get('id')}
+    records = []
+
+    def prop(attrs, style, key):
+        return style.get(key, attrs.get(key))
+
+    def paint_of(inherit, attrs, ctm):
+        paint = []
+        for key in PAINT_PROPS:
+            value = inherit.get(key)
+            if key == 'stroke-width':
+                if inherit.get('stroke', 'none') == 'none':
+                    continue
+                width = float((_NUMBER_RE.match(value or '1') or _NUMBER_RE.match('1')).group())
+                scale = uniform_scale(ctm)
+                value = round(width * scale, 3) if scale is not None else (width, _matrix_key(ctm)[:4])
+            elif value is not None:
+                value = _canonical_value(key, value, ids)
+            paint.append((key, value))
+        for key in OWN_ATTRS:
+            value = prop(attrs, parse_style(attrs), key)
+            if value is not None:
+                paint.append((key, _canonical_value(key, value, ids)))
+        return tuple(paint)
+
+    def walk(elem, ctm, inherit, context):
+        name = local_name(elem.tag)
+        if name in NON_RENDERED or name == 'metadata' or (
+                elem.tag.startswith('{') and elem.tag[1:].split('}', 1)[0] in EDITOR_NS):
+            return
+        attrs = dict(elem.attrib)
+        style = parse_style(attrs)
+        if 'transform' in attrs:
+            own = parse_transform(attrs['transform'])
+            if own is None:
+                context = context + (('transform', attrs['transform'], _matrix_key(ctm)),)
+            else:
+                ctm = multiply(ctm, own)
+        inherit = dict(inherit)
+        inherit.setdefault('fill', '#000')
+        for key in PAINT_PROPS:
+            value = prop(attrs, style, key)
+            if value is not None:
+                inherit[key] = value
+        for key in CONTEXT_ATTRS:
+            value = prop(attrs, style, key)
+            if value is not None:
+                context = context + ((key, _canonical_value(key, value, ids), _matrix_key(ctm)),)
+
+        if name not in SHAPES:
+            for child in elem:
+                walk(child, ctm, inherit, context)
+            return
+        key = (name, paint_of(inherit, attrs, ctm), context)
+        segments = parse_path(attrs.get('d', '')) if name == 'path' else None
+        if segments is None:
+            geometry = tuple(sorted((k, _canonical_value(k, v, ids)) for k, v in attrs.items()
+                                    if local_name(k) not in PAINT_PROPS + CONTEXT_ATTRS + OWN_ATTRS
+                                    + ('transform', 'style', 'id')))
+            text = ''.join(elem.itertext()) if name == 'text' else ''
+            records.append((key, (_matrix_key(ctm), geometry, text)))
+            return
+        subpaths, subpath = [], []
+        for cmd, values in transform_segments(segments, ctm):
+            if cmd == 'M' and subpath:
+                subpaths.append(tuple(subpath))
+                subpath = []
+            subpath.append((cmd, tuple(values)))
+        if subpath:
+            subpaths.append(tuple(subpath))
+        # 半透明的路径整体合成一次，子路径的重叠处只绘制一次，不能和分开的路径等同
+        if any(is_translucent(k, inherit.get(k)) for k in ALPHA_PROPS[:4]) \
+                or is_translucent('opacity', prop(attrs, style, 'opacity')):
+            records.append((key, ('composite', tuple(sorted(subpaths)))))
+        else:
+            records.extend((key, s) for s in subpaths)
+
+    walk(root, IDENTITY, {}, ())
+    return records
+
+
+def _close(a, b, tolerance):
+    if isinstance(a, (int, float)) and isinstance(b, (int, float)):
+        return abs(a - b) <= tolerance
+    if isinstance(a, tuple) and isinstance(b, tuple):
+        return len(a) == len(b) and all(_close(x, y, tolerance) for x, y in zip(a, b))
+    return a == b
+
+
+def compare_drawings(before, after, tolerance=GEOMETRY_TOLERANCE):
+    """比较两个绘制列表（不比较绘制顺序），返回差异说明列表，为空表示渲染等价"""
+    remaining = list(after)
+    problems = []
+    for key, geometry in before:
+        for i, (other_key, other_geometry) in enumerate(remaining):
+            if other_key == key and _close(geometry, other_geometry, tolerance):
+                del remaining[i]
+                break
+        else:
+            problems.append(f"缺少: {key!r} {geometry!r}"[:300])
+    problems += [f"多出: {key!r} {geometry!r}"[:300] for key, geometry in remaining]
+    return problems
+
+
+def verify_optimization(data, precision=DEFAULT_PRECISION):
+    """优化 data（SVG字节串），返回 (优化结果文本, 优化前后绘制列表的差异)"""
+    out = io.StringIO()
+    optimize_svg_stream(io.BytesIO(data), out, precision)
+    result = out.getvalue()
+    return result, compare_drawings(drawing_list(io.BytesIO(data)),
+                                    drawing_list(io.BytesIO(result.encode('utf-8'))))
+
+
+def selfcheck(precision=DEFAULT_PRECISION, verbose=False):
+    """对 SELFCHECK_CASES 逐个检查优化前后渲染等价，返回失败数"""
+    failed = 0
+    for name, body in SELFCHECK_CASES:
+        data = (f'<svg xmlns="{SVG_NS}" xmlns:xlink="{XLINK_NS}" width="100" height="100">'
+                f'{body}</svg>').encode('utf-8')
+        result, problems = verify_optimization(data, precision)
+        print(f"{'✓' if not problems else '❌'} {name}")
+        if problems or verbose:
+            print(f"   {result.strip().splitlines()[-1]}")
+        for problem in problems:
+            print(f"   {problem}")
+        failed += bool(problems)
+    return failed
+
+
+def format_report(name, stats):
+    saved = 1 - stats['bytes_out'] / stats['bytes_in'] if stats['bytes_in'] else 0
+    throughput = stats['bytes_in'] / 1024 / 1024 / stats['seconds'] if stats['seconds'] else 0
+    return (f"{name}: {stats['bytes_in'] / 1024:.1f} KB -> {stats['bytes_out'] / 1024:.1f} KB "
+            f"(-{saved:.0%}), 元素 {stats['elements_in']} -> {stats['elements_out']}, "
+            f"合并路径 {stats['paths_merged']}, 折叠分组 {stats['groups_collapsed']}, "
+            f"重复定义 {stats['defs_deduped']}, {throughput:.1f} MB/s")
+
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description="SVG 流式优化")
+    parser.add_argument('inputs', nargs='*', help="SVG文件或目录")
+    parser.add_argument('-o', '--output', help="输出文件（只有一个输入文件时可用，默认原地替换）")
+    parser.add_argument('--precision', type=int, default=DEFAULT_PRECISION,
+                        help="坐标保留的小数位数")
+    parser.add_argument('--selfcheck', action='store_true',
+                        help="用内置的分组/描边/变换/裁剪/文本用例检查优化前后渲染等价，失败时返回1")
+    parser.add_argument('-v', '--verbose', action='store_true', help="自检时输出优化结果")
+    args = parser.parse_args()
+
+    if args.selfcheck:
+        failed = selfcheck(args.precision, args.verbose)
+        print(f"\n{'✓ 全部等价' if not failed else f'❌ {failed} 个用例不等价'}")
+        return 1 if failed else 0
+    if not args.inputs:
+        parser.error("需要SVG文件或目录（或 --selfcheck）")
+
+    files = []
+    for item in args.inputs:
+        path = Path(item)
+        files.extend(sorted(path.rglob('*.svg')) if path.is_dir() else [path])
+    if args.output and len(files) != 1:
+        print("❌ -o 只能用于单个输入文件")
+        return 1
+
+    total_in = total_out = 0
+    elapsed = 0.0
+    failed = 0
+    for svg_file in files:
+        try:
+            stats = optimize_svg_file(svg_file, args.output, args.precision)
+        except (ParseError, OSError) as e:
+            print(f"❌ {svg_file}: {e}")
+            failed += 1
+            continue
+        print(format_report(svg_file.name, stats))
+        total_in += stats['bytes_in']
+        total_out += stats['bytes_out']
+        elapsed += stats['seconds']
+
+    if len(files) > 1 and total_in:
+        print("=" * 60)
+        print(f"合计: {total_in / 1024 / 1024:.1f} MB -> {total_out / 1024 / 1024:.1f} MB "
+              f"(-{1 - total_out / total_in:.0%}), {total_in / 1024 / 1024 / elapsed:.1f} MB/s")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,485 @@
+#!/usr/bin/env python3
+"""
+外部工具资源限制运行
+每个 Ghostscript/Inkscape 进程都在独立进程组中运行，并按预估的任务规模设置
+RLIMIT_CPU / RLIMIT_AS（Inkscape 只限制CPU）；超时、取消或异常时结束整个进程组。
+运行中的进程组按主机登记在 ~/.eps_converter/running/<主机名>/，reap_orphans() 可清理本机之前崩溃遗留的子进程
+（需要 /proc 核对进程身份，仅在Linux上清理）
+
+用法:
+    python tool_sandbox.py reap     清理遗留的子进程
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import signal
+import threading
+import subprocess
+from pathlib import Path
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+MB = 1024 * 1024
+MIN_MEMORY = 512 * MB         # 解释器本身、字体和共享库的地址空间
+MIN_CPU_SECONDS = 30
+DEFAULT_PAGE_INCHES = (8.5, 11)
+
+_BBOX_RE = re.compile(rb'%%BoundingBox:\s*(-?[\d.]+)\s+(-?[\d.]+)\s+(-?[\d.]+)\s+(-?[\d.]+)')
+
+
+def _host_name():
+    if hasattr(os, 'uname'):
+        return os.uname().nodename or 'localhost'
+    return os.environ.get('COMPUTERNAME', 'localhost')
+
+
+def registry_dir():
+    """本机的登记目录：主目录可能被多个节点共享（见 eps_work_queue），PID 只在本机有意义"""
+    return Path.home() / '.eps_converter' / 'running' / _host_name()
+
+
+def _physical_memory():
+    try:
+        return os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES')
+    except (ValueError, OSError, AttributeError):
+        return None
+
+
+def parse_bbox_inches(head):
+    """从文件开头的字节中解析 %%BoundingBox，返回 (宽, 高) 英寸"""
+    match = _BBOX_RE.search(head)
+    if not match:
+        return DEFAULT_PAGE_INCHES
+    x0, y0, x1, y1 = (float(v) for v in match.groups())
+    return max(abs(x1 - x0), 1) / 72, max(abs(y1 - y0), 1) / 72
+
+
+def read_bbox_inches(eps_file):
+    """从文件头读取 %%BoundingBox，返回 (宽, 高) 英寸"""
+    try:
+        with open(eps_file, 'rb') as f:
+            head = f.read(64 * 1024)
+    except OSError:
+        return DEFAULT_PAGE_INCHES
+    return parse_bbox_inches(head)
+
+
+def estimate_limits(file_size, dpi=None, bbox_inches=DEFAULT_PAGE_INCHES,
+                    bytes_per_pixel=3, timeout=180):
+    """按页面面积、DPI 和文件大小预估资源上限
+
+    光栅输出按整页位图大小的两倍留余量；矢量输出（dpi=None）按文件大小估算。
+    内存上限不超过物理内存的75%，CPU上限不超过超时时间
+    """
+    if dpi:
+        width, height = bbox_inches
+        pixels = (width * dpi) * (height * dpi)
+        memory = MIN_MEMORY + int(pixels * bytes_per_pixel * 2) + file_size * 4
+        cpu = MIN_CPU_SECONDS + pixels / 5e6 + file_size / MB
+    else:
+        memory = MIN_MEMORY + file_size * 20
+        cpu = MIN_CPU_SECONDS + file_size / MB * 2
+
+    physical = _physical_memory()
+    if physical:
+        memory = min(memory, int(physical * 0.75))
+    return {'cpu_seconds': int(min(cpu * 2, timeout)), 'memory_bytes': int(memory)}
+
+
+def predict_limits(eps_file, dpi=None, bytes_per_pixel=3, timeout=180, cap_memory=True):
+    """按EPS文件预估资源上限，见 estimate_limits
+
+    cap_memory=False 时只限制CPU：Inkscape 是多线程的GTK程序，线程栈和malloc arena
+    占用的虚拟地址空间与文件大小无关，RLIMIT_AS 按Ghostscript估算会让它内存分配失败
+    """
+    try:
+        file_size = os.path.getsize(eps_file)
+    except OSError:
+        file_size = 0
+    bbox = read_bbox_inches(eps_file) if dpi else DEFAULT_PAGE_INCHES
+    limits = estimate_limits(file_size, dpi, bbox, bytes_per_pixel, timeout)
+    if not cap_memory:
+        del limits['memory_bytes']
+    return limits
+
+
+# ---------------------------------------------------------------- 进程组与限制
+
+def _set_rlimits(limits):
+    if limits.get('cpu_seconds'):
+        cpu = limits['cpu_seconds']
+        resource.setrlimit(resource.RLIMIT_CPU, (cpu, cpu + 5))
+    if limits.get('memory_bytes'):
+        mem = limits['memory_bytes']
+        resource.setrlimit(resource.RLIMIT_AS, (mem, mem))
+
+
+def _apply_prlimit(pid, limits):
+    """Linux: 启动后立即对子进程设置限制，避免在多线程程序中使用 preexec_fn"""
+    try:
+        if limits.get('cpu_seconds'):
+            cpu = limits['cpu_seconds']
+            resource.prlimit(pid, resource.RLIMIT_CPU, (cpu, cpu + 5))
+        if limits.get('memory_bytes'):
+            mem = limits['memory_bytes']
+            resource.prlimit(pid, resource.RLIMIT_AS, (mem, mem))
+    except (ProcessLookupError, PermissionError, OSError):
+        pass
+
+
+def _apply_priority(pid, limits):
+    """limits['nice'] 为正数时降低子进程的调度优先级（在本进程 nice 值的基础上增加）"""
+    nice = limits.get('nice')
+    if not nice or not hasattr(os, 'setpriority'):
+        return
+    try:
+        current = os.getpriority(os.PRIO_PROCESS, 0)
+        os.setpriority(os.PRIO_PROCESS, pid, min(19, current + nice))
+    except (ProcessLookupError, PermissionError, OSError):
+        pass
+
+
+def spawn_kwargs(limits=None):
+    """Popen/create_subprocess_exec 的进程组参数；非Linux的POSIX系统在exec前设置限制"""
+    if os.name == 'nt':
+        flags = subprocess.CREATE_NEW_PROCESS_GROUP
+        if limits and limits.get('nice'):
+            flags |= subprocess.BELOW_NORMAL_PRIORITY_CLASS
+        return {'creationflags': flags}
+    kwargs = {'start_new_session': True}
+    if limits and resource is not None and not hasattr(resource, 'prlimit'):
+        kwargs['preexec_fn'] = lambda: _set_rlimits(limits)
+    return kwargs
+
+
+def after_spawn(pid, cmd, limits=None):
+    """子进程启动后：Linux上设置限制、按需降低优先级，并登记进程组"""
+    if limits and resource is not None and hasattr(resource, 'prlimit'):
+        _apply_prlimit(pid, limits)
+    if limits:
+        _apply_priority(pid, limits)
+    register_group(pid, cmd)
+    _notify_spawn(pid, True)
+
+
+def kill_group(pid):
+    """结束整个进程组（Windows上结束进程树）"""
+    try:
+        if os.name == 'nt':
+            subprocess.run(['taskkill', '/T', '/F', '/PID', str(pid)],
+                           capture_output=True, timeout=10)
+        else:
+            os.killpg(pid, signal.SIGKILL)
+    except (ProcessLookupError, PermissionError, OSError, subprocess.SubprocessError):
+        pass
+
+
+# ---------------------------------------------------------------- 暂停/恢复
+
+_spawn_hooks = threading.local()
+_paused = {}        # pgid -> [本次暂停开始时间或None, 累计暂停秒数]
+_paused_lock = threading.Lock()
+
+
+def watch_spawns(callback):
+    """为当前线程登记回调：进程组启动后调用 callback(pid, True)，结束时 callback(pid, False)；传None取消"""
+    _spawn_hooks.callback = callback
+
+
+def _notify_spawn(pid, started):
+    callback = getattr(_spawn_hooks, 'callback', None)
+    if callback is not None:
+        callback(pid, started)
+
+
+def suspend_group(pid):
+    """暂停整个进程组（SIGSTOP），成功时返回True；Windows上不支持，返回False"""
+    if os.name == 'nt':
+        return False
+    try:
+        os.killpg(pid, signal.SIGSTOP)
+    except OSError:
+        return False
+    with _paused_lock:
+        entry = _paused.setdefault(pid, [None, 0.0])
+        if entry[0] is None:
+            entry[0] = time.monotonic()
+    return True
+
+
+def resume_group(pid):
+    """恢复被 suspend_group 暂停的进程组（SIGCONT）"""
+    with _paused_lock:
+        entry = _paused.get(pid)
+        if entry and entry[0] is not None:
+            entry[1] += time.monotonic() - entry[0]
+            entry[0] = None
+    if os.name == 'nt':
+        return False
+    try:
+        os.killpg(pid, signal.SIGCONT)
+    except OSError:
+        return False
+    return True
+
+
+def paused_seconds(pid):
+    """进程组累计被暂停的秒数；run_limited/run_streaming 的超时不计入暂停的时间"""
+    with _paused_lock:
+        entry = _paused.get(pid)
+        if not entry:
+            return 0.0
+        return entry[1] + (time.monotonic() - entry[0] if entry[0] is not None else 0.0)
+
+
+def run_limited(cmd, timeout, limits=None, check=False, input=None,
+                text=True, encoding='utf-8', errors='ignore'):
+    """带资源限制运行命令，行为与 subprocess.run(capture_output=True) 一致
+
+    超时或被中断（Ctrl-C）时先结束整个进程组再抛出异常；
+    正常结束后也会清理进程组里残留的孙进程
+    """
+    if not text:
+        encoding = errors = None
+    proc = subprocess.Popen(
+        cmd,
+        stdin=subprocess.PIPE if input is not None else subprocess.DEVNULL,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        text=text, encoding=encoding, errors=errors,
+        **spawn_kwargs(limits))
+    try:
+        after_spawn(proc.pid, cmd, limits)
+        deadline = time.monotonic() + timeout
+        credited = 0.0
+        try:
+            while True:
+                try:
+                    stdout, stderr = proc.communicate(
+                        input, timeout=max(deadline - time.monotonic(), 0.1))
+                    break
+                except subprocess.TimeoutExpired:
+                    paused = paused_seconds(proc.pid)
+                    if paused <= credited:
+                        raise
+                    deadline += paused - credited  # 被暂停的时间顺延
+                    credited = paused
+        except subprocess.TimeoutExpired:
+            kill_group(proc.pid)
+            stdout, stderr = proc.communicate()
+            raise subprocess.TimeoutExpired(cmd, timeout, output=stdout, stderr=stderr)
+        except BaseException:
+            kill_group(proc.pid)
+            proc.wait()
+            raise
+    finally:
+        if os.name != 'nt':
+            kill_group(proc.pid)
+        unregister_group(proc.pid)
+
+    if check and proc.returncode:
+        raise subprocess.CalledProcessError(proc.returncode, cmd, stdout, stderr)
+    return subprocess.CompletedProcess(cmd, proc.returncode, stdout, stderr)
+
+
+def run_streaming(cmd, chunks, sink, timeout, limits=None, check=False,
+                  chunk_size=1024 * 1024, stderr_limit=64 * 1024):
+    """带资源限制运行命令，stdin/stdout 以固定大小的块流式传输
+
+    chunks 为写入stdin的字节块迭代器，stdout 逐块写入 sink（可写的二进制文件对象）；
+    内存占用与输入输出大小无关，stderr 只保留最后 stderr_limit 字节。
+    返回 CompletedProcess（stdout 为写入的字节数）
+    """
+    proc = subprocess.Popen(cmd, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                            stderr=subprocess.PIPE, **spawn_kwargs(limits))
+    stderr_tail = bytearray()
+    timed_out = threading.Event()
+
+    def feed():
+        try:
+            for chunk in chunks:
+                proc.stdin.write(chunk)
+        except (BrokenPipeError, OSError):
+            pass  # 工具提前退出，以返回码为准
+        finally:
+            try:
+                proc.stdin.close()
+            except OSError:
+                pass
+
+    def drain_stderr():
+        for line in proc.stderr:
+            stderr_tail.extend(line)
+            del stderr_tail[:-stderr_limit]
+
+    timers = []
+    timer_lock = threading.Lock()
+    credited = [0.0]
+
+    def arm(delay):
+        with timer_lock:
+            if timers is not None:
+                timers.append(threading.Timer(delay, on_timeout))
+                timers[-1].start()
+
+    def on_timeout():
+        paused = paused_seconds(proc.pid)
+        if paused > credited[0]:
+            arm(paused - credited[0])  # 被暂停的时间顺延
+            credited[0] = paused
+            return
+        timed_out.set()
+        kill_group(proc.pid)
+
+    written = 0
+    threads = [threading.Thread(target=feed, daemon=True),
+               threading.Thread(target=drain_stderr, daemon=True)]
+    try:
+        after_spawn(proc.pid, cmd, limits)
+        for t in threads:
+            t.start()
+        arm(timeout)
+        for chunk in iter(lambda: proc.stdout.read(chunk_size), b''):
+            sink.write(chunk)
+            written += len(chunk)
+        proc.wait()
+    except BaseException:
+        kill_group(proc.pid)
+        proc.wait()
+        raise
+    finally:
+        with timer_lock:
+            for t in timers:
+                t.cancel()
+            timers = None
+        if os.name != 'nt':
+            kill_group(proc.pid)
+        for t in threads:
+            t.join()
+        proc.stdout.close()
+        proc.stderr.close()
+        unregister_group(proc.pid)
+
+    stderr = stderr_tail.decode('utf-8', 'ignore')
+    if timed_out.is_set():
+        raise subprocess.TimeoutExpired(cmd, timeout, stderr=stderr)
+    if check and proc.returncode:
+        raise subprocess.CalledProcessError(proc.returncode, cmd, written, stderr)
+    return subprocess.CompletedProcess(cmd, proc.returncode, written, stderr)
+
+
+# ---------------------------------------------------------------- 遗留进程清理
+
+def _process_identity(pid):
+    """进程身份（/proc 中的启动时间），用于排除PID被复用的情况；非Linux返回None"""
+    try:
+        fields = Path(f'/proc/{pid}/stat').read_text().rsplit(')', 1)[1].split()
+        return f"start:{fields[19]}"
+    except (OSError, IndexError):
+        return None
+
+
+_owner_id = None
+
+
+def _owner_identity():
+    global _owner_id
+    if _owner_id is None:
+        _owner_id = _process_identity(os.getpid()) or ''
+    return _owner_id or None
+
+
+def register_group(pid, cmd):
+    try:
+        directory = registry_dir()
+        directory.mkdir(parents=True, exist_ok=True)
+        entry = {'pgid': pid, 'owner': os.getpid(), 'owner_id': _owner_identity(),
+                 'id': _process_identity(pid), 'cmd': [str(c) for c in cmd[:3]]}
+        (directory / f"{pid}.json").write_text(json.dumps(entry), encoding='utf-8')
+    except OSError:
+        pass
+
+
+def unregister_group(pid):
+    _notify_spawn(pid, False)
+    with _paused_lock:
+        _paused.pop(pid, None)
+    try:
+        (registry_dir() / f"{pid}.json").unlink()
+    except OSError:
+        pass
+
+
+def _alive(pid, identity):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return identity is None or _process_identity(pid) == identity
+
+
+def _group_members(pgid, since=None):
+    """Linux: 找出仍属于该会话/进程组的进程（领头进程已退出时的孙进程）"""
+    members = []
+    for stat_file in Path('/proc').glob('[0-9]*/stat'):
+        try:
+            fields = stat_file.read_text().rsplit(')', 1)[1].split()
+        except (OSError, IndexError):
+            continue
+        pgrp, session, start = int(fields[2]), int(fields[3]), int(fields[19])
+        # 启动时间早于登记时间的进程不可能是我们派生的（PID复用）
+        if pgrp == pgid and session == pgid and (since is None or start >= since):
+            members.append(int(stat_file.parent.name))
+    return members
+
+
+def reap_orphans(verbose=True):
+    """结束登记在册、但其父程序已退出的进程组，返回清理数量"""
+    directory = registry_dir()
+    if not Path('/proc/self/stat').exists() or not directory.exists():
+        return 0
+    reaped = 0
+    for entry_file in directory.glob('*.json'):
+        try:
+            entry = json.loads(entry_file.read_text(encoding='utf-8'))
+        except (OSError, ValueError):
+            entry_file.unlink()
+            continue
+        if _alive(entry['owner'], entry.get('owner_id')):
+            continue  # 父程序还在运行
+        leader_alive = entry.get('id') and _alive(entry['pgid'], entry['id'])
+        since = None
+        if (entry.get('id') or '').startswith('start:'):
+            since = int(entry['id'].split(':', 1)[1])
+        leftovers = [] if leader_alive or since is None else _group_members(entry['pgid'], since)
+        if leader_alive or leftovers:
+            kill_group(entry['pgid'])
+            reaped += 1
+            if verbose:
+                print(f"🧹 已清理遗留进程组 {entry['pgid']}: {' '.join(entry['cmd'])}")
+        try:
+            entry_file.unlink()
+        except OSError:
+            pass
+    return reaped
+
+
+def main():
+    if len(sys.argv) > 1 and sys.argv[1] == 'reap':
+        count = reap_orphans()
+        print(f"✓ 清理了 {count} 个遗留进程组")
+        return 0
+    print(__doc__)
+    return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())